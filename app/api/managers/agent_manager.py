@@ -0,0 +1,272 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.agent_client import agent_clients, agent_base_url
+from app.core.database import MainSessionLocal
+from app.core.settings import settings
+from app.models.agent import Agent
+from app.models.task import Task
+
+logger = logging.getLogger(__name__)
+
+class AgentStatus:
+    UP = "up"
+    DOWN = "down"
+    UNKNOWN = "unknown"
+
+@dataclass
+class AgentHealth:
+    status: str
+    checked_at: datetime
+    last_heartbeat: Optional[datetime] = None
+    load: Optional[float] = None
+    running_tasks: Optional[List[str]] = None
+    version: Optional[str] = None
+
+# Cached health per normalised agent URL, maintained by heartbeats and the AgentMonitor.
+# Readers never probe agents themselves.
+agent_health: Dict[str, AgentHealth] = {}
+
+def get_agent_health(host_url: str) -> Optional[AgentHealth]:
+    """Get the cached health for an agent host, if known"""
+    return agent_health.get(agent_base_url(host_url))
+
+def get_agent_status(host_url: str) -> str:
+    """Get the cached status (up/down/unknown) for an agent host"""
+    health = get_agent_health(host_url)
+    return health.status if health else AgentStatus.UNKNOWN
+
+class AgentManager:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_agent(self, host_url: str) -> Optional[Agent]:
+        """Get an agent by its host URL"""
+        return self.db.query(Agent).filter(Agent.host_url == agent_base_url(host_url)).first()
+
+    def _get_or_create_agent(self, host_url: str) -> Agent:
+        agent = self.get_agent(host_url)
+        if not agent:
+            agent = Agent(host_url=agent_base_url(host_url), status=AgentStatus.UNKNOWN, failure_count=0)
+            self.db.add(agent)
+        return agent
+
+    def _cache(self, agent: Agent) -> None:
+        agent_health[agent.host_url] = AgentHealth(
+            status=agent.status,
+            checked_at=agent.last_checked or datetime.now(),
+            last_heartbeat=agent.last_heartbeat,
+            load=agent.load,
+            running_tasks=json.loads(agent.running_tasks) if agent.running_tasks else [],
+            version=agent.version
+        )
+
+    def record_heartbeat(
+        self,
+        host_url: str,
+        name: str = None,
+        version: str = None,
+        load: float = None,
+        running_tasks: List[str] = None,
+        groups: List[str] = None
+    ) -> Agent:
+        """Record a heartbeat from an agent, registering it if it is new.
+
+        Args:
+            host_url: URL the agent is reachable on
+            name: Display name of the agent
+            version: Agent software version
+            load: Current load average of the agent host
+            running_tasks: IDs of tasks currently running on the agent
+            groups: Host groups the agent declares itself a member of
+
+        Returns:
+            Agent: The updated agent
+        """
+        agent = self._get_or_create_agent(host_url)
+        now = datetime.now()
+        agent.name = name or agent.name
+        agent.version = version
+        agent.load = load
+        agent.running_tasks = json.dumps(running_tasks or [])
+        if groups is not None:
+            agent.groups = ",".join(sorted(set(groups)))
+        agent.status = AgentStatus.UP
+        agent.failure_count = 0
+        agent.last_heartbeat = now
+        agent.last_checked = now
+        self.db.commit()
+        self._cache(agent)
+        return agent
+
+    def record_probe(self, host_url: str, healthy: bool) -> Agent:
+        """Record the result of a health probe against an agent"""
+        agent = self._apply_probe(host_url, healthy)
+        self.db.commit()
+        self._cache(agent)
+        return agent
+
+    def record_probes(self, results: Dict[str, bool]) -> None:
+        """Record the results of health probes against many agents, in one commit"""
+        agents = [self._apply_probe(host_url, healthy) for host_url, healthy in results.items()]
+        self.db.commit()
+        for agent in agents:
+            self._cache(agent)
+
+    def _apply_probe(self, host_url: str, healthy: bool) -> Agent:
+        agent = self._get_or_create_agent(host_url)
+        agent.last_checked = datetime.now()
+        if healthy:
+            agent.status = AgentStatus.UP
+            agent.failure_count = 0
+        else:
+            agent.failure_count = (agent.failure_count or 0) + 1
+            if agent.failure_count >= settings.AGENTS.DOWN_AFTER_FAILURES:
+                if agent.status != AgentStatus.DOWN:
+                    logger.warning(f"Agent {agent.host_url} is down")
+                agent.status = AgentStatus.DOWN
+        return agent
+
+    def known_hosts(self) -> List[str]:
+        """All agent hosts: registered agents plus host URLs of external tasks"""
+        hosts = {agent.host_url for agent in self.db.query(Agent).all()}
+        for (host_url,) in self.db.query(Task.host_url).filter(Task.host_url.isnot(None)).all():
+            if host_url:
+                hosts.add(agent_base_url(host_url))
+        return sorted(hosts)
+
+    def resolve_host_group(self, group: str) -> List[str]:
+        """Resolve a host group to agent URLs.
+
+        Members come from HOST_GROUPS in the tasks file plus any registered agent
+        that declares the group in its heartbeat.
+
+        Args:
+            group: Name of the host group
+
+        Returns:
+            List[str]: Normalised agent URLs, sorted
+        """
+        hosts = {agent_base_url(host_url) for host_url in settings.HOST_GROUPS.get(group, [])}
+        for agent in self.db.query(Agent).filter(Agent.groups.isnot(None)).all():
+            if group in agent.groups.split(","):
+                hosts.add(agent.host_url)
+        return sorted(hosts)
+
+    def heartbeat_is_fresh(self, agent: Optional[Agent]) -> bool:
+        """Check whether an agent has sent a heartbeat within the heartbeat timeout"""
+        if not agent or not agent.last_heartbeat:
+            return False
+        return datetime.now() - agent.last_heartbeat < timedelta(seconds=settings.AGENTS.HEARTBEAT_TIMEOUT)
+
+    def load_cache(self) -> None:
+        """Seed the health cache from the database, e.g. after a restart"""
+        for agent in self.db.query(Agent).all():
+            if agent.status == AgentStatus.UP and not self.heartbeat_is_fresh(agent):
+                agent.status = AgentStatus.UNKNOWN
+            self._cache(agent)
+
+    def list_agents(self) -> List[Dict]:
+        """List all registered agents"""
+        return [
+            {
+                "host_url": agent.host_url,
+                "name": agent.name,
+                "version": agent.version,
+                "status": agent.status,
+                "load": agent.load,
+                "running_tasks": json.loads(agent.running_tasks) if agent.running_tasks else [],
+                "groups": agent.groups.split(",") if agent.groups else [],
+                "last_heartbeat": agent.get_formatted_last_heartbeat()
+            }
+            for agent in self.db.query(Agent).order_by(Agent.host_url).all()
+        ]
+
+class AgentMonitor:
+    """Background poller that keeps the agent health cache current.
+
+    Agents with a fresh heartbeat are trusted without probing; the rest are
+    probed on their /api/health endpoint, concurrently, once per poll interval.
+    """
+
+    def __init__(self) -> None:
+        self._task: Optional[asyncio.Task] = None
+
+    async def _probe(self, host_url: str) -> bool:
+        try:
+            response = await agent_clients.get(host_url, "/api/health", timeout=settings.AGENTS.CONNECT_TIMEOUT)
+            return response.is_success
+        except Exception:
+            return False
+
+    async def poll_once(self) -> None:
+        """Refresh the cached health of every known agent
+
+        Only the probes run on the event loop; the database is read and
+        written in the threadpool.
+        """
+        stale_hosts = await run_in_threadpool(self._stale_hosts)
+        results = await asyncio.gather(*(self._probe(host_url) for host_url in stale_hosts))
+        if stale_hosts:
+            await run_in_threadpool(self._record_probes, dict(zip(stale_hosts, results)))
+
+    @staticmethod
+    def _stale_hosts() -> List[str]:
+        """Cache the health of agents with a fresh heartbeat, returning the hosts to probe"""
+        db = MainSessionLocal()
+        try:
+            agent_manager = AgentManager(db)
+            stale_hosts = []
+            for host_url in agent_manager.known_hosts():
+                agent = agent_manager.get_agent(host_url)
+                if agent_manager.heartbeat_is_fresh(agent):
+                    agent_manager._cache(agent)
+                else:
+                    stale_hosts.append(host_url)
+            return stale_hosts
+        finally:
+            db.close()
+
+    @staticmethod
+    def _record_probes(results: Dict[str, bool]) -> None:
+        db = MainSessionLocal()
+        try:
+            AgentManager(db).record_probes(results)
+        finally:
+            db.close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"Error polling agents: {str(e)}", exc_info=True)
+            await asyncio.sleep(settings.AGENTS.POLL_INTERVAL)
+
+    def start(self) -> None:
+        """Load cached state and start polling in the background"""
+        db = MainSessionLocal()
+        try:
+            AgentManager(db).load_cache()
+        finally:
+            db.close()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop polling"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+agent_monitor = AgentMonitor()
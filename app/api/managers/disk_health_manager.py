@@ -0,0 +1,290 @@
+import logging
+import os
+import threading
+import time
+from datetime import UTC, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import DateTime, delete, func, literal, select
+from sqlalchemy.orm import Session
+
+from app.core.settings import settings
+from app.models.disk_stats import DiskSample, StorageSample
+from app.utils.disk_utils import (
+    SLEEPING_STATES, block_device_info, disk_for_path, disk_power_state, read_diskstats, smart_info
+)
+
+logger = logging.getLogger(__name__)
+
+# One collection at a time, whether from the API or the scheduler
+_collect_lock = threading.Lock()
+
+# Columns a sample of a sleeping disk copies from the disk's previous sample
+SMART_COLUMNS = [
+    "model", "serial", "smart_passed", "temperature", "power_on_hours", "reallocated_sectors", "pending_sectors",
+    "smart_at"
+]
+
+# Capacity trends fitted to less history than this are not forecast
+FORECAST_MIN_DAYS = 1.0
+
+
+class DiskHealthManager:
+    """Samples the capacity of the MEDIA_DATA storages and the I/O and SMART health of their disks
+
+    A collection never spins a disk up: power states are checked with hdparm
+    first, sleeping disks keep their last SMART data and their storages aren't
+    sampled (nothing was written to them), and smartctl is run with -n standby
+    in case a disk fell asleep since. Reading the status only reads the latest
+    samples, so the disk manager page never waits for a disk.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def collect(self) -> Dict[str, Any]:
+        """Sample every storage and disk, and delete samples older than DISK_HEALTH.RETENTION_DAYS
+
+        Returns:
+            Dict[str, Any]: Storages sampled and skipped, disks sampled, SMART data
+                read and reused, unhealthy disks, samples pruned and the time in seconds
+        """
+        with _collect_lock:
+            started = time.perf_counter()
+            now = datetime.now(UTC)
+            storages = self._storages()
+            storage_disks = {name: disk_for_path(path) for name, path in storages.items()}
+            disks = list(dict.fromkeys(
+                [disk for disk in storage_disks.values() if disk] + settings.DISK_HEALTH.DISKS
+            ))
+            states = {disk: disk_power_state(disk) for disk in disks}
+            counts = {"smart_read": 0, "smart_cached": 0, "storages_failed": 0}
+
+            diskstats = read_diskstats()
+            previous = {sample.disk: sample for sample in self._latest_disk_samples()}
+            samples = [self._disk_sample(disk, states[disk], now, diskstats, previous.get(disk), counts) for disk in disks]
+            self.db.add_all(samples)
+
+            sampled, skipped = 0, 0
+            for name, path in storages.items():
+                disk = storage_disks[name]
+                if disk and states[disk] in SLEEPING_STATES:
+                    skipped += 1
+                    continue
+                try:
+                    stat = os.statvfs(path)
+                except OSError as e:
+                    logger.warning(f"Could not sample storage {name} at {path}: {str(e)}")
+                    counts["storages_failed"] += 1
+                    continue
+                self.db.add(StorageSample(
+                    storage=name,
+                    path=path,
+                    disk=disk,
+                    total_bytes=stat.f_blocks * stat.f_frsize,
+                    used_bytes=(stat.f_blocks - stat.f_bfree) * stat.f_frsize,
+                    free_bytes=stat.f_bavail * stat.f_frsize,
+                    timestamp=now
+                ))
+                sampled += 1
+
+            cutoff = now - timedelta(days=settings.DISK_HEALTH.RETENTION_DAYS)
+            pruned = 0
+            for model in (StorageSample, DiskSample):
+                # Old samples are never loaded in the session, so it needn't be searched for them
+                pruned += self.db.execute(
+                    delete(model).where(model.timestamp < cutoff).execution_options(synchronize_session=False)
+                ).rowcount
+            self.db.commit()
+
+            result = {
+                "storages_sampled": sampled,
+                "storages_skipped_asleep": skipped,
+                "storages_failed": counts["storages_failed"],
+                "disks_sampled": len(samples),
+                "disks_asleep": sum(1 for disk in disks if states[disk] in SLEEPING_STATES),
+                "smart_read": counts["smart_read"],
+                "smart_cached": counts["smart_cached"],
+                "disks_unhealthy": [sample.disk for sample in samples if self._health(sample) in ("failing", "warning")],
+                "samples_pruned": pruned,
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+            logger.info(f"Disk health collection completed: {result}")
+            return result
+
+    def status(self) -> Dict[str, Any]:
+        """Latest sample of every storage and disk, with each storage's capacity forecast
+
+        Only reads the samples table; nothing is asked of the disks.
+        """
+        storages = []
+        for name in self._storages():
+            sample = self.db.scalars(
+                select(StorageSample).where(StorageSample.storage == name).order_by(StorageSample.timestamp.desc()).limit(1)
+            ).first()
+            if sample:
+                storages.append(sample)
+        forecasts = self.forecasts([sample.storage for sample in storages])
+        disks = self._latest_disk_samples()
+        storage_names = {}
+        for sample in storages:
+            storage_names.setdefault(sample.disk, []).append(sample.storage)
+
+        return {
+            "collected_at": max((sample.timestamp for sample in disks + storages), default=None),
+            "storages": [
+                {
+                    "name": sample.storage,
+                    "path": sample.path,
+                    "disk": sample.disk,
+                    "total_bytes": sample.total_bytes,
+                    "used_bytes": sample.used_bytes,
+                    "free_bytes": sample.free_bytes,
+                    "used_percent": round(100 * sample.used_bytes / sample.total_bytes, 1) if sample.total_bytes else None,
+                    "forecast": forecasts.get(sample.storage),
+                    "timestamp": sample.timestamp
+                }
+                for sample in storages
+            ],
+            "disks": [
+                {
+                    "disk": sample.disk,
+                    "storages": storage_names.get(sample.disk, []),
+                    "power_state": sample.power_state,
+                    "asleep": sample.power_state in SLEEPING_STATES,
+                    "rotational": sample.rotational,
+                    "size_bytes": sample.size_bytes,
+                    "read_rate": sample.read_rate,
+                    "write_rate": sample.write_rate,
+                    "busy_percent": sample.busy_percent,
+                    "health": self._health(sample),
+                    **{column: getattr(sample, column) for column in SMART_COLUMNS},
+                    "timestamp": sample.timestamp
+                }
+                for sample in disks
+            ]
+        }
+
+    def forecasts(self, storages: List[str], days: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Growth of the storages' used space and when they will be full, by least squares over their history
+
+        The sums are computed in SQL, so a forecast costs one grouped query
+        whatever the number of samples.
+
+        Args:
+            storages: Names of the storages to forecast
+            days: History to fit the trend to (defaults to DISK_HEALTH.FORECAST_DAYS)
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Per storage with enough history, the bytes used
+                per day and, if it is growing, the days until it is full and the date
+        """
+        now = datetime.now(UTC)
+        cutoff = now - timedelta(days=days or settings.DISK_HEALTH.FORECAST_DAYS)
+        # Days relative to the cutoff, so the squares stay small
+        x = func.julianday(StorageSample.timestamp) - func.julianday(literal(cutoff, DateTime))
+        y = StorageSample.used_bytes * 1.0
+        rows = self.db.execute(
+            select(
+                StorageSample.storage, func.count(), func.sum(x), func.sum(y), func.sum(x * x), func.sum(x * y),
+                func.max(x) - func.min(x)
+            )
+            .where(StorageSample.storage.in_(storages), StorageSample.timestamp >= cutoff)
+            .group_by(StorageSample.storage)
+        ).all()
+
+        forecasts = {}
+        for storage, n, sum_x, sum_y, sum_xx, sum_xy, span in rows:
+            denominator = n * sum_xx - sum_x * sum_x
+            if span < FORECAST_MIN_DAYS or denominator <= 0:
+                continue
+            bytes_per_day = (n * sum_xy - sum_x * sum_y) / denominator
+            latest = self.db.scalars(
+                select(StorageSample).where(StorageSample.storage == storage).order_by(StorageSample.timestamp.desc()).limit(1)
+            ).first()
+            days_until_full = latest.free_bytes / bytes_per_day if bytes_per_day > 0 else None
+            forecasts[storage] = {
+                "bytes_per_day": round(bytes_per_day),
+                "days_until_full": round(days_until_full, 1) if days_until_full is not None else None,
+                "full_at": (
+                    (latest.timestamp + timedelta(days=days_until_full)).date().isoformat()
+                    if days_until_full is not None and days_until_full < 36500 else None
+                ),
+                "history_days": round(span, 1),
+                "samples": n
+            }
+        return forecasts
+
+    def history(self, storage: str, days: int = 30) -> List[Dict[str, Any]]:
+        """Capacity samples of a storage over the last days, oldest first"""
+        cutoff = datetime.now(UTC) - timedelta(days=days)
+        rows = self.db.execute(
+            select(StorageSample.timestamp, StorageSample.total_bytes, StorageSample.used_bytes, StorageSample.free_bytes)
+            .where(StorageSample.storage == storage, StorageSample.timestamp >= cutoff)
+            .order_by(StorageSample.timestamp)
+        ).all()
+        return [
+            {"timestamp": timestamp, "total_bytes": total, "used_bytes": used, "free_bytes": free}
+            for timestamp, total, used, free in rows
+        ]
+
+    @staticmethod
+    def _storages() -> Dict[str, str]:
+        """Path of every MEDIA_DATA storage, by name"""
+        return {
+            name: config["path"]
+            for name, config in settings.MEDIA_DATA.get("storage", {}).items() if config.get("path")
+        }
+
+    def _latest_disk_samples(self) -> List[DiskSample]:
+        """Samples of the last collection; every collection samples every disk, asleep or not"""
+        latest = self.db.scalar(select(func.max(DiskSample.timestamp)))
+        if latest is None:
+            return []
+        return list(self.db.scalars(select(DiskSample).where(DiskSample.timestamp == latest).order_by(DiskSample.disk)))
+
+    @staticmethod
+    def _disk_sample(
+        disk: str, power_state: Optional[str], now: datetime, diskstats: Dict, previous: Optional[DiskSample],
+        counts: Dict[str, int]
+    ) -> DiskSample:
+        """A disk's sample, with I/O rates since its previous sample and SMART data read only if it is awake"""
+        sample = DiskSample(disk=disk, power_state=power_state, timestamp=now, **block_device_info(disk))
+
+        counters = diskstats.get(os.path.basename(disk))
+        if counters:
+            sample.read_bytes, sample.written_bytes, sample.io_ms = counters
+            if previous and previous.read_bytes is not None:
+                elapsed = (now - previous.timestamp.replace(tzinfo=UTC)).total_seconds()
+                deltas = (
+                    sample.read_bytes - previous.read_bytes, sample.written_bytes - previous.written_bytes,
+                    sample.io_ms - previous.io_ms
+                )
+                # Counters restart from zero when the machine reboots
+                if elapsed > 0 and min(deltas) >= 0:
+                    sample.read_rate = deltas[0] / elapsed
+                    sample.write_rate = deltas[1] / elapsed
+                    sample.busy_percent = min(100.0, deltas[2] / (elapsed * 10))
+
+        smart = None if power_state in SLEEPING_STATES else smart_info(disk, settings.DISK_HEALTH.SMARTCTL)
+        if smart is not None:
+            for column, value in smart.items():
+                setattr(sample, column, value)
+            sample.smart_at = now
+            counts["smart_read"] += 1
+        elif previous:
+            for column in SMART_COLUMNS:
+                setattr(sample, column, getattr(previous, column))
+            counts["smart_cached"] += previous.smart_at is not None
+        return sample
+
+    @staticmethod
+    def _health(sample: DiskSample) -> str:
+        """good, warning (bad sectors), failing (SMART verdict) or unknown"""
+        if sample.smart_passed is None:
+            return "unknown"
+        if not sample.smart_passed:
+            return "failing"
+        if (sample.reallocated_sectors or 0) > 0 or (sample.pending_sectors or 0) > 0:
+            return "warning"
+        return "good"
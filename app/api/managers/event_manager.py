@@ -1,29 +1,69 @@
+import hashlib
 import logging
-from pathlib import Path
-import json
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer
+from sqlalchemy.orm.attributes import flag_modified
+from app.core.settings import settings
 from app.models.event import Event
+from app.models.compression_dictionary import CompressionDictionary
+from app.models.event_stats import EventStatsDaily, EVENT_STATS_BACKFILL, EVENT_STATS_TRIGGERS
 from app.core.database import DBManager
+from app.core.metrics import EVENTS_INSERTED
 from app.schemas.event import EventFilter
 from app.utils.file_utils import get_attachment_data, AttachDataMimeType, MIME_TYPE_MAPPING
-from typing import List, Optional, Dict, Any
-from sqlalchemy import desc, asc
+from typing import List, Optional, Dict, Any, Tuple
+from sqlalchemy import desc, asc, insert, func, and_, or_, text
 from app.models.event_types import EventType, SubEventType
-from datetime import datetime
+from datetime import date, datetime
+from app.utils.time_utils import get_current_time
+from app.utils.attachment_utils import SpooledAttachment
+from app.utils.compression_utils import (
+    CODEC_IDENTITY, CODEC_ZSTD, ZSTD_AVAILABLE, ZSTD_FRAME_HEADER_MAX, active_dictionary_id, compress, decompress,
+    frame_dictionary_id, register_dictionary, resolve_codec, train_dictionary
+)
 
 logger = logging.getLogger(__name__)
 
+# Rows per INSERT when bulk-loading events
+EVENT_BATCH_SIZE = 1000
+
+# Attachments are cut into samples of this size to train compression dictionaries
+DICTIONARY_SAMPLE_SIZE = 4096
+MIN_DICTIONARY_SAMPLES = 100
+
+# Time buckets for event statistics, as expressions on event_stats_daily.day (YYYY-MM-DD)
+STATS_BUCKETS = {
+    "day": EventStatsDaily.day,
+    "week": func.date(EventStatsDaily.day, "weekday 0", "-6 days"),  # Monday of the week
+    "month": func.substr(EventStatsDaily.day, 1, 7),
+    "year": func.substr(EventStatsDaily.day, 1, 4),
+    "total": None
+}
+STATS_GROUP_FIELDS = ("type", "sub_type", "status")
+
+def _attachment_columns(attachment_data: Optional[bytes]) -> Dict[str, Any]:
+    """Attachment columns for in-memory data, compressed with the configured codec"""
+    if not attachment_data:
+        return {
+            "has_attachment": False,
+            "attachment_data": None,
+            "attachment_size": None,
+            "attachment_sha256": None,
+            "attachment_codec": None
+        }
+    codec = resolve_codec()
+    return {
+        "has_attachment": True,
+        "attachment_data": compress(attachment_data, codec),
+        "attachment_size": len(attachment_data),
+        "attachment_sha256": hashlib.sha256(attachment_data).hexdigest(),
+        "attachment_codec": codec
+    }
+
 class EventManager:
     def __init__(self, db: Session = None):
-        self.config = self._load_config()
         self.db_manager = DBManager(Event, db) if db else None
         self.db = db
 
-    def _load_config(self) -> dict:
-        config_path = Path("config.json")
-        with open(config_path) as f:
-            return json.load(f)
-
     def add_event_with_output(self, type: str, sub_type: str, status: str, description: str, details: str, attachment_data: bytes = None, attachment_mime_type: AttachDataMimeType = None, parent_id: int = None) -> Event:
         """Create a new event with binary attachment data
         
@@ -58,14 +98,132 @@ class EventManager:
                 status=status,
                 description=description,
                 details=details,
-                has_attachment=bool(attachment_data),
-                attachment_data=attachment_data,
                 attachment_mime_type=mime_type,
-                parent_id=parent_id
+                parent_id=parent_id,
+                **_attachment_columns(attachment_data)
             )
+            EVENTS_INSERTED.inc()
+
+        return event
+
+    def add_event_with_spooled_attachment(self, type: str, sub_type: str, status: str, description: str, details: str, attachment: SpooledAttachment, parent_id: int = None) -> Event:
+        """Create a new event, streaming a spooled attachment into its blob
+
+        The row is inserted with a zero-filled blob of the stored size, which is
+        then filled chunk by chunk through SQLite's incremental blob I/O within
+        the same transaction, so the attachment never has to fit in memory.
+
+        Args:
+            type: Event type
+            sub_type: Event sub-type
+            status: Event status
+            description: Event description
+            details: Event details
+            attachment: Attachment spooled by spool_attachment
+            parent_id: Optional parent event ID
+
+        Returns:
+            Event: Created event object (attachment_data is not loaded)
+        """
+        if not self.db:
+            return None
 
+        has_attachment = attachment.size > 0
+        event = Event(
+            type=type,
+            sub_type=sub_type,
+            status=status,
+            description=description,
+            details=details,
+            has_attachment=has_attachment,
+            attachment_data=func.zeroblob(attachment.stored_size) if has_attachment else None,
+            attachment_mime_type=attachment.mime_type if has_attachment else None,
+            attachment_size=attachment.size if has_attachment else None,
+            attachment_sha256=attachment.sha256 if has_attachment else None,
+            attachment_codec=attachment.codec if has_attachment else None,
+            parent_id=parent_id
+        )
+        try:
+            self.db.add(event)
+            self.db.flush()
+            if has_attachment:
+                sqlite_connection = self.db.connection().connection.driver_connection
+                with sqlite_connection.blobopen("events", "attachment_data", event.id) as blob:
+                    for chunk in attachment.iter_chunks():
+                        blob.write(chunk)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        EVENTS_INSERTED.inc()
         return event
 
+    def get_attachment_header(self, event_id: int) -> Tuple[int, bytes]:
+        """Stored size and leading bytes of an event's attachment, without loading the blob
+
+        Returns:
+            Tuple[int, bytes]: Stored (possibly compressed) size, and the first
+            ZSTD_FRAME_HEADER_MAX bytes
+        """
+        row = self.db.query(
+            func.length(Event.attachment_data),
+            func.substr(Event.attachment_data, 1, ZSTD_FRAME_HEADER_MAX)
+        ).filter(Event.id == event_id).first()
+        if not row or not row[0]:
+            return 0, b""
+        return row[0], bytes(row[1])
+
+    def get_attachment_data(self, event: Event) -> Optional[bytes]:
+        """Get an event's attachment, decompressed according to its codec"""
+        if not event.attachment_data:
+            return event.attachment_data
+        return decompress(event.attachment_data, event.attachment_codec)
+
+    def add_events(self, events: List[Dict[str, Any]], commit: bool = True) -> List[int]:
+        """Create many events with a single executemany INSERT
+
+        Args:
+            events: Dicts with the add_event_with_output fields (type, sub_type, status,
+                description, details, attachment_data, attachment_mime_type, parent_id)
+                and optionally timestamp
+            commit: Commit after inserting. Pass False to insert a large batch in
+                chunks and commit it once, as a single transaction
+
+        Returns:
+            List[int]: IDs of the created events, in input order
+        """
+        if not self.db or not events:
+            return []
+
+        now = get_current_time()
+        rows = []
+        for event in events:
+            mime_type = event.get("attachment_mime_type")
+            if isinstance(mime_type, AttachDataMimeType):
+                mime_type = MIME_TYPE_MAPPING.get(mime_type)
+            rows.append({
+                "type": event["type"],
+                "sub_type": event.get("sub_type"),
+                "status": event["status"],
+                "description": event["description"],
+                "details": event.get("details"),
+                "timestamp": event.get("timestamp") or now,
+                "attachment_mime_type": mime_type,
+                "parent_id": event.get("parent_id"),
+                **_attachment_columns(event.get("attachment_data"))
+            })
+
+        ids = []
+        for start in range(0, len(rows), EVENT_BATCH_SIZE):
+            ids.extend(self.db.scalars(
+                insert(Event).returning(Event.id, sort_by_parameter_order=True),
+                rows[start:start + EVENT_BATCH_SIZE]
+            ).all())
+        if commit:
+            self.db.commit()
+        EVENTS_INSERTED.inc(len(ids))
+        return ids
+
     def add_event(self, type: str, sub_type: str, status: str, description: str, details: str, attachment_path: str = None, parent_id: int = None) -> Event:
         """Create a new event"""
         event = None
@@ -82,14 +240,20 @@ class EventManager:
                 status=status,
                 description=description,
                 details=details,
-                has_attachment=bool(attachment_path),
-                attachment_data=attachment_data,
                 attachment_mime_type=mime_type,
-                parent_id=parent_id
+                parent_id=parent_id,
+                **_attachment_columns(attachment_data)
             )
+            EVENTS_INSERTED.inc()
 
         return event
 
+    def update_event(self, event_id: int, **fields) -> Optional[Event]:
+        """Update fields (e.g. status, description, details) of an existing event"""
+        if not self.db_manager:
+            return None
+        return self.db_manager.update(event_id, **fields)
+
     def get_event(self, event_id: int) -> Optional[Event]:
         """Get a specific event by ID"""
         if not self.db:
@@ -102,7 +266,8 @@ class EventManager:
         skip: int = 0, 
         limit: int = 100,
         sort_by: str = "timestamp",
-        sort_order: str = "desc"
+        sort_order: str = "desc",
+        with_details: bool = True
     ) -> List[Event]:
         """List events with optional filtering and sorting
         
@@ -112,11 +277,15 @@ class EventManager:
             limit: Maximum number of records to return
             sort_by: Field to sort by (id, timestamp, type, status, description)
             sort_order: Sort order ('asc' or 'desc')
+            with_details: Load the (deferred) details in the same query; otherwise
+                they are only read and decompressed for the events they are accessed on
         """
         if not self.db:
             return []
             
         query = self.db.query(Event)
+        if with_details:
+            query = query.options(undefer(Event.details))
         
         # Apply filters
         if filter.type:
@@ -146,6 +315,13 @@ class EventManager:
         
         return query.offset(skip).limit(limit).all()
 
+    def ids_with_details(self, event_ids: List[int]) -> set:
+        """IDs of the events that have non-empty details, without reading or decompressing them"""
+        if not self.db or not event_ids:
+            return set()
+        rows = self.db.query(Event.id).filter(Event.id.in_(event_ids), func.length(Event.details) > 0)
+        return {event_id for (event_id,) in rows}
+
     def get_last_task_run(self, sub_type: str) -> Optional[datetime]:
         """Get the last run time for a task
         
@@ -164,4 +340,247 @@ class EventManager:
             Event.sub_type == sub_type
         ).order_by(Event.timestamp.desc()).first()
         
-        return event.timestamp if event else None 
\ No newline at end of file
+        return event.timestamp if event else None
+
+    def ensure_event_stats(self) -> bool:
+        """Install the triggers that maintain event_stats_daily, backfilling it on first install
+
+        Returns:
+            bool: True if the statistics were backfilled from existing events
+        """
+        installed = self.db.execute(text(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'event_stats_%'"
+        )).scalar()
+        for statement in EVENT_STATS_TRIGGERS:
+            self.db.execute(text(statement))
+        backfill = installed < len(EVENT_STATS_TRIGGERS)
+        if backfill:
+            # Triggers and backfill commit together, so no insert is counted twice or missed
+            self.db.query(EventStatsDaily).delete()
+            self.db.execute(text(EVENT_STATS_BACKFILL))
+            logger.info("Backfilled event statistics from existing events")
+        self.db.commit()
+        return backfill
+
+    def rebuild_event_stats(self) -> int:
+        """Recount event_stats_daily from the events table
+
+        Returns:
+            int: Number of (day, type, sub_type, status) rows written
+        """
+        self.db.query(EventStatsDaily).delete()
+        rows = self.db.execute(text(EVENT_STATS_BACKFILL)).rowcount
+        self.db.commit()
+        return rows
+
+    def get_event_stats(
+        self,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        bucket: str = "day",
+        group_by: Optional[List[str]] = None,
+        type: Optional[str] = None,
+        sub_type: Optional[str] = None,
+        status: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Count events per time bucket from the pre-aggregated daily statistics
+
+        The cost depends on the number of days and distinct (type, sub_type, status)
+        combinations in range, not on the number of events.
+
+        Args:
+            start_date: First day to include
+            end_date: Last day to include
+            bucket: day, week (starting Monday), month, year or total
+            group_by: Fields to count separately (type, sub_type, status)
+            type: Only events of this type
+            sub_type: Only events of this sub-type
+            status: Only events with this status
+
+        Returns:
+            List[Dict[str, Any]]: Rows with bucket (None for total), the group_by fields and count
+
+        Raises:
+            ValueError: If the bucket or a group_by field is not supported
+        """
+        if bucket not in STATS_BUCKETS:
+            raise ValueError(f"Unsupported bucket: {bucket}")
+        group_by = group_by or []
+        unknown = [field for field in group_by if field not in STATS_GROUP_FIELDS]
+        if unknown:
+            raise ValueError(f"Unsupported group_by fields: {', '.join(unknown)}")
+
+        bucket_column = STATS_BUCKETS[bucket]
+        columns = [getattr(EventStatsDaily, field) for field in group_by]
+        if bucket_column is not None:
+            columns.insert(0, bucket_column.label("bucket"))
+        total = func.sum(EventStatsDaily.count)
+        query = self.db.query(*columns, total.label("count"))
+
+        if start_date:
+            query = query.filter(EventStatsDaily.day >= start_date.isoformat())
+        if end_date:
+            query = query.filter(EventStatsDaily.day <= end_date.isoformat())
+        for field, value in (("type", type), ("sub_type", sub_type), ("status", status)):
+            if value is not None:
+                query = query.filter(getattr(EventStatsDaily, field) == value)
+
+        if columns:
+            query = query.group_by(*columns).order_by(*columns)
+        rows = query.having(total > 0).all()
+
+        results = []
+        for row in rows:
+            result = {"bucket": row.bucket if bucket_column is not None else None}
+            for field in group_by:
+                # '' stands in for NULL in the statistics table
+                result[field] = getattr(row, field) or None
+            result["count"] = row.count
+            results.append(result)
+        return results
+
+    def load_compression_dictionaries(self) -> int:
+        """Register stored zstd dictionaries so new data uses the active one
+
+        Returns:
+            int: Number of dictionaries loaded
+        """
+        dictionaries = self.db.query(CompressionDictionary).order_by(CompressionDictionary.id).all()
+        for dictionary in dictionaries:
+            register_dictionary(dictionary.dict_id, dictionary.data, active=dictionary.active)
+        return len(dictionaries)
+
+    def train_compression_dictionary(self, max_samples: int = None) -> Optional[CompressionDictionary]:
+        """Train a zstd dictionary from recent text attachments and long details
+
+        Attachments are split into small samples, since a dictionary mostly helps
+        with the short, repetitive headers and lines of our task logs.
+
+        Args:
+            max_samples: Maximum number of samples (defaults to ATTACHMENTS.DICTIONARY_SAMPLES)
+
+        Returns:
+            Optional[CompressionDictionary]: The new active dictionary, or None if
+            zstandard is not installed or there is too little data to train on
+        """
+        if not ZSTD_AVAILABLE:
+            logger.info("zstandard is not installed, skipping dictionary training")
+            return None
+
+        max_samples = max_samples or settings.ATTACHMENTS.DICTIONARY_SAMPLES
+        samples: List[bytes] = []
+        text_events = self.db.query(Event.id).filter(
+            Event.has_attachment == True,
+            or_(Event.attachment_mime_type.like("text/%"), Event.attachment_mime_type.is_(None))
+        ).order_by(Event.id.desc()).limit(max_samples).all()
+        for (event_id,) in text_events:
+            data = self.get_attachment_data(self.get_event(event_id))
+            for start in range(0, min(len(data), DICTIONARY_SAMPLE_SIZE * 16), DICTIONARY_SAMPLE_SIZE):
+                samples.append(data[start:start + DICTIONARY_SAMPLE_SIZE])
+            self.db.expunge_all()
+            if len(samples) >= max_samples:
+                break
+
+        threshold = settings.ATTACHMENTS.DETAILS_COMPRESSION_THRESHOLD
+        # Compressed details are BLOBs, whose length is the compressed size
+        long_details = self.db.query(Event.details).filter(
+            or_(func.typeof(Event.details) == "blob", func.length(Event.details) >= threshold)
+        ).order_by(Event.id.desc()).limit(max_samples)
+        samples.extend(details.encode("utf-8")[:DICTIONARY_SAMPLE_SIZE] for (details,) in long_details)
+        samples = samples[:max_samples]
+
+        if len(samples) < MIN_DICTIONARY_SAMPLES:
+            logger.info(f"Only {len(samples)} samples available, skipping dictionary training")
+            return None
+
+        try:
+            trained = train_dictionary(samples)
+        except Exception as e:
+            # zstd refuses to train on too little or too uniform data
+            logger.warning(f"Failed to train compression dictionary: {str(e)}")
+            return None
+
+        self.db.query(CompressionDictionary).update({CompressionDictionary.active: False})
+        dictionary = CompressionDictionary(
+            dict_id=trained.dict_id(),
+            data=trained.as_bytes(),
+            sample_count=len(samples),
+            active=True
+        )
+        self.db.add(dictionary)
+        self.db.commit()
+        register_dictionary(dictionary.dict_id, dictionary.data, active=True)
+        logger.info(f"Trained compression dictionary {dictionary.dict_id} from {len(samples)} samples")
+        return dictionary
+
+    def recompress_attachments(self, batch_size: int = 100) -> Dict[str, int]:
+        """Re-encode stored attachments with the configured codec and active dictionary
+
+        Attachments are processed one at a time and committed in batches, so
+        memory use is bounded by the largest single attachment.
+
+        Returns:
+            Dict[str, int]: Number of attachments recompressed and bytes before/after
+        """
+        codec = resolve_codec()
+        dict_id = active_dictionary_id() or 0
+        stats = {"recompressed": 0, "bytes_before": 0, "bytes_after": 0}
+
+        event_ids = [event_id for (event_id,) in self.db.query(Event.id).filter(Event.has_attachment == True).order_by(Event.id)]
+        for index, event_id in enumerate(event_ids, start=1):
+            event = self.get_event(event_id)
+            stored = event.attachment_data
+            if not stored:
+                continue
+            current_codec = event.attachment_codec or CODEC_IDENTITY
+            if current_codec == codec and (codec != CODEC_ZSTD or frame_dictionary_id(stored) == dict_id):
+                continue
+
+            data = decompress(stored, current_codec)
+            recompressed = compress(data, codec)
+            event.attachment_data = recompressed
+            event.attachment_codec = codec
+            if event.attachment_size is None:
+                event.attachment_size = len(data)
+                event.attachment_sha256 = hashlib.sha256(data).hexdigest()
+            stats["recompressed"] += 1
+            stats["bytes_before"] += len(stored)
+            stats["bytes_after"] += len(recompressed)
+
+            if index % batch_size == 0:
+                self.db.commit()
+                self.db.expunge_all()
+        self.db.commit()
+        self.db.expunge_all()
+        return stats
+
+    def recompress_details(self, include_compressed: bool = False, batch_size: int = 500) -> int:
+        """Rewrite long details so they are stored compressed
+
+        Args:
+            include_compressed: Also rewrite details that are already compressed,
+                e.g. after training a new dictionary
+            batch_size: Rows per commit
+
+        Returns:
+            int: Number of events rewritten
+        """
+        threshold = settings.ATTACHMENTS.DETAILS_COMPRESSION_THRESHOLD
+        uncompressed = and_(func.typeof(Event.details) == "text", func.length(Event.details) >= threshold)
+        if include_compressed:
+            query = self.db.query(Event.id).filter(or_(uncompressed, func.typeof(Event.details) == "blob"))
+        else:
+            query = self.db.query(Event.id).filter(uncompressed)
+
+        event_ids = [event_id for (event_id,) in query.order_by(Event.id)]
+        for index, event_id in enumerate(event_ids, start=1):
+            event = self.get_event(event_id)
+            # Re-binding the value runs it through CompressedText again; details are deferred, so load them first
+            event.details
+            flag_modified(event, "details")
+            if index % batch_size == 0:
+                self.db.commit()
+                self.db.expunge_all()
+        self.db.commit()
+        self.db.expunge_all()
+        return len(event_ids)
@@ -0,0 +1,540 @@
+import errno
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session, selectinload
+
+from app.api.managers.media_merge_manager import MediaMergeManager
+from app.api.managers.media_summary_manager import MediaSummaryManager
+from app.core.settings import settings
+from app.models.media import (
+    CacheStatus, FolderType, MediaFolderGroup, MediaSourceFile, MediaSourceItem, PendingStatus
+)
+from app.utils.event_utils import create_event
+from app.utils.link_utils import remove_link
+
+logger = logging.getLogger(__name__)
+
+# Bytes compared at the start, middle and end of a copy before it is renamed into place
+VERIFY_BLOCK_SIZE = 1024 * 1024
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+# One cache run at a time, whether from the API or the scheduler
+_cache_lock = threading.Lock()
+
+
+@dataclass
+class CacheFile:
+    id: int
+    relative_path: str
+    size: int  # Of the source file, as of the last scan
+    cached_size: int = 0  # Of the copy currently in the cache
+
+
+@dataclass
+class CacheItem:
+    item_id: int
+    title_id: int
+    title: str
+    name: str  # e.g. "Some Show S01E02"
+    files: List[CacheFile] = field(default_factory=list)
+
+    @property
+    def size(self) -> int:
+        return sum(file.size for file in self.files)
+
+    @property
+    def cached_size(self) -> int:
+        return sum(file.cached_size for file in self.files)
+
+
+@dataclass
+class CachePlan:
+    cache_root: str
+    budget: int
+    usage: int
+    promote: List[CacheItem] = field(default_factory=list)  # Files to copy in (new or stale)
+    demote: List[CacheItem] = field(default_factory=list)  # Requested removals
+    evict: List[CacheItem] = field(default_factory=list)  # Removals to make room
+    deferred: List[CacheItem] = field(default_factory=list)  # Promotions that don't fit the budget
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "cache_root": self.cache_root,
+            "budget_bytes": self.budget,
+            "usage_bytes": self.usage,
+            **{
+                f"{name}_{unit}": value
+                for name, items in (
+                    ("promote", self.promote), ("demote", self.demote), ("evict", self.evict), ("deferred", self.deferred)
+                )
+                for unit, value in (("items", len(items)), ("bytes", sum(item.size for item in items)))
+            }
+        }
+
+
+def _copy_data(source_fd: int, target_fd: int, size: int) -> None:
+    """Copy size bytes in the kernel: copy_file_range, else sendfile, else through userspace"""
+    copied = 0
+    try:
+        while copied < size:
+            count = os.copy_file_range(source_fd, target_fd, min(COPY_CHUNK_SIZE, size - copied))
+            if count == 0:
+                break
+            copied += count
+        return
+    except OSError as e:
+        # Older kernels can't copy_file_range across filesystems
+        if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP) or copied:
+            raise
+    try:
+        while copied < size:
+            count = os.sendfile(target_fd, source_fd, copied, min(COPY_CHUNK_SIZE, size - copied))
+            if count == 0:
+                break
+            copied += count
+        return
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.ENOSYS) or copied:
+            raise
+    with open(source_fd, "rb", closefd=False) as source, open(target_fd, "wb", closefd=False) as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+
+
+def _blocks_match(source_path: str, target_path: str, size: int) -> bool:
+    with open(source_path, "rb") as source, open(target_path, "rb") as target:
+        for offset in {0, max(0, size // 2 - VERIFY_BLOCK_SIZE // 2), max(0, size - VERIFY_BLOCK_SIZE)}:
+            source.seek(offset)
+            target.seek(offset)
+            if source.read(VERIFY_BLOCK_SIZE) != target.read(VERIFY_BLOCK_SIZE):
+                return False
+    return True
+
+
+def copy_verified(source_path: str, target_path: str) -> int:
+    """Copy a file next to its target, verify it and rename it into place
+
+    The copy is never visible at target_path until it is complete and verified,
+    and keeps the source's timestamps so stale copies can be told apart.
+
+    Returns:
+        int: Bytes copied
+
+    Raises:
+        OSError: If the copy fails or doesn't match the source
+    """
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    partial_path = os.path.join(os.path.dirname(target_path), f".{os.path.basename(target_path)}.partial")
+    try:
+        with open(source_path, "rb") as source, open(partial_path, "wb") as target:
+            stat = os.fstat(source.fileno())
+            _copy_data(source.fileno(), target.fileno(), stat.st_size)
+            target.flush()
+            os.fsync(target.fileno())
+        if os.stat(partial_path).st_size != stat.st_size or not _blocks_match(source_path, partial_path, stat.st_size):
+            raise OSError(errno.EIO, "Copy does not match the source", source_path)
+        os.utime(partial_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.rename(partial_path, target_path)
+        return stat.st_size
+    except BaseException:
+        try:
+            os.unlink(partial_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _source_attributes(file: MediaSourceFile) -> Dict[str, int]:
+    try:
+        return json.loads(file.file_attributes)
+    except (TypeError, ValueError):
+        return {}
+
+
+def _cache_item(item: MediaSourceItem) -> CacheItem:
+    title = item.media_title.title if item.media_title else f"Title {item.media_title_id}"
+    name = title
+    if item.season is not None and item.episode is not None:
+        name = f"{title} S{item.season:02d}E{item.episode:02d}"
+    elif item.season is not None:
+        name = f"{title} Season {item.season}"
+    return CacheItem(item.id, item.media_title_id, title, name)
+
+
+class MediaCacheManager:
+    """Promotes media source items to the cache storage and demotes and evicts them again
+
+    Items are promoted when their pending status is PROMOTE (or they are accessed
+    MEDIA_CACHE.PROMOTE_AFTER_ACCESSES times) and demoted when it is DEMOTE.
+    Promoted items are CACHED and are evicted, least recently or least often
+    accessed first, when promotions need their space; MANUAL items are pinned.
+    Only promotions read from the source disks.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def cache_path() -> Optional[str]:
+        """Base path of the cache storage, or None if MEDIA_DATA has none"""
+        storage = settings.MEDIA_DATA.get("storage", {})
+        name = settings.MEDIA_CACHE.STORAGE or next(
+            (name for name, config in storage.items() if config.get("type") == FolderType.CACHE.value), None
+        )
+        return storage[name]["path"] if name in storage else None
+
+    def cache_group(self) -> MediaFolderGroup:
+        """Folder group of the cache storage, created as needed
+
+        Raises:
+            ValueError: If MEDIA_DATA has no cache storage or it doesn't exist
+        """
+        base_path = self.cache_path()
+        if not base_path:
+            raise ValueError("No cache storage configured in MEDIA_DATA")
+        if not os.path.isdir(base_path):
+            raise ValueError(f"Cache storage {base_path} does not exist")
+
+        group = self.db.query(MediaFolderGroup).filter(MediaFolderGroup.base_path == base_path).first()
+        if not group:
+            group = MediaFolderGroup(base_path=base_path, type=FolderType.CACHE)
+            self.db.add(group)
+            self.db.flush()
+        return group
+
+    def set_pending(self, items: List[MediaSourceItem], pending: PendingStatus, pin: Optional[bool] = None) -> int:
+        """Request promotion or demotion of items, optionally pinning or unpinning them
+
+        Returns:
+            int: Number of items updated
+        """
+        for item in items:
+            item.pending = pending
+            if pending == PendingStatus.DEMOTE:
+                continue
+            if pin:
+                item.cache_status = CacheStatus.MANUAL
+            elif pin is False and item.cache_status == CacheStatus.MANUAL:
+                cached = any(file.cache_status != CacheStatus.NONE for file in item.source_files)
+                item.cache_status = CacheStatus.CACHED if cached else CacheStatus.NONE
+        MediaSummaryManager(self.db).refresh({item.media_title_id for item in items})
+        self.db.commit()
+        return len(items)
+
+    def record_access(self, item_id: int) -> MediaSourceItem:
+        """Count an access (e.g. a play) of an item for eviction and automatic promotion
+
+        Raises:
+            ValueError: If the item doesn't exist
+        """
+        item = self.db.get(MediaSourceItem, item_id)
+        if not item:
+            raise ValueError(f"Media item {item_id} not found")
+        item.last_accessed = datetime.now(UTC)
+        item.access_count = (item.access_count or 0) + 1
+        threshold = settings.MEDIA_CACHE.PROMOTE_AFTER_ACCESSES
+        if (threshold and item.access_count >= threshold and item.cache_status == CacheStatus.NONE
+                and item.pending == PendingStatus.NONE):
+            item.pending = PendingStatus.PROMOTE
+        MediaSummaryManager(self.db).refresh([item.media_title_id])
+        self.db.commit()
+        return item
+
+    def plan(self) -> CachePlan:
+        """Work out what to copy into and remove from the cache, within its budget
+
+        Only the cache copies are stat'ed: their atime counts as an access, and
+        a copy whose size or mtime no longer matches its source is copied again.
+
+        Raises:
+            ValueError: If there is no cache storage
+        """
+        group = self.cache_group()
+        cache_root = group.base_path
+        items = (
+            self.db.query(MediaSourceItem)
+            .filter((MediaSourceItem.cache_status != CacheStatus.NONE) | (MediaSourceItem.pending != PendingStatus.NONE))
+            .options(selectinload(MediaSourceItem.source_files), selectinload(MediaSourceItem.media_title))
+            .all()
+        )
+
+        usage = 0
+        promote, demote, evictable = [], [], []
+        for item in items:
+            cached, stale = _cache_item(item), []
+            last_access = item.last_accessed.replace(tzinfo=UTC).timestamp() if item.last_accessed else 0
+            accessed = 0.0
+            for file in item.source_files:
+                attributes = _source_attributes(file)
+                entry = CacheFile(file.id, file.relative_title_path, attributes.get("size", 0))
+                if file.cache_status != CacheStatus.NONE and file.cache_folder_group_id == group.id:
+                    try:
+                        stat = os.stat(os.path.join(cache_root, file.relative_title_path))
+                        entry.cached_size = stat.st_size
+                        accessed = max(accessed, stat.st_atime)
+                        if (stat.st_size, int(stat.st_mtime)) != (attributes.get("size"), attributes.get("mtime")):
+                            stale.append(entry)
+                    except FileNotFoundError:
+                        stale.append(entry)
+                else:
+                    stale.append(entry)
+                usage += entry.cached_size
+                cached.files.append(entry)
+            if accessed > last_access + 1:
+                item.last_accessed = datetime.fromtimestamp(accessed, UTC)
+                item.access_count = (item.access_count or 0) + 1
+
+            # Sort keys are taken now, as committing expires the items
+            last_accessed = item.last_accessed.replace(tzinfo=None) if item.last_accessed else datetime.min
+            if item.pending == PendingStatus.DEMOTE:
+                demote.append(cached)
+            elif item.pending == PendingStatus.PROMOTE or (item.cache_status != CacheStatus.NONE and stale):
+                to_copy = CacheItem(cached.item_id, cached.title_id, cached.title, cached.name, stale)
+                # Refreshes of stale copies first, then the most accessed requests
+                promote.append(((item.pending == PendingStatus.PROMOTE, -(item.access_count or 0), item.id), to_copy))
+            elif item.cache_status == CacheStatus.CACHED:
+                if settings.MEDIA_CACHE.EVICTION.lower() == "lfu":
+                    evictable.append(((item.access_count or 0, last_accessed, item.id), cached))
+                else:
+                    evictable.append(((last_accessed, item.id), cached))
+        self.db.commit()
+
+        capacity = usage + shutil.disk_usage(cache_root).free - settings.MEDIA_CACHE.MIN_FREE_BYTES
+        budget = max(0, min(settings.MEDIA_CACHE.BUDGET_BYTES, capacity) if settings.MEDIA_CACHE.BUDGET_BYTES else capacity)
+        plan = CachePlan(cache_root=cache_root, budget=budget, usage=usage, demote=demote)
+
+        # Promotions are accepted in priority order if they fit once everything evictable
+        # is gone; then only what the accepted ones need is evicted
+        promote.sort(key=lambda entry: entry[0])
+        needed = usage - sum(item.cached_size for item in demote)
+        room = budget + sum(cached.cached_size for _, cached in evictable)
+        for _, to_copy in promote:
+            size = sum(file.size - file.cached_size for file in to_copy.files)
+            if needed + size <= room:
+                plan.promote.append(to_copy)
+                needed += size
+            else:
+                plan.deferred.append(to_copy)
+
+        evictable.sort(key=lambda entry: entry[0])
+        for _, cached in evictable:
+            if needed <= budget:
+                break
+            plan.evict.append(cached)
+            needed -= cached.cached_size
+        return plan
+
+    def apply(self, plan: Optional[CachePlan] = None) -> Dict[str, Any]:
+        """Carry out a plan (by default a new one): removals first, then parallel copies
+
+        Progress is recorded as events: one per title promoted and a summary.
+
+        Returns:
+            Dict[str, Any]: The plan's summary with the items and bytes actually promoted and failed
+
+        Raises:
+            ValueError: If there is no cache storage
+        """
+        with _cache_lock:
+            started = time.perf_counter()
+            plan = plan or self.plan()
+            group = self.cache_group()
+            summary = plan.summary()
+            if plan.promote or plan.demote or plan.evict:
+                create_event(
+                    status="info",
+                    event_type="media",
+                    sub_type="cache",
+                    description="Media cache run started",
+                    details="\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in summary.items())
+                )
+
+            # Merged library links are moved off copies before they are removed
+            removals = plan.demote + plan.evict
+            paths = [path for cached in removals for path in self._uncache(plan.cache_root, cached)]
+            self._relink({cached.title_id for cached in removals})
+            MediaSummaryManager(self.db).refresh({cached.title_id for cached in removals})
+            self.db.commit()
+            for path in paths:
+                try:
+                    remove_link(path, plan.cache_root)
+                except OSError as e:
+                    logger.error(f"Could not remove cached copy {path}: {str(e)}")
+            promoted, failed, copied_bytes = self._promote(plan, group)
+            self._relink({cached.title_id for cached in plan.promote})
+
+            summary.update({
+                "promoted_items": promoted,
+                "failed_items": failed,
+                "copied_bytes": copied_bytes,
+                "seconds": round(time.perf_counter() - started, 3)
+            })
+            logger.info(f"Media cache run completed: {summary}")
+            return summary
+
+    def verify_copies(self, directories: Iterable[str]) -> Optional[Set[int]]:
+        """Mark files whose cache copy below the directories is gone or no longer matches as not cached
+
+        The copies are only stat'ed. Cached items left without any copy are no
+        longer cached; pinned items stay pinned and are copied again by the next run.
+        Nothing is checked while a cache run is copying, rather than waiting for it.
+
+        Args:
+            directories: Absolute paths of changed directories on the cache storage
+
+        Returns:
+            Optional[Set[int]]: IDs of the titles whose files were uncached, or
+                None if a cache run is in progress
+
+        Raises:
+            ValueError: If there is no cache storage
+        """
+        if not _cache_lock.acquire(blocking=False):
+            return None
+        try:
+            group = self.cache_group()
+            relative = {os.path.relpath(directory, group.base_path) for directory in directories}
+            relative = {directory for directory in relative if directory != os.pardir and not directory.startswith(os.pardir + os.sep)}
+            if not relative:
+                return set()
+
+            query = self.db.query(MediaSourceFile).filter(
+                MediaSourceFile.cache_folder_group_id == group.id, MediaSourceFile.cache_status != CacheStatus.NONE
+            )
+            path = MediaSourceFile.relative_title_path
+            if os.curdir in relative:
+                files = query.all()
+            else:
+                # Paths below a directory sort between "<dir>/" and "<dir>0"
+                conditions = [
+                    and_(path > directory + os.sep, path < directory + chr(ord(os.sep) + 1)) for directory in sorted(relative)
+                ]
+                files = [file for start in range(0, len(conditions), 50) for file in query.filter(or_(*conditions[start:start + 50]))]
+
+            items = {}
+            for file in files:
+                attributes = _source_attributes(file)
+                try:
+                    stat = os.stat(os.path.join(group.base_path, file.relative_title_path))
+                    if (stat.st_size, int(stat.st_mtime)) == (attributes.get("size"), attributes.get("mtime")):
+                        continue
+                except FileNotFoundError:
+                    pass
+                file.cache_status = CacheStatus.NONE
+                file.cache_folder_group_id = None
+                items[file.media_source_item_id] = file.media_source_item
+
+            for item in items.values():
+                if item.cache_status == CacheStatus.CACHED and all(
+                    file.cache_status == CacheStatus.NONE for file in item.source_files
+                ):
+                    item.cache_status = CacheStatus.NONE
+            title_ids = {item.media_title_id for item in items.values()}
+            if title_ids:
+                MediaSummaryManager(self.db).refresh(title_ids)
+            self.db.commit()
+            if items:
+                logger.info(f"Cache copies of {len(items)} media items are gone or changed, no longer cached")
+            return title_ids
+        finally:
+            _cache_lock.release()
+
+    def _uncache(self, cache_root: str, cached: CacheItem) -> List[str]:
+        """Mark an item's files as no longer cached, returning the paths of their copies"""
+        item = self.db.get(MediaSourceItem, cached.item_id)
+        paths = []
+        for file in item.source_files:
+            paths.append(os.path.join(cache_root, file.relative_title_path))
+            file.cache_status = CacheStatus.NONE
+            file.cache_folder_group_id = None
+        item.cache_status = CacheStatus.NONE
+        item.pending = PendingStatus.NONE
+        self.db.commit()
+        return paths
+
+    def _relink(self, title_ids: Set[int]) -> None:
+        """Point the titles' links in the merged libraries at their current copies"""
+        if not title_ids or not MediaMergeManager.merge_path():
+            return
+        try:
+            MediaMergeManager(self.db).build(title_ids=title_ids)
+        except (ValueError, OSError) as e:
+            logger.error(f"Could not update the merged media libraries: {str(e)}")
+
+    def _promote(self, plan: CachePlan, group: MediaFolderGroup) -> tuple:
+        """Copy the plan's promotions, COPY_WORKERS files at a time, updating each item as it completes"""
+        items = {cached.item_id: self.db.get(MediaSourceItem, cached.item_id) for cached in plan.promote}
+        remaining = {cached.item_id: len(cached.files) for cached in plan.promote}
+        errors: Dict[int, List[str]] = defaultdict(list)
+        titles: Dict[int, List[CacheItem]] = defaultdict(list)
+        for cached in plan.promote:
+            titles[cached.title_id].append(cached)
+        titles_remaining = {title_id: len(title_items) for title_id, title_items in titles.items()}
+        promoted = failed = copied_bytes = 0
+
+        def finish(cached: CacheItem) -> None:
+            nonlocal promoted, failed
+            item = items[cached.item_id]
+            if errors[cached.item_id]:
+                failed += 1
+                logger.error(f"Could not cache {cached.name}: {'; '.join(errors[cached.item_id])}")
+            else:
+                promoted += 1
+                if item.cache_status == CacheStatus.NONE:
+                    item.cache_status = CacheStatus.CACHED
+                    # So it isn't the first to be evicted; not counted as an access
+                    item.last_accessed = datetime.now(UTC)
+                item.pending = PendingStatus.NONE
+            self.db.commit()
+
+            titles_remaining[cached.title_id] -= 1
+            if titles_remaining[cached.title_id] == 0:
+                MediaSummaryManager(self.db).refresh([cached.title_id])
+                self.db.commit()
+                title_items = titles[cached.title_id]
+                title_errors = [error for entry in title_items for error in errors[entry.item_id]]
+                create_event(
+                    status="error" if title_errors else "success",
+                    event_type="media",
+                    sub_type="cache",
+                    description=f"{'Failed to cache' if title_errors else 'Cached'} {title_items[0].title}",
+                    details="\n".join(
+                        [f"Items: {len(title_items)}", f"Bytes: {sum(entry.size for entry in title_items)}"] + title_errors
+                    )
+                )
+
+        with ThreadPoolExecutor(max_workers=settings.MEDIA_CACHE.COPY_WORKERS, thread_name_prefix="media-cache") as executor:
+            futures = {}
+            for cached in plan.promote:
+                item = items[cached.item_id]
+                if not cached.files:
+                    finish(cached)
+                    continue
+                for entry in cached.files:
+                    source = os.path.join(item.source_folder_group.base_path, entry.relative_path)
+                    target = os.path.join(plan.cache_root, entry.relative_path)
+                    futures[executor.submit(copy_verified, source, target)] = (cached, entry)
+
+            for future in as_completed(futures):
+                cached, entry = futures[future]
+                try:
+                    copied_bytes += future.result()
+                    file = self.db.get(MediaSourceFile, entry.id)
+                    file.cache_status = CacheStatus.CACHED
+                    file.cache_folder_group_id = group.id
+                except OSError as e:
+                    errors[cached.item_id].append(f"{entry.relative_path}: {e.strerror or str(e)}")
+                remaining[cached.item_id] -= 1
+                if remaining[cached.item_id] == 0:
+                    finish(cached)
+        return promoted, failed, copied_bytes
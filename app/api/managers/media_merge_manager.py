@@ -0,0 +1,322 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.settings import settings
+from app.models.media import (
+    CacheStatus, FolderType, MediaFolderGroup, MediaLinkedFile, MediaSourceFile, MediaSourceItem, MediaTitle
+)
+from app.utils.link_utils import remove_link, replace_link, swap_in_tree
+
+logger = logging.getLogger(__name__)
+
+# Title IDs per query, below SQLite's bound parameter limit
+TITLE_QUERY_LIMIT = 500
+
+# Builds from the API, the watcher and cache runs would otherwise race on the same links
+_merge_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Link:
+    source_file_id: int
+    source_folder_group_id: int  # The source storage's, or the cache's if the file is cached there
+    target: str  # Absolute path the link points to
+
+
+class MediaMergeManager:
+    """Builds the merged libraries: one folder per media type of links to the best copy of each title's items
+
+    For each episode (or movie) the item that is cached is preferred, then the
+    one of the highest quality; its files are linked from their cache copies
+    if they have them. The links are recorded as MediaLinkedFile rows, so a
+    build only touches links whose target changed. A full rebuild creates the
+    folders next to the current ones and swaps them in, so media servers never
+    see a half-built library.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    @staticmethod
+    def merge_path() -> Optional[str]:
+        """Base path of the merge storage, or None if MEDIA_DATA has none"""
+        storage = settings.MEDIA_DATA.get("storage", {})
+        name = settings.MEDIA_MERGE.STORAGE or next(
+            (name for name, config in storage.items() if config.get("type") == FolderType.MERGE.value), None
+        )
+        return storage[name]["path"] if name in storage else None
+
+    def merge_group(self) -> MediaFolderGroup:
+        """Folder group of the merge storage, created as needed
+
+        Raises:
+            ValueError: If MEDIA_DATA has no merge storage or it doesn't exist
+        """
+        base_path = self.merge_path()
+        if not base_path:
+            raise ValueError("No merge storage configured in MEDIA_DATA")
+        if not os.path.isdir(base_path):
+            raise ValueError(f"Merge storage {base_path} does not exist")
+
+        group = self.db.query(MediaFolderGroup).filter(MediaFolderGroup.base_path == base_path).first()
+        if not group:
+            group = MediaFolderGroup(base_path=base_path, type=FolderType.MERGE)
+            self.db.add(group)
+            self.db.flush()
+        return group
+
+    def build(self, title_ids: Optional[Iterable[int]] = None, full: bool = False) -> Dict[str, Any]:
+        """Bring the merged libraries in line with the media database
+
+        Args:
+            title_ids: Only update the links of these titles (and links whose file is gone)
+            full: Rebuild every merged folder and swap it in, e.g. after links were changed by hand
+
+        Returns:
+            Dict[str, Any]: Links created, replaced, removed and unchanged, and the time in seconds
+
+        Raises:
+            ValueError: If there is no merge storage
+        """
+        started = time.perf_counter()
+        title_ids = None if title_ids is None else sorted(set(title_ids))
+        folders = sorted(set(settings.MEDIA_MERGE.FOLDERS.values()))
+        with _merge_lock:
+            group = self.merge_group()
+            has_links = self.db.query(MediaLinkedFile.id).filter(MediaLinkedFile.target_folder_group_id == group.id).first()
+            missing_folder = any(not os.path.isdir(os.path.join(group.base_path, folder)) for folder in folders)
+            if full or not has_links or missing_folder:
+                result = self._rebuild(group, folders)
+            else:
+                result = self._update(group, title_ids)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(f"Merged media libraries updated: {result}")
+        return result
+
+    def verify_links(self, directories: Iterable[str]) -> Set[int]:
+        """Forget the recorded links below the directories that are gone from the merge storage
+
+        Only the links are checked, with lstat. Building the titles returned
+        creates the forgotten links again.
+
+        Args:
+            directories: Absolute paths of changed directories on the merge storage
+
+        Returns:
+            Set[int]: IDs of the titles whose links were forgotten
+
+        Raises:
+            ValueError: If there is no merge storage
+        """
+        with _merge_lock:
+            group = self.merge_group()
+            relative = {os.path.relpath(directory, group.base_path) for directory in directories}
+            relative = {directory for directory in relative if directory != os.pardir and not directory.startswith(os.pardir + os.sep)}
+            if not relative:
+                return set()
+
+            query = (
+                select(MediaLinkedFile.id, MediaLinkedFile.relative_path, MediaSourceItem.media_title_id)
+                .outerjoin(MediaSourceFile, MediaLinkedFile.source_file_id == MediaSourceFile.id)
+                .outerjoin(MediaSourceItem, MediaSourceFile.media_source_item_id == MediaSourceItem.id)
+                .where(MediaLinkedFile.target_folder_group_id == group.id)
+            )
+            path = MediaLinkedFile.relative_path
+            if os.curdir in relative:
+                rows = self.db.execute(query).all()
+            else:
+                # Paths below a directory sort between "<dir>/" and "<dir>0"
+                conditions = [
+                    and_(path > directory + os.sep, path < directory + chr(ord(os.sep) + 1)) for directory in sorted(relative)
+                ]
+                rows = [
+                    row for start in range(0, len(conditions), 50)
+                    for row in self.db.execute(query.where(or_(*conditions[start:start + 50])))
+                ]
+
+            gone = [
+                (row_id, title_id) for row_id, link_path, title_id in rows
+                if not os.path.lexists(os.path.join(group.base_path, link_path))
+            ]
+            for start in range(0, len(gone), TITLE_QUERY_LIMIT):
+                self.db.execute(delete(MediaLinkedFile).where(
+                    MediaLinkedFile.id.in_([row_id for row_id, _ in gone[start:start + TITLE_QUERY_LIMIT]])
+                ))
+            self.db.commit()
+            if gone:
+                logger.info(f"{len(gone)} merged media links are gone, creating them again")
+            return {title_id for _, title_id in gone if title_id is not None}
+
+    def _desired(self, title_ids: Optional[List[int]]) -> Dict[str, Link]:
+        """Link path (relative to the merge storage) -> link, for the titles or all of them"""
+        base_paths = dict(self.db.execute(select(MediaFolderGroup.id, MediaFolderGroup.base_path)).all())
+        query = (
+            select(
+                MediaSourceFile.id, MediaSourceFile.relative_title_path, MediaSourceFile.cache_status,
+                MediaSourceFile.cache_folder_group_id, MediaSourceItem.id, MediaSourceItem.media_title_id,
+                MediaSourceItem.season, MediaSourceItem.episode, MediaSourceItem.quality,
+                MediaSourceItem.source_folder_group_id, MediaTitle.media_type
+            )
+            .join(MediaSourceItem, MediaSourceFile.media_source_item_id == MediaSourceItem.id)
+            .join(MediaTitle, MediaSourceItem.media_title_id == MediaTitle.id)
+        )
+        if title_ids is None:
+            rows = self.db.execute(query).all()
+        else:
+            rows = [
+                row for start in range(0, len(title_ids), TITLE_QUERY_LIMIT)
+                for row in self.db.execute(query.where(MediaSourceItem.media_title_id.in_(title_ids[start:start + TITLE_QUERY_LIMIT])))
+            ]
+
+        item_files: Dict[int, List[Tuple]] = defaultdict(list)
+        for row in rows:
+            item_files[row[4]].append(row)
+
+        # The best item of each episode (or movie): cached first, then by quality
+        best: Dict[Tuple, Tuple] = {}
+        for item_id, files in item_files.items():
+            _, _, _, _, _, title_id, season, episode, quality, _, media_type = files[0]
+            cached = all(row[2] != CacheStatus.NONE and row[3] in base_paths for row in files)
+            rank = (cached, int(quality), -item_id)
+            key = (title_id, season, episode)
+            if key not in best or rank > best[key][0]:
+                best[key] = (rank, item_id, media_type)
+
+        desired: Dict[str, Link] = {}
+        for (cached, _, _), item_id, media_type in best.values():
+            folder = settings.MEDIA_MERGE.FOLDERS.get(media_type.value)
+            if not folder:
+                continue
+            for file_id, relative_path, _, cache_group_id, _, _, _, _, _, source_group_id, _ in item_files[item_id]:
+                parts = relative_path.split(os.sep, 1)  # Without the library folder
+                if len(parts) < 2:
+                    continue
+                group_id = cache_group_id if cached else source_group_id
+                link_path = os.path.join(folder, parts[1])
+                desired.setdefault(link_path, Link(file_id, group_id, os.path.join(base_paths[group_id], relative_path)))
+        return desired
+
+    def _existing(self, group: MediaFolderGroup, title_ids: Optional[List[int]]) -> Dict[str, Tuple]:
+        """Link path -> (row ID, link) of the recorded links of the titles, and of files that are gone"""
+        base_paths = dict(self.db.execute(select(MediaFolderGroup.id, MediaFolderGroup.base_path)).all())
+        query = (
+            select(
+                MediaLinkedFile.id, MediaLinkedFile.relative_path, MediaLinkedFile.source_file_id,
+                MediaLinkedFile.source_folder_group_id, MediaSourceFile.relative_title_path
+            )
+            .outerjoin(MediaSourceFile, MediaLinkedFile.source_file_id == MediaSourceFile.id)
+            .outerjoin(MediaSourceItem, MediaSourceFile.media_source_item_id == MediaSourceItem.id)
+            .where(MediaLinkedFile.target_folder_group_id == group.id)
+        )
+        if title_ids is None:
+            rows = self.db.execute(query).all()
+        else:
+            rows = [
+                row for start in range(0, len(title_ids), TITLE_QUERY_LIMIT)
+                for row in self.db.execute(query.where(or_(
+                    MediaSourceItem.media_title_id.in_(title_ids[start:start + TITLE_QUERY_LIMIT]),
+                    MediaSourceFile.id.is_(None)
+                )))
+            ]
+        existing = {}
+        for row_id, link_path, file_id, group_id, relative_path in rows:
+            target = os.path.join(base_paths[group_id], relative_path) if relative_path and group_id in base_paths else None
+            existing[link_path] = (row_id, Link(file_id, group_id, target))
+        return existing
+
+    def _update(self, group: MediaFolderGroup, title_ids: Optional[List[int]]) -> Dict[str, Any]:
+        """Create, replace and remove only the links that changed"""
+        desired = self._desired(title_ids)
+        existing = self._existing(group, title_ids)
+        hardlink = settings.MEDIA_MERGE.LINK_TYPE == "hardlink"
+        cache_groups = self._cache_group_ids()
+
+        removed = [(link_path, row_id) for link_path, (row_id, _) in existing.items() if link_path not in desired]
+        for link_path, _ in removed:
+            remove_link(os.path.join(group.base_path, link_path), group.base_path)
+        if removed:
+            self.db.execute(delete(MediaLinkedFile).where(MediaLinkedFile.id.in_([row_id for _, row_id in removed])))
+
+        created, replaced = [], []
+        for link_path, link in desired.items():
+            row_id, current = existing.get(link_path, (None, None))
+            if current == link:
+                continue
+            replace_link(
+                link.target, os.path.join(group.base_path, link_path),
+                hardlink=hardlink and link.source_folder_group_id not in cache_groups
+            )
+            values = {"source_file_id": link.source_file_id, "source_folder_group_id": link.source_folder_group_id}
+            if row_id is None:
+                created.append({"target_folder_group_id": group.id, "relative_path": link_path, **values})
+            else:
+                replaced.append({"id": row_id, **values})
+        if created:
+            self.db.execute(insert(MediaLinkedFile), created)
+        if replaced:
+            self.db.execute(update(MediaLinkedFile), replaced)
+        self.db.commit()
+        return {
+            "full": False,
+            "links_created": len(created),
+            "links_replaced": len(replaced),
+            "links_removed": len(removed),
+            "links_unchanged": len(desired) - len(created) - len(replaced)
+        }
+
+    def _rebuild(self, group: MediaFolderGroup, folders: List[str]) -> Dict[str, Any]:
+        """Build every merged folder next to the current one and swap it in"""
+        desired = self._desired(None)
+        hardlink = settings.MEDIA_MERGE.LINK_TYPE == "hardlink"
+        cache_groups = self._cache_group_ids()
+        shadows = {folder: os.path.join(group.base_path, f".{folder}.building") for folder in folders}
+        try:
+            for shadow in shadows.values():
+                shutil.rmtree(shadow, ignore_errors=True)
+                os.makedirs(shadow)
+            for link_path, link in desired.items():
+                folder, relative_path = link_path.split(os.sep, 1)
+                replace_link(
+                    link.target, os.path.join(shadows[folder], relative_path),
+                    hardlink=hardlink and link.source_folder_group_id not in cache_groups
+                )
+        except BaseException:
+            for shadow in shadows.values():
+                shutil.rmtree(shadow, ignore_errors=True)
+            raise
+
+        self.db.execute(delete(MediaLinkedFile).where(MediaLinkedFile.target_folder_group_id == group.id))
+        rows = [
+            {
+                "target_folder_group_id": group.id,
+                "relative_path": link_path,
+                "source_file_id": link.source_file_id,
+                "source_folder_group_id": link.source_folder_group_id
+            }
+            for link_path, link in desired.items()
+        ]
+        for start in range(0, len(rows), settings.MEDIA_SCAN.BATCH_SIZE):
+            self.db.execute(insert(MediaLinkedFile), rows[start:start + settings.MEDIA_SCAN.BATCH_SIZE])
+        for folder, shadow in shadows.items():
+            swap_in_tree(shadow, os.path.join(group.base_path, folder))
+        self.db.commit()
+        return {
+            "full": True,
+            "links_created": len(desired),
+            "links_replaced": 0,
+            "links_removed": 0,
+            "links_unchanged": 0
+        }
+
+    def _cache_group_ids(self) -> set:
+        # Cache copies are always symlinked: a hard link would keep an evicted copy's space in use
+        return set(self.db.scalars(select(MediaFolderGroup.id).where(MediaFolderGroup.type == FolderType.CACHE)))
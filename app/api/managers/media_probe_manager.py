@@ -0,0 +1,270 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.api.managers.media_summary_manager import MediaSummaryManager
+from app.core.settings import settings
+from app.models.media import (
+    MediaFileType, MediaFolderGroup, MediaProbe, MediaSourceFile, MediaSourceItem, QualityLevel
+)
+from app.utils.disk_utils import is_disk_asleep
+from app.utils.probe_utils import ProbeError, probe_file
+
+logger = logging.getLogger(__name__)
+
+# One probe run at a time, whether from the API or the scheduler
+_probe_lock = threading.Lock()
+
+# Longest wait before a file whose probes keep failing is tried again
+MAX_RETRY_DELAY = 30 * 24 * 3600
+
+
+@dataclass
+class ProbeTarget:
+    file_id: int
+    item_id: int
+    path: str
+
+
+class MediaProbeManager:
+    """Probes video files with ffprobe and derives their items' QualityLevel from the streams
+
+    Probes are stored by (inode, size, mtime), and a file whose size and mtime
+    still match its probe isn't even stat'ed, so unchanged files are never
+    probed again. Failed probes (timeouts, busy disks) are retried after
+    MEDIA_PROBE.RETRY_AFTER, doubled after each further failure. Files are probed MEDIA_PROBE.WORKERS at a time and stored a
+    batch at a time, so an interrupted run carries on where it stopped. Files
+    on spun-down disks are left for a later run.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def probe(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Probe the video files that changed or were never probed
+
+        Args:
+            limit: Probe at most this many files
+
+        Returns:
+            Dict[str, Any]: Files probed, failed, reused from another path, unchanged,
+                waiting to retry a failed probe and skipped, items whose quality changed,
+                and the time in seconds
+
+        Raises:
+            ValueError: If ffprobe isn't installed
+        """
+        if not shutil.which(settings.MEDIA_PROBE.FFPROBE):
+            raise ValueError(f"{settings.MEDIA_PROBE.FFPROBE} not found; install ffmpeg or set MEDIA_PROBE.FFPROBE")
+
+        with _probe_lock:
+            started = time.perf_counter()
+            targets, unchanged, waiting, skipped = self._targets()
+            total = len(targets)
+            if limit is not None:
+                targets = targets[:limit]
+            # Failed probes aren't reused, so their files are probed again; their count of failures carries on
+            known, failed = {}, {}
+            for probe_id, inode, size, mtime_ns, error, attempts in self.db.execute(
+                select(MediaProbe.id, MediaProbe.inode, MediaProbe.size, MediaProbe.mtime_ns, MediaProbe.error, MediaProbe.attempts)
+            ):
+                if error is None:
+                    known[(inode, size, mtime_ns)] = probe_id
+                else:
+                    failed[(inode, size, mtime_ns)] = attempts or 1
+            counts = {"probed": 0, "failed": 0, "reused": 0, "items_requalified": 0}
+
+            batch_size = settings.MEDIA_PROBE.BATCH_SIZE
+            with ThreadPoolExecutor(max_workers=settings.MEDIA_PROBE.WORKERS, thread_name_prefix="media-probe") as executor:
+                for start in range(0, len(targets), batch_size):
+                    batch = targets[start:start + batch_size]
+                    results = list(executor.map(lambda target: self._probe_one(target, known, failed), batch))
+                    self._store(batch, results, known, counts)
+                    logger.info(f"Probed {min(start + batch_size, len(targets))}/{len(targets)} media files")
+
+            result = {
+                "files_probed": counts["probed"],
+                "files_failed": counts["failed"],
+                "files_reused": counts["reused"],
+                "files_unchanged": unchanged,
+                "files_retry_later": waiting,
+                "files_skipped_asleep": skipped,
+                "files_remaining": total - counts["probed"] - counts["failed"] - counts["reused"],
+                "items_requalified": counts["items_requalified"],
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+            logger.info(f"Media probe completed: {result}")
+            return result
+
+    def _targets(self) -> Tuple[List[ProbeTarget], int, int, int]:
+        """Video files to probe, and the numbers unchanged since their probe, waiting to retry a failed one and skipped as asleep"""
+        base_paths = dict(self.db.execute(select(MediaFolderGroup.id, MediaFolderGroup.base_path)).all())
+        asleep = {group_id: is_disk_asleep(base_path) for group_id, base_path in base_paths.items()}
+        rows = self.db.execute(
+            select(
+                MediaSourceFile.id, MediaSourceFile.media_source_item_id, MediaSourceFile.relative_title_path,
+                MediaSourceFile.file_attributes, MediaSourceItem.source_folder_group_id, MediaProbe.size,
+                MediaProbe.mtime_ns, MediaProbe.error, MediaProbe.attempts, MediaProbe.probed_at
+            )
+            .join(MediaSourceItem, MediaSourceFile.media_source_item_id == MediaSourceItem.id)
+            .outerjoin(MediaProbe, MediaSourceFile.probe_id == MediaProbe.id)
+            .where(MediaSourceFile.file_type == MediaFileType.VIDEO)
+            .order_by(MediaSourceItem.source_folder_group_id, MediaSourceFile.relative_title_path)
+        )
+        now = datetime.now(UTC)
+        targets, unchanged, waiting, skipped = [], 0, 0, 0
+        for (
+            file_id, item_id, relative_path, attributes, group_id, probe_size, probe_mtime_ns, error, attempts, probed_at
+        ) in rows:
+            try:
+                attributes = json.loads(attributes)
+            except (TypeError, ValueError):
+                attributes = {}
+            same_version = (
+                probe_size is not None
+                and (probe_size, probe_mtime_ns // 10 ** 9) == (attributes.get("size"), attributes.get("mtime"))
+            )
+            if same_version and error is None:
+                unchanged += 1
+            elif same_version and not self._retry_due(attempts, probed_at, now):
+                waiting += 1
+            elif group_id not in base_paths:
+                continue
+            elif asleep[group_id]:
+                skipped += 1
+            else:
+                targets.append(ProbeTarget(file_id, item_id, os.path.join(base_paths[group_id], relative_path)))
+        return targets, unchanged, waiting, skipped
+
+    @staticmethod
+    def _retry_due(attempts: Optional[int], probed_at: Optional[datetime], now: datetime) -> bool:
+        """Whether a failed probe has waited long enough to be retried"""
+        if probed_at is None:
+            return True
+        delay = min(settings.MEDIA_PROBE.RETRY_AFTER * 2 ** max((attempts or 1) - 1, 0), MAX_RETRY_DELAY)
+        return (now - probed_at.replace(tzinfo=UTC)).total_seconds() >= delay
+
+    @staticmethod
+    def _probe_one(target: ProbeTarget, known: Dict[Tuple, int], failed: Dict[Tuple, int]) -> Optional[Dict[str, Any]]:
+        """The file's probe row, or {"id": ...} if the same file version was probed at another path"""
+        try:
+            stat = os.stat(target.path)
+        except OSError as e:
+            logger.warning(f"Could not probe {target.path}: {str(e)}")
+            return None
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        row = {"inode": key[0], "size": key[1], "mtime_ns": key[2], "probed_at": datetime.now(UTC)}
+        if key in known:
+            return {**row, "id": known[key]}
+        try:
+            streams = probe_file(target.path, settings.MEDIA_PROBE.FFPROBE, settings.MEDIA_PROBE.TIMEOUT)
+        except ProbeError as e:
+            return {
+                **row, "video_codec": None, "width": None, "height": None, "duration": None,
+                "audio_tracks": None, "subtitle_tracks": None, "quality": QualityLevel.UNKNOWN, "error": str(e),
+                "attempts": failed.get(key, 0) + 1
+            }
+        return {
+            **row,
+            **streams,
+            "audio_tracks": json.dumps(streams["audio_tracks"]),
+            "subtitle_tracks": json.dumps(streams["subtitle_tracks"]),
+            "error": None,
+            "attempts": 0
+        }
+
+    def _store(
+        self, batch: List[ProbeTarget], results: List[Optional[Dict[str, Any]]], known: Dict[Tuple, int], counts: Dict[str, int]
+    ) -> None:
+        """Store a batch of probes, link them to their files and requalify their items, in one commit"""
+        new_rows = {}
+        probe_ids = dict(known)
+        for result in results:
+            if result is None:
+                continue
+            key = (result["inode"], result["size"], result["mtime_ns"])
+            if "id" in result:
+                counts["reused"] += 1
+            else:
+                counts["failed" if result["error"] else "probed"] += 1
+                new_rows[key] = result
+        if new_rows:
+            upsert = sqlite_insert(MediaProbe)
+            columns = [column.name for column in MediaProbe.__table__.columns if column.name not in ("id", "inode", "size", "mtime_ns")]
+            self.db.execute(
+                upsert.on_conflict_do_update(
+                    index_elements=["inode", "size", "mtime_ns"],
+                    set_={column: upsert.excluded[column] for column in columns}
+                ),
+                list(new_rows.values())
+            )
+            for probe_id, inode, size, mtime_ns, error in self.db.execute(
+                select(MediaProbe.id, MediaProbe.inode, MediaProbe.size, MediaProbe.mtime_ns, MediaProbe.error)
+                .where(MediaProbe.inode.in_([key[0] for key in new_rows]))
+            ):
+                probe_ids[(inode, size, mtime_ns)] = probe_id
+                # Only successful probes are reused by later batches; failed ones are retried
+                if error is None:
+                    known[(inode, size, mtime_ns)] = probe_id
+
+        links = [
+            {"id": target.file_id, "probe_id": probe_ids[(result["inode"], result["size"], result["mtime_ns"])]}
+            for target, result in zip(batch, results) if result is not None
+        ]
+        if links:
+            self.db.execute(update(MediaSourceFile), links)
+        counts["items_requalified"] += self._requalify({target.item_id for target in batch})
+        self.db.commit()
+
+    def _requalify(self, item_ids: set) -> int:
+        """Set items' quality to that of their best probed video file, returning how many changed
+
+        An item whose new quality is already taken by another item of the same
+        episode and library is merged into it.
+        """
+        rows = self.db.execute(
+            select(MediaSourceFile.media_source_item_id, MediaProbe.quality)
+            .join(MediaProbe, MediaSourceFile.probe_id == MediaProbe.id)
+            .where(MediaSourceFile.media_source_item_id.in_(item_ids), MediaSourceFile.file_type == MediaFileType.VIDEO)
+        )
+        qualities: Dict[int, QualityLevel] = defaultdict(lambda: QualityLevel.UNKNOWN)
+        for item_id, quality in rows:
+            qualities[item_id] = max(qualities[item_id], quality)
+
+        changed, changed_titles = 0, set()
+        for item_id, quality in qualities.items():
+            item = self.db.get(MediaSourceItem, item_id)
+            if quality == QualityLevel.UNKNOWN or item.quality == quality:
+                continue
+            other = self.db.query(MediaSourceItem).filter(
+                MediaSourceItem.media_title_id == item.media_title_id,
+                MediaSourceItem.source_folder_group_id == item.source_folder_group_id,
+                MediaSourceItem.quality == quality,
+                MediaSourceItem.season.is_(item.season) if item.season is None else MediaSourceItem.season == item.season,
+                MediaSourceItem.episode.is_(item.episode) if item.episode is None else MediaSourceItem.episode == item.episode,
+                MediaSourceItem.id != item.id
+            ).first()
+            if other:
+                self.db.execute(
+                    update(MediaSourceFile).where(MediaSourceFile.media_source_item_id == item.id).values(media_source_item_id=other.id)
+                )
+                self.db.execute(delete(MediaSourceItem).where(MediaSourceItem.id == item.id))
+            else:
+                item.quality = quality
+                self.db.flush()  # So the next item's lookup sees it
+            changed_titles.add(item.media_title_id)
+            changed += 1
+        MediaSummaryManager(self.db).refresh(changed_titles)
+        return changed
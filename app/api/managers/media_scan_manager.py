@@ -0,0 +1,667 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.api.managers.media_summary_manager import MediaSummaryManager
+from app.core.settings import settings
+from app.models.media import (
+    CacheStatus, MediaFileType, MediaFolderGroup, MediaProbe, MediaScanDirectory, MediaSourceFile,
+    MediaSourceItem, MediaTitle, PendingStatus, QualityLevel
+)
+from app.utils.disk_utils import SLEEPING_STATES, disk_for_path, disk_power_state
+from app.utils.media_utils import LibraryConfig, get_libraries, parse_path
+
+logger = logging.getLogger(__name__)
+
+# A directory changed this close to the start of a scan may change again within the
+# same mtime tick, so its mtime isn't trusted and it is listed again on the next scan
+MTIME_SETTLE_NS = 2_000_000_000
+
+# Above this many changed directories in a folder group, its existing files are
+# loaded per library instead of per directory
+DIRECTORY_QUERY_LIMIT = 500
+
+# Scans from the API, the scheduler and the media watcher write one at a time
+_scan_lock = threading.Lock()
+
+
+@dataclass
+class ScannedFile:
+    library: LibraryConfig
+    title: str
+    season: Optional[int]
+    episode: Optional[int]
+    quality: Optional[QualityLevel]
+    file_type: MediaFileType
+    relative_path: str  # Relative to the storage path, e.g. "tv-hd/Show/Season 01/Show S01E01.mkv"
+    size: int
+    mtime: int
+
+
+@dataclass
+class DirectoryFingerprint:
+    relative_path: str  # Relative to the storage path, e.g. "tv-hd/Show/Season 01"
+    inode: int
+    mtime_ns: Optional[int]
+    entry_count: int
+    subdirectories: List[str]
+    id: Optional[int] = None
+
+
+@dataclass
+class WalkResult:
+    files: List[ScannedFile] = field(default_factory=list)
+    listed: List[DirectoryFingerprint] = field(default_factory=list)  # Directories that were (re)listed
+    unchanged: Set[str] = field(default_factory=set)  # Directories whose fingerprint matched
+    unreadable: Set[str] = field(default_factory=set)  # Directories whose files are kept as they are
+
+    def merge(self, other: "WalkResult") -> None:
+        self.files.extend(other.files)
+        self.listed.extend(other.listed)
+        self.unchanged.update(other.unchanged)
+        self.unreadable.update(other.unreadable)
+
+
+def _file_attributes(size: int, mtime: int) -> str:
+    return json.dumps({"size": size, "mtime": mtime}, separators=(",", ":"))
+
+
+def _read_directory(
+    path: str, relative_path: str, known: Optional[DirectoryFingerprint], settled_ns: int
+) -> Tuple[Optional[DirectoryFingerprint], List[str], List[os.DirEntry]]:
+    """Stat a directory and list it unless it matches its known fingerprint
+
+    Adding, removing or renaming an entry changes a directory's mtime, so a
+    directory with the same inode and mtime still has the same entries.
+
+    Returns:
+        The new fingerprint (None if unchanged), the subdirectory names and the files listed
+    """
+    stat = os.stat(path)
+    if known and known.mtime_ns is not None and (known.inode, known.mtime_ns) == (stat.st_ino, stat.st_mtime_ns):
+        return None, known.subdirectories, []
+
+    subdirectories, files = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.name)
+            elif entry.is_file():
+                files.append(entry)
+    fingerprint = DirectoryFingerprint(
+        relative_path=relative_path,
+        inode=stat.st_ino,
+        mtime_ns=stat.st_mtime_ns if stat.st_mtime_ns < settled_ns else None,
+        entry_count=len(subdirectories) + len(files),
+        subdirectories=sorted(subdirectories)
+    )
+    return fingerprint, subdirectories, files
+
+
+def _walk_title(
+    library: LibraryConfig, path: str, name: str, is_dir: bool,
+    known: Mapping[str, DirectoryFingerprint], settled_ns: int, start: Sequence[str] = ()
+) -> WalkResult:
+    """Scan one title folder (or a file directly in the library root)
+
+    Runs on a scanner thread, so it only touches the filesystem. Directories
+    matching their fingerprint in known are only stat'ed, not listed. With
+    start, only that subdirectory of the title folder is walked.
+    """
+    result = WalkResult()
+    title_dir = name if is_dir else os.path.splitext(name)[0]
+    title_path = os.path.join(library.id, name) if is_dir else library.id
+
+    def add(entry_path: str, parts: List[str]) -> None:
+        try:
+            stat = os.stat(entry_path)
+        except OSError as e:
+            logger.warning(f"Skipping unreadable file {entry_path}: {str(e)}")
+            return
+        parsed = parse_path(title_dir, parts, library.media_type)
+        result.files.append(ScannedFile(
+            library=library,
+            title=parsed.title,
+            season=parsed.season,
+            episode=parsed.episode,
+            quality=parsed.quality,
+            file_type=parsed.file_type,
+            relative_path=os.path.join(title_path, *parts),
+            size=stat.st_size,
+            mtime=int(stat.st_mtime)
+        ))
+
+    if not is_dir:
+        add(path, [name])
+        return result
+
+    stack: List[Tuple[str, List[str]]] = [(os.path.join(path, *start), list(start))]
+    while stack:
+        directory, parts = stack.pop()
+        relative_path = os.path.join(title_path, *parts)
+        try:
+            fingerprint, subdirectories, files = _read_directory(
+                directory, relative_path, known.get(relative_path), settled_ns
+            )
+        except FileNotFoundError:
+            continue  # Gone: its files and fingerprint are removed
+        except OSError as e:
+            logger.warning(f"Skipping unreadable directory {directory}: {str(e)}")
+            result.unreadable.add(relative_path)
+            continue
+        if fingerprint is None:
+            result.unchanged.add(relative_path)
+        else:
+            result.listed.append(fingerprint)
+            for entry in files:
+                add(entry.path, parts + [entry.name])
+        for subdirectory in subdirectories:
+            stack.append((os.path.join(directory, subdirectory), parts + [subdirectory]))
+    return result
+
+
+def _under(path: str, directories: Set[str]) -> bool:
+    """Whether path is one of directories or inside one of them"""
+    while path:
+        if path in directories:
+            return True
+        path = os.path.dirname(path)
+    return False
+
+
+class MediaScanManager:
+    """Scans the configured media libraries into the media database"""
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def scan(
+        self, media_data: Optional[Mapping[str, Any]] = None, workers_per_disk: Optional[int] = None,
+        full: bool = False, directories: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
+        """Walk the libraries and bring titles, source items and source files up to date
+
+        Title folders are walked in parallel, with workers_per_disk threads for each
+        physical disk (by st_dev) so no disk sees more concurrent seeks than that.
+        Directories are only listed, and their files only stat'ed, if their inode
+        or mtime changed since the last scan, and libraries on spun-down disks are
+        left as they are. The results are then written in a single transaction.
+
+        A file rewritten in place doesn't change its directory's mtime, so it takes
+        a full scan, or passing its directory in directories, to pick up its new size
+        and mtime.
+
+        Args:
+            media_data: Library configuration (defaults to settings.MEDIA_DATA)
+            workers_per_disk: Walker threads per disk (defaults to MEDIA_SCAN.WORKERS_PER_DISK)
+            full: List every directory and stat every file, waking sleeping disks
+            directories: Only scan these directories (absolute paths) and what is below
+                them, listing them even if unchanged. Paths outside the libraries are ignored.
+
+        Returns:
+            Dict[str, Any]: Counts of scanned files and directories and of rows added, updated and removed
+
+        Raises:
+            ValueError: If the library configuration is invalid
+        """
+        with _scan_lock:
+            return self._scan(media_data, workers_per_disk, full, directories)
+
+    def _scan(
+        self, media_data: Optional[Mapping[str, Any]], workers_per_disk: Optional[int], full: bool,
+        directories: Optional[Iterable[str]]
+    ) -> Dict[str, Any]:
+        started = time.perf_counter()
+        libraries = get_libraries(media_data if media_data is not None else settings.MEDIA_DATA)
+        starts = None
+        if directories is not None:
+            starts = self._directory_starts(libraries, directories)
+            libraries = [library for library in libraries if library.id in starts]
+        group_ids = self._folder_groups(libraries)
+        known = self._fingerprints(set(group_ids.values()))
+
+        # Changes to directories passed in were just seen, so their disks are awake
+        asleep = [] if full or starts is not None else self._asleep(libraries)
+        scopes, walked = self._walk(
+            [library for library in libraries if library not in asleep], group_ids,
+            {} if full else known, workers_per_disk or settings.MEDIA_SCAN.WORKERS_PER_DISK, starts
+        )
+        walk_seconds = time.perf_counter() - started
+        result = self._store(group_ids, scopes, known, walked, full)
+        self.db.commit()
+
+        result.update({
+            "libraries": len(libraries),
+            "libraries_asleep": len(asleep),
+            "directories_listed": sum(len(found.listed) for found in walked.values()),
+            "directories_unchanged": sum(len(found.unchanged) for found in walked.values()),
+            "files": sum(len(found.files) for found in walked.values()),
+            "walk_seconds": round(walk_seconds, 3),
+            "total_seconds": round(time.perf_counter() - started, 3)
+        })
+        logger.info(f"Media scan completed: {result}")
+        return result
+
+    def _asleep(self, libraries: List[LibraryConfig]) -> List[LibraryConfig]:
+        """Libraries on disks that are spun down, checked once per disk"""
+        states: Dict[str, Optional[str]] = {}
+        asleep = []
+        for library in libraries:
+            disk = disk_for_path(str(library.root))
+            if disk is None:
+                continue
+            if disk not in states:
+                states[disk] = disk_power_state(disk)
+            if states[disk] in SLEEPING_STATES:
+                logger.info(f"Skipping library {library.id}: {disk} is spun down")
+                asleep.append(library)
+        return asleep
+
+    @staticmethod
+    def _directory_starts(libraries: List[LibraryConfig], directories: Iterable[str]) -> Dict[str, Set[str]]:
+        """Library-relative paths (e.g. "tv-hd/Show/Season 01") of the directories, by library ID
+
+        A directory containing a library's root stands for the whole library.
+        """
+        starts: Dict[str, Set[str]] = defaultdict(set)
+        for directory in directories:
+            path = os.path.abspath(directory)
+            for library in libraries:
+                root = str(library.root)
+                if path == root or root.startswith(path.rstrip(os.sep) + os.sep):
+                    starts[library.id].add(library.id)
+                elif path.startswith(root + os.sep):
+                    starts[library.id].add(os.path.join(library.id, os.path.relpath(path, root)))
+        return starts
+
+    def _fingerprints(self, group_ids: Set[int]) -> Dict[int, Dict[str, DirectoryFingerprint]]:
+        """Stored directory fingerprints by folder group and relative path"""
+        known: Dict[int, Dict[str, DirectoryFingerprint]] = defaultdict(dict)
+        rows = self.db.execute(select(
+            MediaScanDirectory.id, MediaScanDirectory.folder_group_id, MediaScanDirectory.relative_path,
+            MediaScanDirectory.inode, MediaScanDirectory.mtime_ns, MediaScanDirectory.entry_count,
+            MediaScanDirectory.subdirectories
+        ).where(MediaScanDirectory.folder_group_id.in_(group_ids)))
+        for directory_id, group_id, relative_path, inode, mtime_ns, entry_count, subdirectories in rows:
+            known[group_id][relative_path] = DirectoryFingerprint(
+                relative_path=relative_path,
+                inode=inode,
+                mtime_ns=mtime_ns,
+                entry_count=entry_count,
+                subdirectories=json.loads(subdirectories),
+                id=directory_id
+            )
+        return known
+
+    def _walk(
+        self, libraries: List[LibraryConfig], group_ids: Dict[str, int],
+        known: Mapping[int, Mapping[str, DirectoryFingerprint]], workers_per_disk: int,
+        starts: Optional[Mapping[str, Set[str]]] = None
+    ) -> Tuple[Dict[int, Set[str]], Dict[int, WalkResult]]:
+        """Walk the libraries, or the start directories in them
+
+        Start directories are listed even if they match their fingerprint.
+
+        Returns:
+            The directories walked and what was found below them, per folder group
+        """
+        settled_ns = time.time_ns() - MTIME_SETTLE_NS
+        scopes: Dict[int, Set[str]] = defaultdict(set)
+        walked: Dict[int, WalkResult] = defaultdict(WalkResult)
+        jobs_by_device: Dict[int, List[Tuple[int, Tuple]]] = defaultdict(list)
+        for library in libraries:
+            group_id = group_ids[str(library.storage_path)]
+            library_starts = starts[library.id] if starts else {library.id}
+            group_known = {
+                path: fingerprint for path, fingerprint in known.get(group_id, {}).items()
+                if path not in library_starts
+            } if starts else known.get(group_id, {})
+            try:
+                device = os.stat(library.root).st_dev
+            except OSError as e:
+                logger.warning(f"Skipping library {library.id} at {library.root}: {str(e)}")
+                continue
+            jobs = jobs_by_device[device]
+
+            # Directories below another start are walked from that one
+            for start in sorted(library_starts):
+                if _under(os.path.dirname(start), library_starts):
+                    continue
+                if start != library.id:
+                    title, *parts = os.path.relpath(start, library.id).split(os.sep)
+                    path = os.path.join(library.root, title)
+                    jobs.append((group_id, (library, path, title, True, group_known, settled_ns, parts)))
+                    scopes[group_id].add(start)
+                    continue
+                try:
+                    fingerprint, subdirectories, files = _read_directory(
+                        str(library.root), library.id, group_known.get(library.id), settled_ns
+                    )
+                except OSError as e:
+                    logger.warning(f"Skipping library {library.id} at {library.root}: {str(e)}")
+                    continue
+                if fingerprint is None:
+                    walked[group_id].unchanged.add(library.id)
+                else:
+                    walked[group_id].listed.append(fingerprint)
+                    for entry in files:
+                        jobs.append((group_id, (library, entry.path, entry.name, False, group_known, settled_ns)))
+                for name in subdirectories:
+                    path = os.path.join(library.root, name)
+                    jobs.append((group_id, (library, path, name, True, group_known, settled_ns)))
+                scopes[group_id].add(library.id)
+
+        executors = [
+            (ThreadPoolExecutor(max_workers=workers_per_disk, thread_name_prefix=f"media-scan-{device}"), jobs)
+            for device, jobs in jobs_by_device.items()
+        ]
+        try:
+            futures = [
+                (group_id, executor.submit(_walk_title, *job)) for executor, jobs in executors for group_id, job in jobs
+            ]
+            for group_id, future in futures:
+                walked[group_id].merge(future.result())
+            return scopes, walked
+        finally:
+            for executor, _ in executors:
+                executor.shutdown()
+
+    @staticmethod
+    def _batches(rows: List) -> List[List]:
+        batch_size = settings.MEDIA_SCAN.BATCH_SIZE
+        return [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+
+    def _insert(self, model, rows: List[Dict[str, Any]]) -> List[int]:
+        """Bulk insert rows, returning their IDs in order"""
+        ids = []
+        for batch in self._batches(rows):
+            ids.extend(self.db.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), batch).all())
+        return ids
+
+    def _delete_unreferenced(self, model, ids: Set[int], column) -> Set[int]:
+        """Delete the rows of model among ids that column no longer refers to, returning their IDs"""
+        candidates = list(ids)
+        referenced = set()
+        for batch in self._batches(candidates):
+            referenced.update(self.db.scalars(select(column).where(column.in_(batch)).distinct()))
+        unreferenced = [row_id for row_id in candidates if row_id not in referenced]
+        for batch in self._batches(unreferenced):
+            self.db.execute(delete(model).where(model.id.in_(batch)))
+        return set(unreferenced)
+
+    def _folder_groups(self, libraries: List[LibraryConfig]) -> Dict[str, int]:
+        """IDs of the folder groups of the libraries' storages, created as needed"""
+        group_ids = {}
+        for library in libraries:
+            base_path = str(library.storage_path)
+            if base_path in group_ids:
+                continue
+            group = self.db.query(MediaFolderGroup).filter(MediaFolderGroup.base_path == base_path).first()
+            if not group:
+                group = MediaFolderGroup(base_path=base_path, type=library.folder_type)
+                self.db.add(group)
+                self.db.flush()
+            group_ids[base_path] = group.id
+        return group_ids
+
+    def _existing_files(self, group_id: int, listed: List[str], subtrees: List[str]) -> Dict[Tuple, Tuple]:
+        """Stored files directly in the listed directories or anywhere below the subtrees
+
+        Returns:
+            Dict[Tuple, Tuple]: (folder group, path) -> (file ID, item ID, attributes)
+        """
+        path = MediaSourceFile.relative_title_path
+        # Paths below a directory sort between "<dir>/" and "<dir>0", so this is an index range scan
+        below = lambda directory: and_(path > directory + os.sep, path < directory + chr(ord(os.sep) + 1))
+        conditions = [
+            and_(below(directory), func.instr(func.substr(path, len(directory) + 2), os.sep) == 0)
+            for directory in listed
+        ] + [below(directory) for directory in subtrees]
+
+        existing = {}
+        for start in range(0, len(conditions), 50):
+            rows = self.db.execute(
+                select(MediaSourceFile.id, MediaSourceFile.media_source_item_id, path, MediaSourceFile.file_attributes)
+                .join(MediaSourceItem, MediaSourceFile.media_source_item_id == MediaSourceItem.id)
+                .where(MediaSourceItem.source_folder_group_id == group_id, or_(*conditions[start:start + 50]))
+            )
+            for file_id, item_id, relative_path, attributes in rows:
+                existing[(group_id, relative_path)] = (file_id, item_id, attributes)
+        return existing
+
+    def _probed_qualities(
+        self, files: List[ScannedFile], group_ids: Dict[str, int], existing_files: Dict[Tuple, Tuple]
+    ) -> Dict[Tuple, QualityLevel]:
+        """(folder group, path) -> quality of stored video files probed since they last changed"""
+        scanned = {
+            (group_ids[str(file.library.storage_path)], file.relative_path): file
+            for file in files if file.file_type == MediaFileType.VIDEO
+        }
+        file_keys = {existing[0]: key for key, existing in existing_files.items() if key in scanned}
+        probed = {}
+        for batch in self._batches(list(file_keys)):
+            rows = self.db.execute(
+                select(MediaSourceFile.id, MediaProbe.quality, MediaProbe.size, MediaProbe.mtime_ns)
+                .join(MediaProbe, MediaSourceFile.probe_id == MediaProbe.id)
+                .where(MediaSourceFile.id.in_(batch))
+            )
+            for file_id, quality, size, mtime_ns in rows:
+                file = scanned[file_keys[file_id]]
+                if quality and (size, mtime_ns // 10 ** 9) == (file.size, file.mtime):
+                    probed[file_keys[file_id]] = quality
+        return probed
+
+    def _stored_video_qualities(self, title_ids: Set[int]) -> Dict[Tuple, QualityLevel]:
+        """(title, folder group, season, episode) -> quality of the titles' stored items holding a video file"""
+        qualities = {}
+        for batch in self._batches(list(title_ids)):
+            rows = self.db.execute(
+                select(
+                    MediaSourceItem.media_title_id, MediaSourceItem.source_folder_group_id, MediaSourceItem.season,
+                    MediaSourceItem.episode, MediaSourceItem.quality
+                )
+                .join(MediaSourceFile, MediaSourceFile.media_source_item_id == MediaSourceItem.id)
+                .where(MediaSourceItem.media_title_id.in_(batch), MediaSourceFile.file_type == MediaFileType.VIDEO)
+                .distinct()
+            )
+            for title_id, group_id, season, episode, quality in rows:
+                key = (title_id, group_id, season, episode)
+                qualities[key] = max(quality, qualities.get(key, quality))
+        return qualities
+
+    def _store(
+        self, group_ids: Dict[str, int], scopes: Mapping[int, Set[str]],
+        known: Mapping[int, Mapping[str, DirectoryFingerprint]], walked: Mapping[int, WalkResult], full: bool = False
+    ) -> Dict[str, int]:
+        files = [file for directories in walked.values() for file in directories.files]
+
+        # Only files in the directories that were listed, and below stored directories
+        # that are gone, can have been added, changed or removed
+        vanished: Dict[int, List[DirectoryFingerprint]] = {}
+        existing_files: Dict[Tuple, Tuple] = {}
+        for group_id, directories in walked.items():
+            listed = sorted(directory.relative_path for directory in directories.listed)
+            found = set(listed) | directories.unchanged
+            vanished[group_id] = [
+                directory for relative_path, directory in known.get(group_id, {}).items()
+                if relative_path not in found
+                and _under(relative_path, scopes[group_id])
+                and not _under(relative_path, directories.unreadable)
+            ]
+            if len(listed) + len(vanished[group_id]) > DIRECTORY_QUERY_LIMIT:
+                existing_files.update(self._existing_files(group_id, [], sorted(scopes[group_id])))
+            else:
+                existing_files.update(self._existing_files(
+                    group_id, listed, [directory.relative_path for directory in vanished[group_id]]
+                ))
+
+        new_titles, new_items = [], {}
+        file_items: List[Tuple[ScannedFile, Tuple]] = []
+        item_ids: Dict[Tuple, int] = {}
+        if files:
+            # Titles, keyed by (title, media type)
+            title_ids = {
+                (title, media_type): title_id
+                for title_id, title, media_type in self.db.execute(select(MediaTitle.id, MediaTitle.title, MediaTitle.media_type))
+            }
+            new_titles = list(dict.fromkeys(
+                (file.title, file.library.media_type) for file in files
+                if (file.title, file.library.media_type) not in title_ids
+            ))
+            ids = self._insert(MediaTitle, [{"title": title, "media_type": media_type} for title, media_type in new_titles])
+            title_ids.update(zip(new_titles, ids))
+
+            # One source item per episode (or movie) and library; subtitles and extras join
+            # the item of their episode, which takes the quality of its best video file
+            episodes: Dict[Tuple, List[ScannedFile]] = defaultdict(list)
+            for file in files:
+                episodes[(file.library.id, file.title, file.library.media_type, file.season, file.episode)].append(file)
+
+            # Qualities measured by the prober win over those guessed from file names
+            probed = self._probed_qualities(files, group_ids, existing_files)
+            item_ids = {
+                (title_id, group_id, quality, season, episode): item_id
+                for item_id, title_id, group_id, quality, season, episode in self.db.execute(select(
+                    MediaSourceItem.id, MediaSourceItem.media_title_id, MediaSourceItem.source_folder_group_id,
+                    MediaSourceItem.quality, MediaSourceItem.season, MediaSourceItem.episode
+                ))
+            }
+            # Episodes scanned without their video (e.g. a new subtitle in a subdirectory of
+            # a rescan) keep the quality of their stored video, or of the item their files are in
+            stored_qualities = self._stored_video_qualities({
+                title_ids[(title, media_type)] for (_, title, media_type, _, _), episode_files in episodes.items()
+                if not any(f.file_type == MediaFileType.VIDEO for f in episode_files)
+            })
+            item_qualities = {item_id: key[2] for key, item_id in item_ids.items()}
+            for (_, title, media_type, season, episode), episode_files in episodes.items():
+                library = episode_files[0].library
+                title_id, group_id = title_ids[(title, media_type)], group_ids[str(library.storage_path)]
+                qualities = [
+                    probed.get((group_id, f.relative_path), f.quality)
+                    for f in episode_files if f.file_type == MediaFileType.VIDEO
+                ]
+                qualities = [q for q in qualities if q]
+                if qualities:
+                    quality = max(qualities)
+                else:
+                    current = [
+                        item_qualities.get(existing_files[(group_id, f.relative_path)][1])
+                        for f in episode_files if (group_id, f.relative_path) in existing_files
+                    ]
+                    quality = (
+                        stored_qualities.get((title_id, group_id, season, episode))
+                        or next((q for q in current if q is not None), None)
+                        or library.quality
+                    )
+                key = (title_id, group_id, quality, season, episode)
+                if key not in item_ids and key not in new_items:
+                    new_items[key] = {
+                        "media_title_id": key[0],
+                        "source_folder_group_id": key[1],
+                        "quality": quality,
+                        "season": season,
+                        "episode": episode,
+                        "cache_status": CacheStatus.NONE,
+                        "pending": PendingStatus.NONE
+                    }
+                file_items.extend((file, key) for file in episode_files)
+            ids = self._insert(MediaSourceItem, list(new_items.values()))
+            item_ids.update(zip(new_items.keys(), ids))
+
+        # Files, keyed by (folder group, path); paths that moved to another item are updated
+        new_files, changed_files, seen, vacated_items, changed_titles = [], [], set(), set(), set()
+        for file, item_key in file_items:
+            item_id = item_ids[item_key]
+            key = (item_key[1], file.relative_path)
+            seen.add(key)
+            attributes = _file_attributes(file.size, file.mtime)
+            existing = existing_files.get(key)
+            if existing is None:
+                changed_titles.add(item_key[0])
+                new_files.append({
+                    "media_source_item_id": item_id,
+                    "relative_title_path": file.relative_path,
+                    "file_type": file.file_type,
+                    "file_attributes": attributes,
+                    "cache_status": CacheStatus.NONE
+                })
+            elif existing[1] != item_id or existing[2] != attributes:
+                changed_titles.add(item_key[0])
+                if existing[1] != item_id:
+                    vacated_items.add(existing[1])
+                changed_files.append({
+                    "id": existing[0],
+                    "media_source_item_id": item_id,
+                    "file_type": file.file_type,
+                    "file_attributes": attributes
+                })
+        self._insert(MediaSourceFile, new_files)
+        if changed_files:
+            self.db.execute(update(MediaSourceFile), changed_files)
+
+        # Files gone from their listed directory or whose directory is gone (those in
+        # unchanged and unreadable directories stay), then the items and titles they
+        # leave empty
+        removed = [
+            (file_id, item_id) for (group_id, path), (file_id, item_id, _) in existing_files.items()
+            if (group_id, path) not in seen
+            and os.path.dirname(path) not in walked[group_id].unchanged
+            and not _under(os.path.dirname(path), walked[group_id].unreadable)
+        ]
+        for batch in self._batches([file_id for file_id, _ in removed]):
+            self.db.execute(delete(MediaSourceFile).where(MediaSourceFile.id.in_(batch)))
+        vacated_items.update(item_id for _, item_id in removed)
+        vacated_items.discard(None)
+        vacated_titles = set()
+        for batch in self._batches(list(vacated_items)):
+            vacated_titles.update(self.db.scalars(
+                select(MediaSourceItem.media_title_id).where(MediaSourceItem.id.in_(batch))
+            ))
+        if self._delete_unreferenced(MediaSourceItem, vacated_items, MediaSourceFile.media_source_item_id):
+            self._delete_unreferenced(MediaTitle, vacated_titles - {None}, MediaSourceItem.media_title_id)
+
+        # A full scan rebuilds every summary, so any that drifted are put right
+        MediaSummaryManager(self.db).refresh(None if full else changed_titles | vacated_titles)
+
+        # Fingerprints of the listed directories replace the stored ones
+        fingerprints = [
+            {
+                "folder_group_id": group_id,
+                "relative_path": directory.relative_path,
+                "inode": directory.inode,
+                "mtime_ns": directory.mtime_ns,
+                "entry_count": directory.entry_count,
+                "subdirectories": json.dumps(directory.subdirectories)
+            }
+            for group_id, directories in walked.items() for directory in directories.listed
+        ]
+        upsert = sqlite_insert(MediaScanDirectory)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=[MediaScanDirectory.folder_group_id, MediaScanDirectory.relative_path],
+            set_={column: upsert.excluded[column] for column in ("inode", "mtime_ns", "entry_count", "subdirectories")}
+        )
+        for batch in self._batches(fingerprints):
+            self.db.execute(upsert, batch)
+        gone = [directory.id for directories in vanished.values() for directory in directories]
+        for batch in self._batches(gone):
+            self.db.execute(delete(MediaScanDirectory).where(MediaScanDirectory.id.in_(batch)))
+
+        return {
+            "titles_added": len(new_titles),
+            "items_added": len(new_items),
+            "files_added": len(new_files),
+            "files_updated": len(changed_files),
+            "files_removed": len(removed)
+        }
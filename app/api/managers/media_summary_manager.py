@@ -0,0 +1,301 @@
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import case, delete, distinct, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.core.database import MediaDBManager
+from app.core.settings import settings
+from app.models.media import (
+    CacheStatus, MediaSourceFile, MediaSourceItem, MediaTitle, MediaTitleSummary, MediaType, PendingStatus,
+    QualityLevel, TitleCacheState
+)
+
+logger = logging.getLogger(__name__)
+
+# Title IDs per query, below SQLite's bound parameter limit
+TITLE_QUERY_LIMIT = 500
+
+# Summary column counting each quality's items, best first
+QUALITY_COLUMNS = {
+    QualityLevel.UHD: "uhd_items",
+    QualityLevel.FHD: "fhd_items",
+    QualityLevel.HD: "hd_items",
+    QualityLevel.SD: "sd_items",
+    QualityLevel.LD: "ld_items",
+    QualityLevel.UNKNOWN: "unknown_items"
+}
+
+
+class MediaSummaryManager:
+    """Maintains media_title_summary and answers the library queries from it
+
+    The scanner, cache runs and the prober refresh the summaries of the titles
+    they change, in their own transaction, so listing the library is a read of
+    one indexed table however many items and files its titles have.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def refresh(self, title_ids: Optional[Iterable[int]] = None) -> int:
+        """Recompute the summaries of the titles, or of every title, without committing
+
+        Titles that no longer exist lose their summary.
+
+        Returns:
+            int: Number of summaries written
+        """
+        # Sessions don't autoflush, and the counts must include the caller's changes
+        self.db.flush()
+        if title_ids is None:
+            # A full reload: indexes are built once after the rows are in
+            return MediaDBManager(MediaTitleSummary, self.db).bulk_insert(
+                self._summaries(None), replace=True, commit=False
+            )
+
+        title_ids = sorted(set(title_ids) - {None})
+        rows = []
+        for start in range(0, len(title_ids), TITLE_QUERY_LIMIT):
+            batch = title_ids[start:start + TITLE_QUERY_LIMIT]
+            self.db.execute(delete(MediaTitleSummary).where(MediaTitleSummary.media_title_id.in_(batch)))
+            rows.extend(self._summaries(batch))
+        if rows:
+            self.db.execute(insert(MediaTitleSummary), rows)
+        return len(rows)
+
+    def ensure(self) -> bool:
+        """Build the summaries if there are titles but none are summarised yet, e.g. after an upgrade
+
+        Returns:
+            bool: True if the summaries were built
+        """
+        if self.db.scalar(select(MediaTitleSummary.media_title_id).limit(1)) is not None:
+            return False
+        if self.db.scalar(select(MediaTitle.id).limit(1)) is None:
+            return False
+        count = self.refresh()
+        self.db.commit()
+        logger.info(f"Built {count} media title summaries")
+        return True
+
+    def titles(
+        self, media_type: Optional[MediaType] = None, quality: Optional[QualityLevel] = None,
+        cache_state: Optional[TitleCacheState] = None, search: Optional[str] = None, offset: int = 0, limit: int = 100
+    ) -> Dict[str, Any]:
+        """A page of titles by name, with their item counts by quality and cache state
+
+        Args:
+            media_type: Only titles of this type
+            quality: Only titles with an item of this quality
+            cache_state: Only titles in this cache state
+            search: Only titles whose name contains this, ignoring case
+            offset: Titles to skip
+            limit: Titles to return
+
+        Returns:
+            Dict[str, Any]: The number of matching titles and the page of them
+        """
+        conditions = []
+        if media_type is not None:
+            conditions.append(MediaTitleSummary.media_type == media_type)
+        if quality is not None:
+            conditions.append(getattr(MediaTitleSummary, QUALITY_COLUMNS[quality]) > 0)
+        if cache_state is not None:
+            conditions.append(MediaTitleSummary.cache_state == cache_state)
+        if search:
+            conditions.append(MediaTitleSummary.title.icontains(search, autoescape=True))
+
+        # The total comes with the page, so it is one read
+        rows = self.db.execute(
+            select(*MediaTitleSummary.__table__.columns, func.count().over().label("total"))
+            .where(*conditions)
+            .order_by(MediaTitleSummary.title, MediaTitleSummary.media_title_id)
+            .offset(offset)
+            .limit(limit)
+        ).mappings().all()
+        if rows:
+            total = rows[0]["total"]
+        else:
+            total = self.db.scalar(select(func.count()).select_from(MediaTitleSummary).where(*conditions)) if offset else 0
+        return {"total": total, "titles": [self._title(row) for row in rows]}
+
+    def title(self, title_id: int) -> Optional[Dict[str, Any]]:
+        """The summary of a title, or None if it doesn't exist"""
+        row = self.db.execute(
+            select(*MediaTitleSummary.__table__.columns).where(MediaTitleSummary.media_title_id == title_id)
+        ).mappings().first()
+        return self._title(row) if row else None
+
+    def seasons(self, title_id: int) -> List[Dict[str, Any]]:
+        """A title's seasons and episodes, with each episode's items by quality and their cache state
+
+        Movies have a single season and episode of None.
+        """
+        size = func.json_extract(MediaSourceFile.file_attributes, "$.size")
+        rows = self.db.execute(
+            select(
+                MediaSourceItem.id, MediaSourceItem.season, MediaSourceItem.episode, MediaSourceItem.quality,
+                MediaSourceItem.cache_status, MediaSourceItem.pending, MediaSourceItem.source_folder_group_id,
+                func.count(MediaSourceFile.id), func.coalesce(func.sum(size), 0)
+            )
+            .outerjoin(MediaSourceFile, MediaSourceFile.media_source_item_id == MediaSourceItem.id)
+            .where(MediaSourceItem.media_title_id == title_id)
+            .group_by(MediaSourceItem.id)
+        ).all()
+
+        episodes: Dict[Any, Dict[Any, List[Dict[str, Any]]]] = defaultdict(lambda: defaultdict(list))
+        for item_id, season, episode, quality, cache_status, pending, group_id, file_count, size_bytes in rows:
+            episodes[season][episode].append({
+                "id": item_id,
+                "quality": quality.name,
+                "cache_status": cache_status.value,
+                "pending": pending.value,
+                "folder_group_id": group_id,
+                "files": file_count,
+                "size_bytes": size_bytes
+            })
+        order = lambda number: (number is None, number or 0)
+        return [
+            {
+                "season": season,
+                "episodes": [
+                    {"episode": episode, "items": sorted(items, key=lambda item: -QualityLevel[item["quality"]])}
+                    for episode, items in sorted(season_episodes.items(), key=lambda entry: order(entry[0]))
+                ]
+            }
+            for season, season_episodes in sorted(episodes.items(), key=lambda entry: order(entry[0]))
+        ]
+
+    def qualities(self) -> List[Dict[str, Any]]:
+        """Items and titles of each quality, per media type"""
+        columns = [getattr(MediaTitleSummary, column) for column in QUALITY_COLUMNS.values()]
+        rows = self.db.execute(
+            select(
+                MediaTitleSummary.media_type,
+                *[func.sum(column) for column in columns],
+                *[func.sum(case((column > 0, 1), else_=0)) for column in columns]
+            ).group_by(MediaTitleSummary.media_type)
+        ).all()
+        qualities = []
+        for index, quality in enumerate(QUALITY_COLUMNS):
+            qualities.append({
+                "quality": quality.name,
+                "items": {row[0].value: row[1 + index] for row in rows},
+                "titles": {row[0].value: row[1 + len(columns) + index] for row in rows}
+            })
+        return qualities
+
+    def cache_status(self) -> Dict[str, Any]:
+        """Titles by cache state, and the items and bytes cached, pinned and pending"""
+        rows = self.db.execute(
+            select(
+                MediaTitleSummary.cache_state, func.count(), func.sum(MediaTitleSummary.cached_items),
+                func.sum(MediaTitleSummary.pinned_items), func.sum(MediaTitleSummary.pending_items),
+                func.sum(MediaTitleSummary.cached_bytes)
+            ).group_by(MediaTitleSummary.cache_state)
+        ).all()
+        return {
+            "titles": {state.value: next((row[1] for row in rows if row[0] == state), 0) for state in TitleCacheState},
+            "cached_items": sum(row[2] for row in rows),
+            "pinned_items": sum(row[3] for row in rows),
+            "pending_items": sum(row[4] for row in rows),
+            "cached_bytes": sum(row[5] for row in rows),
+            "budget_bytes": settings.MEDIA_CACHE.BUDGET_BYTES
+        }
+
+    def _summaries(self, title_ids: Optional[List[int]]) -> List[Dict[str, Any]]:
+        """Summary rows of the titles, or of every title, from two grouped queries"""
+        item = MediaSourceItem
+        cached = item.cache_status != CacheStatus.NONE
+        # Episodes are counted as distinct (season, episode) pairs; movies have no episode
+        episode_key = case((item.episode.isnot(None), func.coalesce(item.season, 0) * 100000 + item.episode))
+        items_query = (
+            select(
+                item.media_title_id, func.count(item.id), func.count(distinct(item.season)),
+                func.count(distinct(episode_key)),
+                *[func.sum(case((item.quality == quality, 1), else_=0)) for quality in QUALITY_COLUMNS],
+                func.sum(case((cached, 1), else_=0)),
+                func.sum(case((item.cache_status == CacheStatus.MANUAL, 1), else_=0)),
+                func.sum(case((item.pending != PendingStatus.NONE, 1), else_=0)),
+                func.max(item.last_accessed)
+            )
+            .group_by(item.media_title_id)
+        )
+        size = func.json_extract(MediaSourceFile.file_attributes, "$.size")
+        files_query = (
+            select(
+                item.media_title_id, func.count(MediaSourceFile.id), func.coalesce(func.sum(size), 0),
+                func.coalesce(func.sum(case((MediaSourceFile.cache_status != CacheStatus.NONE, size), else_=0)), 0)
+            )
+            .join(item, MediaSourceFile.media_source_item_id == item.id)
+            .group_by(item.media_title_id)
+        )
+        titles_query = select(MediaTitle.id, MediaTitle.title, MediaTitle.media_type)
+        if title_ids is not None:
+            items_query = items_query.where(item.media_title_id.in_(title_ids))
+            files_query = files_query.where(item.media_title_id.in_(title_ids))
+            titles_query = titles_query.where(MediaTitle.id.in_(title_ids))
+
+        items = {row[0]: row[1:] for row in self.db.execute(items_query)}
+        files = {row[0]: row[1:] for row in self.db.execute(files_query)}
+        no_items = (0, 0, 0, *(0 for _ in QUALITY_COLUMNS), 0, 0, 0, None)
+        rows = []
+        for title_id, title, media_type in self.db.execute(titles_query):
+            (
+                item_count, season_count, episode_count, *quality_counts, cached_items, pinned_items, pending_items,
+                last_accessed
+            ) = items.get(title_id, no_items)
+            file_count, size_bytes, cached_bytes = files.get(title_id, (0, 0, 0))
+            if cached_items and cached_items == item_count:
+                cache_state = TitleCacheState.FULL
+            elif cached_items:
+                cache_state = TitleCacheState.PARTIAL
+            else:
+                cache_state = TitleCacheState.NONE
+            rows.append({
+                "media_title_id": title_id,
+                "title": title,
+                "media_type": media_type,
+                "item_count": item_count,
+                "season_count": season_count,
+                "episode_count": episode_count,
+                "file_count": file_count,
+                "size_bytes": size_bytes,
+                **dict(zip(QUALITY_COLUMNS.values(), quality_counts)),
+                "best_quality": next(
+                    (quality for quality, count in zip(QUALITY_COLUMNS, quality_counts) if count), QualityLevel.UNKNOWN
+                ),
+                "cached_items": cached_items,
+                "pinned_items": pinned_items,
+                "pending_items": pending_items,
+                "cached_bytes": cached_bytes,
+                "cache_state": cache_state,
+                "last_accessed": last_accessed
+            })
+        return rows
+
+    @staticmethod
+    def _title(row) -> Dict[str, Any]:
+        return {
+            "id": row["media_title_id"],
+            "title": row["title"],
+            "media_type": row["media_type"].value,
+            "items": row["item_count"],
+            "seasons": row["season_count"],
+            "episodes": row["episode_count"],
+            "files": row["file_count"],
+            "size_bytes": row["size_bytes"],
+            "best_quality": row["best_quality"].name,
+            "qualities": {quality.name: row[column] for quality, column in QUALITY_COLUMNS.items() if row[column]},
+            "cache": {
+                "state": row["cache_state"].value,
+                "cached_items": row["cached_items"],
+                "pinned_items": row["pinned_items"],
+                "pending_items": row["pending_items"],
+                "cached_bytes": row["cached_bytes"]
+            },
+            "last_accessed": row["last_accessed"],
+            "updated_at": row["updated_at"]
+        }
@@ -0,0 +1,296 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.core.settings import settings
+from app.models.media import (
+    CacheStatus, FileFindingType, MediaFileFinding, MediaFileHash, MediaFileType, MediaFolderGroup,
+    MediaSourceFile, MediaSourceItem
+)
+from app.utils.disk_utils import disk_for_path, is_disk_asleep
+from app.utils.hash_utils import ReadThrottle, full_hash, is_current, partial_hash
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT when storing hashes and findings
+BATCH_SIZE = 500
+
+# One verification run at a time, whether from the API or the scheduler
+_verify_lock = threading.Lock()
+
+
+@dataclass
+class CheckedFile:
+    file_id: int
+    path: str
+    size: int
+    disk: str  # Files with the same disk are read one at a time
+    cache_copy: bool = False
+    key: Optional[Tuple[int, int, int]] = None  # (inode, size, mtime_ns), once stat'ed
+    device: Optional[int] = None
+    partial: Optional[str] = None
+    full: Optional[str] = None
+
+    @property
+    def identity(self) -> Tuple[int, int]:
+        # Hard links of one file aren't copies of it
+        return (self.device, self.key[0])
+
+
+class MediaVerifyManager:
+    """Finds duplicate video files and cache copies that differ from their source
+
+    Only files that could be copies of another are read: source files of the
+    same size, and cached files with their cache copy. Their partial hashes
+    are compared first, and full hashes are only computed where those match.
+    Hashes are stored by (inode, size, mtime), so an unchanged file is never
+    read twice. Each disk is read by one thread at MEDIA_VERIFY.READ_BYTES_PER_SECOND,
+    and storages on spun-down disks are skipped.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def verify(self) -> Dict[str, Any]:
+        """Check the media libraries and replace the stored findings
+
+        Returns:
+            Dict[str, Any]: Files checked and skipped, hashes computed, bytes read,
+                duplicates and cache mismatches found, and the time in seconds
+        """
+        with _verify_lock:
+            started = time.perf_counter()
+            candidates, skipped = self._candidates()
+            known = {
+                (inode, size, mtime_ns): (partial, full)
+                for inode, size, mtime_ns, partial, full in self.db.execute(select(
+                    MediaFileHash.inode, MediaFileHash.size, MediaFileHash.mtime_ns,
+                    MediaFileHash.partial_hash, MediaFileHash.full_hash
+                ))
+            }
+            stats = {"partial_hashes": 0, "full_hashes": 0, "bytes_read": 0, "unreadable": 0}
+
+            # A source file can be in a size group and in a pair with its cache copy
+            files = list({id(file): file for group in candidates for file in group}.values())
+            self._read(files, lambda file, throttle: self._partial(file, known, throttle, stats))
+            files = [file for file in files if file.key]
+            self._store_hashes([file for file in files if file.partial], known)
+
+            # Full hashes settle every partial-hash collision
+            collisions = [file for group in candidates for file in self._collisions(group)]
+            self._read(collisions, lambda file, throttle: self._full(file, known, throttle, stats))
+            self._store_hashes(collisions, known)
+
+            findings = self._findings(candidates)
+            self.db.execute(delete(MediaFileFinding))
+            for start in range(0, len(findings), BATCH_SIZE):
+                self.db.execute(insert(MediaFileFinding), findings[start:start + BATCH_SIZE])
+            self.db.commit()
+
+            duplicates = [row for row in findings if row["type"] == FileFindingType.DUPLICATE]
+            result = {
+                "files_checked": len(files),
+                "files_skipped_asleep": skipped,
+                "files_unreadable": stats["unreadable"],
+                "partial_hashes": stats["partial_hashes"],
+                "full_hashes": stats["full_hashes"],
+                "bytes_read": stats["bytes_read"],
+                "duplicate_groups": len({row["group_key"] for row in duplicates}),
+                "duplicate_files": len(duplicates),
+                "cache_mismatches": len(findings) - len(duplicates),
+                "seconds": round(time.perf_counter() - started, 3)
+            }
+            logger.info(f"Media verification completed: {result}")
+            return result
+
+    def findings(self) -> Dict[str, List[Dict[str, Any]]]:
+        """The last run's findings: duplicate groups and cache mismatches"""
+        rows = self.db.execute(
+            select(MediaFileFinding, MediaSourceFile.relative_title_path)
+            .join(MediaSourceFile, MediaFileFinding.source_file_id == MediaSourceFile.id)
+            .order_by(MediaFileFinding.group_key, MediaFileFinding.path)
+        ).all()
+        duplicates: Dict[str, Dict[str, Any]] = {}
+        mismatches = []
+        for finding, relative_path in rows:
+            entry = {
+                "source_file_id": finding.source_file_id,
+                "relative_path": relative_path,
+                "path": finding.path,
+                "detected_at": finding.detected_at
+            }
+            if finding.type == FileFindingType.DUPLICATE:
+                group = duplicates.setdefault(finding.group_key, {"hash": finding.group_key, "size": finding.size, "files": []})
+                group["files"].append(entry)
+            else:
+                mismatches.append({**entry, "size": finding.size})
+        return {
+            "duplicates": sorted(duplicates.values(), key=lambda group: -group["size"]),
+            "cache_mismatches": mismatches
+        }
+
+    def _candidates(self) -> Tuple[List[List[CheckedFile]], int]:
+        """Groups of files that could be copies of each other, and the number skipped as asleep
+
+        Uses the sizes recorded by the last scan, so nothing is read to find them.
+        """
+        base_paths = dict(self.db.execute(select(MediaFolderGroup.id, MediaFolderGroup.base_path)).all())
+        disks, asleep = {}, {}
+        for group_id, base_path in base_paths.items():
+            disks[group_id] = disk_for_path(base_path) or base_path
+            asleep[group_id] = is_disk_asleep(base_path)
+
+        by_size: Dict[int, List[CheckedFile]] = defaultdict(list)
+        pairs: List[List[CheckedFile]] = []
+        skipped = 0
+        rows = self.db.execute(
+            select(
+                MediaSourceFile.id, MediaSourceFile.relative_title_path, MediaSourceFile.file_attributes,
+                MediaSourceFile.cache_status, MediaSourceFile.cache_folder_group_id, MediaSourceItem.source_folder_group_id
+            )
+            .join(MediaSourceItem, MediaSourceFile.media_source_item_id == MediaSourceItem.id)
+            .where(MediaSourceFile.file_type == MediaFileType.VIDEO)
+        )
+        for file_id, relative_path, attributes, cache_status, cache_group_id, group_id in rows:
+            try:
+                size = json.loads(attributes)["size"]
+            except (TypeError, ValueError, KeyError):
+                continue
+            if size < settings.MEDIA_VERIFY.MIN_SIZE_BYTES or group_id not in base_paths:
+                continue
+            if asleep[group_id]:
+                skipped += 1
+                continue
+            source = CheckedFile(file_id, os.path.join(base_paths[group_id], relative_path), size, disks[group_id])
+            by_size[size].append(source)
+            if cache_status != CacheStatus.NONE and cache_group_id in base_paths and not asleep[cache_group_id]:
+                copy = CheckedFile(
+                    file_id, os.path.join(base_paths[cache_group_id], relative_path), size, disks[cache_group_id], cache_copy=True
+                )
+                pairs.append([source, copy])
+
+        sized = [group for group in by_size.values() if len(group) > 1]
+        return sized + pairs, skipped
+
+    def _read(self, files: List[CheckedFile], read: Callable[[CheckedFile, ReadThrottle], None]) -> None:
+        """Run read on every file, one thread per disk, each throttled to READ_BYTES_PER_SECOND"""
+        by_disk: Dict[str, Dict[int, CheckedFile]] = defaultdict(dict)
+        for file in files:
+            by_disk[file.disk][id(file)] = file
+
+        def read_disk(disk_files: List[CheckedFile]) -> None:
+            throttle = ReadThrottle(settings.MEDIA_VERIFY.READ_BYTES_PER_SECOND)
+            for file in disk_files:
+                read(file, throttle)
+
+        if not by_disk:
+            return
+        with ThreadPoolExecutor(max_workers=len(by_disk), thread_name_prefix="media-verify") as executor:
+            for future in [executor.submit(read_disk, list(disk_files.values())) for disk_files in by_disk.values()]:
+                future.result()
+
+    def _partial(self, file: CheckedFile, known: Dict, throttle: ReadThrottle, stats: Dict[str, int]) -> None:
+        if file.key:
+            return
+        try:
+            stat = os.stat(file.path)
+            file.key, file.device, file.size = (stat.st_ino, stat.st_size, stat.st_mtime_ns), stat.st_dev, stat.st_size
+            stored_partial, stored_full = known.get(file.key, (None, None))
+            if is_current(stored_partial):
+                file.partial, file.full = stored_partial, stored_full if is_current(stored_full) else None
+                return
+            before = throttle.bytes_read
+            file.partial = partial_hash(file.path, file.size, throttle)
+            stats["partial_hashes"] += 1
+            stats["bytes_read"] += throttle.bytes_read - before
+        except OSError as e:
+            logger.warning(f"Could not read {file.path}: {str(e)}")
+            file.key = None
+            stats["unreadable"] += 1
+
+    def _full(self, file: CheckedFile, known: Dict, throttle: ReadThrottle, stats: Dict[str, int]) -> None:
+        if file.full:
+            return
+        try:
+            before = throttle.bytes_read
+            file.full = full_hash(file.path, throttle)
+            stats["full_hashes"] += 1
+            stats["bytes_read"] += throttle.bytes_read - before
+        except OSError as e:
+            logger.warning(f"Could not read {file.path}: {str(e)}")
+            stats["unreadable"] += 1
+
+    @staticmethod
+    def _collisions(group: List[CheckedFile]) -> List[CheckedFile]:
+        """Files of a group whose partial hash matches another file's (not a hard link of it)"""
+        by_partial: Dict[str, Dict[Tuple, CheckedFile]] = defaultdict(dict)
+        for file in group:
+            if file.key and file.partial:
+                by_partial[file.partial][file.identity] = file
+        return [file for files in by_partial.values() if len(files) > 1 for file in files.values()]
+
+    def _store_hashes(self, files: List[CheckedFile], known: Dict) -> None:
+        rows = {}
+        for file in files:
+            if file.key and known.get(file.key) != (file.partial, file.full):
+                known[file.key] = (file.partial, file.full)
+                inode, size, mtime_ns = file.key
+                rows[file.key] = {
+                    "inode": inode, "size": size, "mtime_ns": mtime_ns, "partial_hash": file.partial,
+                    "full_hash": file.full, "hashed_at": datetime.now(UTC)
+                }
+        rows = list(rows.values())
+        for start in range(0, len(rows), BATCH_SIZE):
+            upsert = sqlite_insert(MediaFileHash)
+            self.db.execute(
+                upsert.on_conflict_do_update(
+                    index_elements=["inode", "size", "mtime_ns"],
+                    set_={column: upsert.excluded[column] for column in ("partial_hash", "full_hash", "hashed_at")}
+                ),
+                rows[start:start + BATCH_SIZE]
+            )
+        self.db.commit()
+
+    @staticmethod
+    def _findings(candidates: List[List[CheckedFile]]) -> List[Dict[str, Any]]:
+        findings = []
+        duplicates: Dict[str, Dict[Tuple, CheckedFile]] = defaultdict(dict)
+        for group in candidates:
+            if any(file.cache_copy for file in group):
+                source, copy = group
+                if not (source.key and copy.key):
+                    continue
+                if source.size != copy.size or source.partial != copy.partial or (source.full and copy.full and source.full != copy.full):
+                    findings.append({
+                        "source_file_id": copy.file_id,
+                        "type": FileFindingType.CACHE_MISMATCH,
+                        "group_key": source.full or source.partial,
+                        "path": copy.path,
+                        "size": copy.size
+                    })
+            else:
+                for file in group:
+                    if file.key and file.full:
+                        duplicates[file.full][file.identity] = file
+        for full, files in duplicates.items():
+            if len(files) < 2:
+                continue
+            findings.extend({
+                "source_file_id": file.file_id,
+                "type": FileFindingType.DUPLICATE,
+                "group_key": full,
+                "path": file.path,
+                "size": file.size
+            } for file in files.values())
+        return findings
@@ -0,0 +1,341 @@
+import logging
+import os
+import select
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import select as sql_select
+
+from app.api.managers.media_cache_manager import MediaCacheManager
+from app.api.managers.media_merge_manager import MediaMergeManager
+from app.api.managers.media_scan_manager import MediaScanManager
+from app.core.database import MediaSessionLocal
+from app.core.settings import settings
+from app.models.media import FolderType, MediaFolderGroup, MediaScanDirectory
+from app.utils.inotify_utils import (
+    IN_ATTRIB, IN_CLOSE_WRITE, IN_CREATE, IN_DELETE, IN_DELETE_SELF, IN_IGNORED, IN_ISDIR, IN_MOVE_SELF,
+    IN_MOVED_FROM, IN_MOVED_TO, IN_ONLYDIR, IN_Q_OVERFLOW, IN_UNMOUNT, Inotify, InotifyEvent, WatchLimitError
+)
+from app.utils.media_utils import LibraryConfig, get_libraries
+
+logger = logging.getLogger(__name__)
+
+WATCH_MASK = (
+    IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE | IN_ATTRIB
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+
+
+class MediaWatcher:
+    """Background inotify watcher that keeps the media database current without rescans.
+
+    Watches every directory of the libraries on source storages, and the cache
+    and merge storages, if their types are in MEDIA_SCAN.WATCH_STORAGE_TYPES.
+    Changed directories are collected until nothing has changed for
+    WATCH_DEBOUNCE seconds (or for at most WATCH_MAX_DELAY), so a season pack
+    being unpacked is applied as one scan of its folder. The watcher's thread is
+    the only one applying them: library directories through MediaScanManager.scan,
+    and cache and merge directories by checking the copies and links recorded
+    below them, which are never scanned as libraries.
+
+    If the event queue overflows, the watched libraries get an incremental rescan;
+    if the watch limit is reached, they get one every WATCH_FALLBACK_INTERVAL.
+    """
+
+    def __init__(self) -> None:
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._wake_pipe: Optional[tuple] = None
+        self._inotify: Optional[Inotify] = None
+        self._paths: Dict[int, str] = {}  # Watch descriptor -> directory
+        self._mirrors: Dict[str, FolderType] = {}  # Base path of the watched cache and merge storages -> type
+        self._dirty: Set[str] = set()
+        self._rescan = False
+        self._first_change: Optional[float] = None
+        self._last_change: Optional[float] = None
+        self._last_fallback = 0.0
+        self.limited = False
+
+    @staticmethod
+    def watched_media_data() -> Dict[str, Any]:
+        """MEDIA_DATA with only the libraries on source storages, if those are watched
+
+        Libraries on cache and merge storages would be scanned as source items
+        of their own, so they are left out.
+        """
+        media_data = settings.MEDIA_DATA
+        storage = media_data.get("storage", {})
+        watch_sources = FolderType.SOURCE.value in settings.MEDIA_SCAN.WATCH_STORAGE_TYPES
+        return {
+            "storage": storage,
+            "libraries": {
+                name: library for name, library in media_data.get("libraries", {}).items()
+                if watch_sources
+                and storage.get(library.get("storage"), {}).get("type", FolderType.SOURCE.value) == FolderType.SOURCE.value
+            }
+        }
+
+    @staticmethod
+    def watched_mirrors() -> Dict[str, FolderType]:
+        """Base paths of the cache and merge storages to watch, by type in WATCH_STORAGE_TYPES"""
+        watched_types = set(settings.MEDIA_SCAN.WATCH_STORAGE_TYPES)
+        mirrors = {}
+        for folder_type, path in (
+            (FolderType.CACHE, MediaCacheManager.cache_path()), (FolderType.MERGE, MediaMergeManager.merge_path())
+        ):
+            if path and folder_type.value in watched_types and os.path.isdir(path):
+                mirrors[os.path.normpath(path)] = folder_type
+        return mirrors
+
+    def start(self) -> None:
+        """Start watching in the background, if enabled and there is anything to watch"""
+        if not settings.MEDIA_SCAN.WATCH:
+            return
+        media_data = self.watched_media_data()
+        try:
+            libraries = get_libraries(media_data)
+        except ValueError as e:
+            logger.error(f"Not watching media libraries: {str(e)}")
+            return
+        skipped = set(settings.MEDIA_DATA.get("libraries", {})) - set(media_data["libraries"])
+        if skipped and FolderType.SOURCE.value in settings.MEDIA_SCAN.WATCH_STORAGE_TYPES:
+            logger.warning(f"Not watching media libraries that aren't on source storages: {', '.join(sorted(skipped))}")
+        mirrors = self.watched_mirrors()
+        if not libraries and not mirrors:
+            logger.info("No media libraries or storages of watched storage types, not watching")
+            return
+        try:
+            self._inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify is not available, not watching media libraries: {str(e)}")
+            return
+
+        self._stopping.clear()
+        self._mirrors = mirrors
+        self._wake_pipe = os.pipe()
+        self._thread = threading.Thread(
+            target=self._run, args=(media_data, libraries), name="media-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching, waiting briefly for a running scan to finish"""
+        if not self._thread:
+            return
+        self._stopping.set()
+        os.write(self._wake_pipe[1], b"\0")
+        self._thread.join(timeout=30)
+        self._inotify.close()
+        for fd in self._wake_pipe:
+            os.close(fd)
+        self._thread = None
+        self._inotify = None
+        self._wake_pipe = None
+        self._paths.clear()
+        self._mirrors = {}
+
+    def _run(self, media_data: Dict[str, Any], libraries: List[LibraryConfig]) -> None:
+        # Catch up with changes made while not watching, watch everything the scan
+        # found, then catch up with changes made while the watches were added
+        self._scan(media_data)
+        self._watch_known(libraries)
+        self._watch_mirrors()
+        self._scan(media_data)
+        self._verify_mirrors(set(self._mirrors))
+        logger.info(f"Watching {len(self._paths)} media directories")
+
+        while not self._stopping.is_set():
+            readable, _, _ = select.select([self._inotify, self._wake_pipe[0]], [], [], self._timeout())
+            if self._inotify in readable:
+                self._handle(self._inotify.read())
+            if self._due():
+                self._flush(media_data, libraries)
+
+    def _scan(self, media_data: Dict[str, Any], directories: Optional[Set[str]] = None) -> None:
+        db = MediaSessionLocal()
+        try:
+            MediaScanManager(db).scan(media_data, directories=directories)
+            if MediaMergeManager.merge_path():
+                MediaMergeManager(db).build()
+        except Exception as e:
+            logger.error(f"Error applying media changes: {str(e)}", exc_info=True)
+        finally:
+            db.close()
+
+    def _verify_mirrors(self, directories: Set[str]) -> None:
+        """Uncache files whose cache copies changed and recreate merged links that are gone, below the directories"""
+        by_type: Dict[FolderType, Set[str]] = defaultdict(set)
+        for directory in directories:
+            by_type[self._mirrors[self._mirror_of(directory)]].add(directory)
+        db = MediaSessionLocal()
+        try:
+            title_ids = set()
+            if by_type[FolderType.CACHE]:
+                uncached = MediaCacheManager(db).verify_copies(by_type[FolderType.CACHE])
+                if uncached is None:
+                    # A cache run is copying, possibly for hours; check again later instead of waiting
+                    self._mark_dirty(by_type[FolderType.CACHE])
+                else:
+                    title_ids |= uncached
+            if by_type[FolderType.MERGE]:
+                title_ids |= MediaMergeManager(db).verify_links(by_type[FolderType.MERGE])
+            if title_ids and MediaMergeManager.merge_path():
+                MediaMergeManager(db).build(title_ids=title_ids)
+        except Exception as e:
+            logger.error(f"Error applying media changes: {str(e)}", exc_info=True)
+        finally:
+            db.close()
+
+    def _mark_dirty(self, directories: Set[str]) -> None:
+        """Apply changes in the directories at the next flush, one debounce interval from now"""
+        self._dirty |= directories
+        now = time.monotonic()
+        if self._first_change is None:
+            self._first_change = now
+        self._last_change = now
+
+    def _mirror_of(self, directory: str) -> Optional[str]:
+        """Base path of the watched cache or merge storage the directory is on, if any"""
+        return next(
+            (root for root in self._mirrors if directory == root or directory.startswith(root + os.sep)), None
+        )
+
+    def _add_watch(self, path: str) -> bool:
+        """Watch one directory, returning False once the watch limit is reached"""
+        try:
+            self._paths[self._inotify.add_watch(path, WATCH_MASK)] = path
+        except WatchLimitError:
+            if not self.limited:
+                logger.warning(
+                    f"inotify watch limit reached after {len(self._paths)} media directories; raise "
+                    f"fs.inotify.max_user_watches. Falling back to rescans every "
+                    f"{settings.MEDIA_SCAN.WATCH_FALLBACK_INTERVAL:.0f}s"
+                )
+                self.limited = True
+                self._last_fallback = time.monotonic()
+            return False
+        except OSError:
+            pass  # Gone already; its parent's events cover it
+        return True
+
+    def _watch_known(self, libraries: List[LibraryConfig]) -> None:
+        """Watch the library directories recorded by the last scan, without listing them"""
+        library_roots = {(str(library.storage_path), library.id) for library in libraries}
+        db = MediaSessionLocal()
+        try:
+            rows = db.execute(
+                sql_select(MediaFolderGroup.base_path, MediaScanDirectory.relative_path)
+                .join(MediaFolderGroup, MediaScanDirectory.folder_group_id == MediaFolderGroup.id)
+            ).all()
+        finally:
+            db.close()
+        for base_path, relative_path in rows:
+            if (base_path, relative_path.split(os.sep, 1)[0]) in library_roots:
+                if not self._add_watch(os.path.join(base_path, relative_path)):
+                    return
+
+    def _watch_mirrors(self) -> None:
+        """Watch the cache and merge storages; their directories aren't recorded by scans"""
+        for root in self._mirrors:
+            self._watch_tree(root)
+
+    def _watch_tree(self, path: str) -> None:
+        """Watch a new directory and everything below it"""
+        stack = [path]
+        while stack:
+            directory = stack.pop()
+            if not self._add_watch(directory):
+                return
+            try:
+                with os.scandir(directory) as entries:
+                    stack.extend(
+                        entry.path for entry in entries
+                        if not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False)
+                    )
+            except OSError:
+                continue
+
+    def _unwatch_tree(self, path: str) -> None:
+        """Stop watching a directory that moved, and everything below it"""
+        prefix = path + os.sep
+        for wd, directory in list(self._paths.items()):
+            if directory == path or directory.startswith(prefix):
+                self._inotify.remove_watch(wd)
+                del self._paths[wd]
+
+    def _handle(self, events: List[InotifyEvent]) -> None:
+        now = time.monotonic()
+        for event in events:
+            if event.mask & (IN_Q_OVERFLOW | IN_UNMOUNT):
+                logger.warning("inotify queue overflowed or a watched filesystem was unmounted; rescanning")
+                self._rescan = True
+            elif event.mask & IN_IGNORED:
+                self._paths.pop(event.wd, None)
+                continue
+            directory = self._paths.get(event.wd)
+            if directory is None:
+                continue
+            if event.mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # The parent directory gets the matching IN_DELETE / IN_MOVED_FROM
+                if event.mask & IN_MOVE_SELF:
+                    self._unwatch_tree(directory)
+                continue
+            if event.name.startswith("."):
+                continue  # Hidden and temporary files, e.g. partial downloads
+
+            self._dirty.add(directory)
+            if event.mask & IN_ISDIR:
+                child = os.path.join(directory, event.name)
+                if event.mask & (IN_CREATE | IN_MOVED_TO):
+                    self._watch_tree(child)
+                elif event.mask & IN_MOVED_FROM:
+                    self._unwatch_tree(child)
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = now
+        if self._rescan and self._first_change is None:
+            self._first_change = self._last_change = now
+
+    def _deadline(self) -> Optional[float]:
+        deadlines = []
+        if self._first_change is not None:
+            deadlines.append(min(
+                self._last_change + settings.MEDIA_SCAN.WATCH_DEBOUNCE,
+                self._first_change + settings.MEDIA_SCAN.WATCH_MAX_DELAY
+            ))
+        if self.limited:
+            deadlines.append(self._last_fallback + settings.MEDIA_SCAN.WATCH_FALLBACK_INTERVAL)
+        return min(deadlines) if deadlines else None
+
+    def _timeout(self) -> Optional[float]:
+        deadline = self._deadline()
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def _due(self) -> bool:
+        deadline = self._deadline()
+        return deadline is not None and deadline <= time.monotonic()
+
+    def _flush(self, media_data: Dict[str, Any], libraries: List[LibraryConfig]) -> None:
+        """Apply the collected changes, or rescan if events were lost"""
+        dirty, self._dirty = self._dirty, set()
+        self._first_change = self._last_change = None
+        rescan = self._rescan or (self.limited and time.monotonic() >= self._last_fallback + settings.MEDIA_SCAN.WATCH_FALLBACK_INTERVAL)
+        self._rescan = False
+        if rescan:
+            self._last_fallback = time.monotonic()
+            self._scan(media_data)
+            self._watch_known(libraries)
+            self._watch_mirrors()
+            self._verify_mirrors(set(self._mirrors))
+        elif dirty:
+            mirrored = {directory for directory in dirty if self._mirror_of(directory)}
+            if dirty - mirrored:
+                logger.info(f"Applying changes in {len(dirty - mirrored)} media directories")
+                self._scan(media_data, directories=dirty - mirrored)
+            if mirrored:
+                self._verify_mirrors(mirrored)
+
+
+media_watcher = MediaWatcher()
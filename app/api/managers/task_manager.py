@@ -1,20 +1,29 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
+import asyncio
+import json
 from datetime import datetime
-import httpx
-from urllib.parse import urlparse
 from enum import Enum
 import logging
+import threading
+import httpx
+from starlette.concurrency import run_in_threadpool
 
 from app.core.settings import settings
-from app.models.event_types import SubEventType
+from app.core.agent_client import agent_clients, agent_base_url
+from app.api.managers.agent_manager import AgentManager, AgentStatus, get_agent_status
+from app.models.event_types import EventType, SubEventType, Status
 from app.models.task import Task
 from app.scheduler import add_task, remove_task, TaskConfig, run_task_now
+from app.utils.process_utils import get_run
 from app.api.managers.event_manager import EventManager
 from app.utils.time_utils import get_current_time, format_datetime
 
 logger = logging.getLogger(__name__)
 
+# Fan-out parent events are read and rewritten both by the dispatch and by agents ending their runs
+_fan_out_lock = threading.Lock()
+
 class TaskStatus(str, Enum):
     CREATED = "created"
     UPDATED = "updated"
@@ -46,6 +55,7 @@ class TaskManager:
         task_type: str = "external", 
         enabled: bool = True,
         host_url: str = None,
+        host_group: str = None,
         hours: int = None,
         minutes: int = None,
         seconds: int = None,
@@ -64,6 +74,7 @@ class TaskManager:
             task_type: Type of task ("interval", "cron", or "external"/"manual")
             enabled: Whether the task is enabled (default: True)
             host_url: Host URL associated with the task (optional)
+            host_group: Host group to fan the task out to instead of host_url (optional)
             hours: Hours for interval scheduling (only used if task_type is "interval")
             minutes: Minutes for interval scheduling (only used if task_type is "interval")
             seconds: Seconds for interval scheduling (only used if task_type is "interval")
@@ -109,6 +120,9 @@ class TaskManager:
             if existing_task.host_url != host_url:
                 existing_task.host_url = host_url
                 task_updated = True
+            if existing_task.host_group != host_group:
+                existing_task.host_group = host_group
+                task_updated = True
             
             # Update scheduling based on task type
             if task_type == "external_interval":
@@ -149,6 +163,7 @@ class TaskManager:
             task_type=task_type,
             function_name=task_id,
             host_url=host_url,
+            host_group=host_group,
             hours=hours if task_type == "interval" else hours,
             minutes=minutes if task_type == "interval" else minutes,
             seconds=seconds if task_type == "interval" else seconds,
@@ -193,6 +208,7 @@ class TaskManager:
                 task_type=task_type,
                 enabled=task_data.get("enabled", False),
                 host_url=task_data.get("host_url", None),
+                host_group=task_data.get("host_group", None),
                 hours=task_data.get("hours", 0),
                 minutes=task_data.get("minutes", 0),
                 seconds=task_data.get("seconds", 0),
@@ -220,7 +236,10 @@ class TaskManager:
                 "host_url": task.host_url,
                 "last_start_time": task.last_start_time.strftime("%Y-%m-%d %H:%M:%S") if task.last_start_time else None,
                 "last_end_time": task.last_end_time.strftime("%Y-%m-%d %H:%M:%S") if task.last_end_time else None,
-                "last_status": task.last_status
+                "last_status": task.last_status,
+                "running": get_run(task.task_id) is not None,
+                "host_group": task.host_group,
+                "host_status": get_agent_status(task.host_url) if task.host_url else None
             }
 
             # Add schedule information based on task type
@@ -252,47 +271,271 @@ class TaskManager:
         
         return {"status": "success", "enabled": enabled}
 
-    def run_task(self, task_id: str) -> Dict:
-        """Run a task immediately"""
-        task = self.db.query(Task).filter(Task.task_id == task_id).first()
-        if not task:
-            raise ValueError("Task not found")
+    async def run_task(self, task_id: str) -> Dict:
+        """Run a task immediately.
+        
+        Local tasks run in a worker thread. Remote tasks are fire-and-acknowledge:
+        the agent only has to accept the request, and reports progress back
+        through the /start and /end endpoints. Tasks with a host_group are fanned
+        out to every agent in the group. Database work runs in the threadpool too,
+        so only the requests to agents are awaited on the event loop.
+        """
+        task_type, host_url, host_group = await run_in_threadpool(self._mark_requested, task_id)
+        remote = task_type in ["external", "external_interval", "external_cron"]
         
         try:
-            # Update task status to running
-            task.last_start_time = datetime.now()
-            task.last_status = "requested"
-            self.db.commit()
-            
+            if host_group and remote:
+                return await self._fan_out_task(task_id, host_group)
+
             # If task has host URL and is external/cron/interval, send request to that host
-            if task.host_url and task.task_type in ["external", "external_interval", "external_cron"]:
+            if host_url and remote:
+                # Fail fast rather than waiting on a connect timeout to a known-dead agent
+                if get_agent_status(host_url) == AgentStatus.DOWN:
+                    raise ValueError(f"Agent {agent_base_url(host_url)} is down")
+                
                 try:
-                    # Parse the URL properly to handle schemes and ports
-                    parsed_url = urlparse(task.host_url)
-                    host = parsed_url.hostname
-                    port = str(parsed_url.port) if parsed_url.port else "4810"  # Default to 4810 if no port specified
-                    
-                    # Send request to the task's endpoint
-                    with httpx.Client(timeout=30.0) as client:
-                        response = client.post(f"http://{host}:{port}/api/tasks/{task_id}/run")
-                        if response.status_code != 200:
-                            raise ValueError(f"Remote task execution failed: {response.text}")
+                    response = await agent_clients.post(host_url, f"/api/tasks/{task_id}/run")
+                    if not response.is_success:
+                        raise ValueError(f"Remote task execution failed: {response.text}")
                 except Exception as e:
-                    task.last_status = "error"
-                    task.last_end_time = datetime.now()
-                    self.db.commit()
+                    if isinstance(e, httpx.TransportError):
+                        # Count unreachable agents towards their health state
+                        await run_in_threadpool(AgentManager(self.db).record_probe, host_url, False)
                     raise ValueError(f"Failed to execute remote task: {str(e)}")
+                
+                return {"status": "success", "message": f"Task {task_id} requested on {agent_base_url(host_url)}"}
             else:
-                # Run task locally
-                run_task_now(task_id)
+                # Run task locally without blocking the event loop
+                await run_in_threadpool(run_task_now, task_id)
             
             return {"status": "success", "message": f"Task {task_id} started"}
         except Exception as e:
             # Update task status to error
+            await run_in_threadpool(self._mark_failed, task_id)
+            raise ValueError(str(e))
+
+    def _mark_requested(self, task_id: str) -> Tuple[str, Optional[str], Optional[str]]:
+        """Record that a run was requested, returning the task's type, host URL and host group"""
+        task = self.get_task(task_id)
+        if not task:
+            raise ValueError("Task not found")
+        task.last_start_time = datetime.now()
+        task.last_status = "requested"
+        self.db.commit()
+        return task.task_type, task.host_url, task.host_group
+
+    def _mark_failed(self, task_id: str) -> None:
+        task = self.get_task(task_id)
+        if task:
             task.last_status = "error"
             task.last_end_time = datetime.now()
             self.db.commit()
-            raise ValueError(str(e))
+
+    async def _dispatch_to_agent(self, task_id: str, host_url: str, semaphore: asyncio.Semaphore, parent_event_id: int) -> Tuple[bool, str, bool]:
+        """Request a task run on one agent of a fan-out, returning (success, message, unreachable)"""
+        if get_agent_status(host_url) == AgentStatus.DOWN:
+            return False, "Agent is down", False
+        async with semaphore:
+            try:
+                response = await agent_clients.post(
+                    host_url,
+                    f"/api/tasks/{task_id}/run",
+                    params={"parent_event_id": parent_event_id}
+                )
+            except httpx.TransportError as e:
+                return False, f"Agent unreachable: {str(e) or type(e).__name__}", True
+            except Exception as e:
+                return False, str(e), False
+        if not response.is_success:
+            return False, f"Agent returned {response.status_code}: {response.text}", False
+        return True, "Requested", False
+
+    async def _fan_out_task(self, task_id: str, host_group: str) -> Dict:
+        """Dispatch a task to every agent in its host group.
+
+        Agents are requested concurrently, at most AGENTS.FANOUT_CONCURRENCY at a
+        time. The run is recorded as a parent event with one child event per
+        host; the parent's status is success, warning (partial failure) or error.
+        Agents report the end of their runs as further children, which update
+        the parent's status and summary (see update_fan_out_event).
+
+        Args:
+            task_id: The task to dispatch
+            host_group: Name of its host group
+
+        Returns:
+            Dict: Overall status, the parent event ID and per-host results
+
+        Raises:
+            ValueError: If the host group is empty or every dispatch failed
+        """
+        hosts, parent_event_id = await run_in_threadpool(self._start_fan_out, task_id, host_group)
+
+        semaphore = asyncio.Semaphore(max(1, settings.AGENTS.FANOUT_CONCURRENCY))
+        outcomes = await asyncio.gather(
+            *(self._dispatch_to_agent(task_id, host_url, semaphore, parent_event_id) for host_url in hosts)
+        )
+
+        results = []
+        for host_url, (success, message, _) in zip(hosts, outcomes):
+            if not success:
+                logger.warning(f"Failed to dispatch task {task_id} to {host_url}: {message}")
+            results.append({"host_url": host_url, "success": success, "message": message})
+        unreachable = [host_url for host_url, (_, _, host_unreachable) in zip(hosts, outcomes) if host_unreachable]
+        status, summary = await run_in_threadpool(
+            self._record_fan_out, task_id, host_group, parent_event_id, results, unreachable
+        )
+        failed = [result["host_url"] for result in results if not result["success"]]
+
+        if status == Status.ERROR:
+            errors = "; ".join(f"{result['host_url']}: {result['message']}" for result in results)
+            raise ValueError(f"{summary}: {errors}")
+
+        return {
+            "status": "success" if status == Status.SUCCESS else "partial",
+            "message": summary,
+            "event_id": parent_event_id,
+            "failed_hosts": failed,
+            "results": results
+        }
+
+    def _start_fan_out(self, task_id: str, host_group: str) -> Tuple[List[str], int]:
+        """Resolve the host group and create the fan-out's parent event, returning the hosts and its ID"""
+        hosts = AgentManager(self.db).resolve_host_group(host_group)
+        if not hosts:
+            raise ValueError(f"Host group {host_group} has no agents")
+
+        parent_event = self.event_manager.add_event(
+            type=EventType.TASK,
+            sub_type=task_id,
+            status=Status.INFO,
+            description=f"Task {task_id} dispatching to host group {host_group}",
+            details=json.dumps({"host_group": host_group, "hosts": hosts})
+        )
+        return hosts, parent_event.id
+
+    def _record_fan_out(
+        self, task_id: str, host_group: str, parent_event_id: int, results: List[Dict], unreachable: List[str]
+    ) -> Tuple[str, str]:
+        """Record each host's dispatch as a child event and the outcome on the parent, returning its status and summary"""
+        agent_manager = AgentManager(self.db)
+        for host_url in unreachable:
+            agent_manager.record_probe(host_url, healthy=False)
+        for result in results:
+            self.event_manager.add_event(
+                type=EventType.TASK,
+                sub_type=task_id,
+                status=Status.SUCCESS if result["success"] else Status.ERROR,
+                description=f"Task {task_id} on {result['host_url']}: {result['message']}",
+                details=result["message"],
+                parent_id=parent_event_id
+            )
+
+        failed = [result["host_url"] for result in results if not result["success"]]
+        if not failed:
+            status = Status.SUCCESS
+        elif len(failed) < len(results):
+            status = Status.WARNING
+        else:
+            status = Status.ERROR
+        summary = f"Task {task_id} requested on {len(results) - len(failed)}/{len(results)} hosts in group {host_group}"
+
+        with _fan_out_lock:
+            # Fast agents may already have ended their runs, keep what they reported
+            parent_event = self.event_manager.get_event(parent_event_id)
+            details = json.loads(parent_event.details)
+            details.update(failed=failed, results=results)
+            self._write_fan_out_event(parent_event_id, task_id, details)
+        return status, summary
+
+    def update_fan_out_event(self, parent_id: int, task_id: str, status: str, host_url: Optional[str] = None) -> None:
+        """Record the end of an agent's run on its fan-out parent event and recompute the parent's status and summary
+
+        Args:
+            parent_id: The parent event the agent was given
+            task_id: The task that ended
+            status: The run's status (success, error or cancelled)
+            host_url: The agent that ran it; without it, the run is attributed
+                to the first dispatched host whose run hasn't ended yet
+        """
+        with _fan_out_lock:
+            parent_event = self.event_manager.get_event(parent_id)
+            if not parent_event or not parent_event.details:
+                return
+            try:
+                details = json.loads(parent_event.details)
+            except ValueError:
+                return
+            if not isinstance(details, dict) or "hosts" not in details:
+                return  # Not a fan-out parent
+
+            runs = details.setdefault("runs", {})
+            host = agent_base_url(host_url) if host_url else None
+            if host not in details["hosts"]:
+                failed = details.get("failed", [])
+                host = next((host for host in details["hosts"] if host not in runs and host not in failed), None)
+            if host is None:
+                logger.warning(f"Task {task_id} ended on {host_url} which isn't in fan-out event {parent_id}")
+                return
+            runs[host] = status
+            self._write_fan_out_event(parent_id, task_id, details)
+
+    def _write_fan_out_event(self, parent_id: int, task_id: str, details: Dict) -> None:
+        """Set a fan-out parent's status and summary from its hosts' dispatches and runs, and store its details
+
+        A host failed if its dispatch failed or its run ended in error or was
+        cancelled. The parent is an error when every host failed, a warning when
+        some did, and otherwise a success, including while runs are in progress.
+        """
+        hosts = details["hosts"]
+        runs = details.get("runs", {})
+        dispatched = {result["host_url"]: result["success"] for result in details.get("results", [])}
+
+        succeeded = sum(1 for host in hosts if runs.get(host) == Status.SUCCESS)
+        failed = sum(
+            1 for host in hosts
+            if runs.get(host) in (Status.ERROR, Status.CANCELLED) or (host not in runs and dispatched.get(host) is False)
+        )
+        running = len(hosts) - succeeded - failed
+        host_group = details.get("host_group")
+
+        if failed == len(hosts):
+            status = Status.ERROR
+        elif failed:
+            status = Status.WARNING
+        else:
+            status = Status.SUCCESS if dispatched or runs else Status.INFO
+        if runs:
+            summary = (
+                f"Task {task_id} succeeded on {succeeded}/{len(hosts)} hosts in group {host_group}, "
+                f"{failed} failed, {running} running"
+            )
+        elif dispatched:
+            summary = f"Task {task_id} requested on {len(hosts) - failed}/{len(hosts)} hosts in group {host_group}"
+        else:
+            summary = f"Task {task_id} dispatching to host group {host_group}"
+
+        self.event_manager.update_event(parent_id, status=status, description=summary, details=json.dumps(details))
+
+    def cancel_task(self, task_id: str) -> Dict:
+        """Cancel a running task, terminating its whole process tree.
+        
+        Args:
+            task_id: The ID of the task to cancel
+            
+        Returns:
+            Dict: Status of the cancellation
+            
+        Raises:
+            ValueError: If the task is not currently running on this server
+        """
+        run = get_run(task_id)
+        if not run:
+            raise ValueError(f"Task {task_id} is not running")
+        
+        if not run.cancel("cancelled by user"):
+            return {"status": "success", "message": f"Task {task_id} is already being cancelled"}
+        return {"status": "success", "message": f"Task {task_id} cancelled"}
 
     def update_task_status(self, task_id: str, status: str) -> None:
         """Update task status and timestamps"""
@@ -348,8 +591,8 @@ class TaskManager:
         Raises:
             ValueError: If the task is not found or status is invalid
         """
-        if status not in ["success", "error"]:
-            raise ValueError("Status must be either 'success' or 'error'")
+        if status not in ["success", "error", "cancelled"]:
+            raise ValueError("Status must be one of 'success', 'error' or 'cancelled'")
             
         task = self.get_task(task_id)
         if not task:
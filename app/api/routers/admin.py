@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.core.settings import reload_settings
+
+from app.utils.profiler import DEFAULT_INTERVAL, FORMAT_COLLAPSED, FORMAT_SPEEDSCOPE, MAX_DURATION, SamplingProfiler
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Only one on-demand profile at a time; overlapping samplers would skew each other
+_profile_lock = asyncio.Lock()
+
+@router.get("/profile")
+async def profile_process(
+    seconds: float = Query(10, gt=0, le=MAX_DURATION, description="How long to sample for"),
+    interval: float = Query(DEFAULT_INTERVAL, ge=0.001, le=1, description="Seconds between samples"),
+    format: str = Query(FORMAT_SPEEDSCOPE, pattern=f"^({FORMAT_SPEEDSCOPE}|{FORMAT_COLLAPSED})$"),
+    include_idle: bool = Query(False, description="Include threads that are waiting for work")
+):
+    """Sample the running process's stacks and return a speedscope profile or collapsed stacks"""
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already being recorded")
+    
+    async with _profile_lock:
+        logger.info(f"Profiling for {seconds}s at {interval}s intervals")
+        profiler = SamplingProfiler(interval=interval, include_idle=include_idle).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+    
+    name = f"medialab-manager {datetime.now():%Y-%m-%d %H:%M:%S}"
+    content, media_type = profiler.export(format, name)
+    extension = "speedscope.json" if format == FORMAT_SPEEDSCOPE else "folded"
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{datetime.now():%Y%m%d-%H%M%S}.{extension}"',
+            "X-Profile-Samples": str(profiler.samples)
+        }
+    )
+
+@router.post("/reload-config")
+def reload_config(db: Session = Depends(get_db)):
+    """Re-read config.json and the tasks file, and sync task definitions to the database"""
+    from app.api.managers.task_manager import TaskManager
+    try:
+        settings = reload_settings()
+        TaskManager.sync_tasks_from_config(db)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid configuration: {str(e)}")
+    logger.info(f"Reloaded configuration with {len(settings.TASKS)} tasks")
+    return {"tasks": len(settings.TASKS)}
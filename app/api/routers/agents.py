@@ -0,0 +1,31 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.api.managers.agent_manager import AgentManager
+from app.schemas.agent import AgentHeartbeatAPIRequest
+
+router = APIRouter()
+
+@router.get("/")
+def list_agents_endpoint(db: Session = Depends(get_db)):
+    """List all registered agents and their last reported state"""
+    agent_manager = AgentManager(db)
+    return agent_manager.list_agents()
+
+@router.post("/heartbeat")
+def agent_heartbeat_endpoint(request: AgentHeartbeatAPIRequest, db: Session = Depends(get_db)):
+    """Record a heartbeat from an agent, registering it if it is new"""
+    agent_manager = AgentManager(db)
+    try:
+        agent = agent_manager.record_heartbeat(
+            host_url=request.host_url,
+            name=request.name,
+            version=request.version,
+            load=request.load,
+            running_tasks=request.running_tasks,
+            groups=request.groups
+        )
+        return {"status": "success", "host_url": agent.host_url}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.database import get_db
+from app.api.managers.disk_health_manager import DiskHealthManager
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+_collect_lock = asyncio.Lock()
+
+@router.get("")
+def get_disk_status(db: Session = Depends(get_db)):
+    """Latest capacity of every storage with its forecast, and the latest I/O and SMART health of every disk"""
+    return DiskHealthManager(db).status()
+
+@router.post("/collect")
+async def collect_disk_stats(db: Session = Depends(get_db)):
+    """Sample storage capacity, disk I/O and SMART health now, without waking sleeping disks"""
+    if _collect_lock.locked():
+        raise HTTPException(status_code=409, detail="A disk health collection is already running")
+
+    async with _collect_lock:
+        return await run_in_threadpool(DiskHealthManager(db).collect)
+
+@router.get("/storages/{storage}/history")
+def get_storage_history(
+    storage: str, days: int = Query(30, ge=1, le=3650, description="History to return"), db: Session = Depends(get_db)
+):
+    """Capacity samples of a storage, oldest first, with the trend fitted to them"""
+    manager = DiskHealthManager(db)
+    samples = manager.history(storage, days=days)
+    if not samples:
+        raise HTTPException(status_code=404, detail=f"No samples of storage {storage}")
+    return {"storage": storage, "samples": samples, "forecast": manager.forecasts([storage], days=days).get(storage)}
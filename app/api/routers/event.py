@@ -1,17 +1,72 @@
 """Event management router."""
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from datetime import date, datetime
 import json
 
 from app.core.database import get_db
-from app.schemas.event import EventCreate, Event as EventSchema, EventFilter
+from app.schemas.event import EventCreate, EventBatchItem, Event as EventSchema, EventFilter
 from app.api.managers.event_manager import EventManager
+from app.core.settings import settings
+from app.utils.attachment_utils import AttachmentTooLargeError, iter_attachment, spool_attachment, sniff_mime_type, tail_attachment
+from app.utils.compression_utils import can_pass_through
 from app.utils.file_utils import AttachDataMimeType
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+
+def _attachment_mime_type(attachment: UploadFile, attachment_data: bytes, attachment_type: Optional[str] = None) -> str:
+    """Use the provided attachment_type if specified, otherwise determine MIME type from file extension or content"""
+    return sniff_mime_type(
+        attachment_data[:settings.ATTACHMENTS.SNIFF_SIZE],
+        filename=attachment.filename,
+        content_type=attachment.content_type,
+        attachment_type=attachment_type
+    )
+
+def _event_response(event) -> dict:
+    """Event fields for a response, without loading the (deferred) attachment data"""
+    return {
+        "id": event.id,
+        "timestamp": event.timestamp,
+        "type": event.type,
+        "sub_type": event.sub_type,
+        "status": event.status,
+        "description": event.description,
+        "details": event.details,
+        "has_attachment": event.has_attachment,
+        "attachment_mime_type": event.attachment_mime_type,
+        "parent_id": event.parent_id
+    }
+
+async def _iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+    """Parse a streamed NDJSON body one line at a time"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
+
+async def _iter_list(items: List[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+def _parse_events_document(data: bytes) -> List[Any]:
+    """Parse a buffered batch given either as a JSON array or as NDJSON"""
+    if data.lstrip().startswith(b"["):
+        return json.loads(data)
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
 @router.post("/", response_model=EventSchema)
 def create_event(
     event: EventCreate,
@@ -38,65 +93,165 @@ async def add_event(
     attachment_type: Optional[str] = Form(None),
     db: Session = Depends(get_db)
 ):
-    """Add a new event with optional file attachment"""
+    """Add a new event with optional file attachment.
+
+    The attachment is streamed in chunks (hashed, size-limited and optionally
+    compressed) straight into the event's blob rather than read into memory.
+    """
     event_manager = EventManager(db)
     
-    # Handle attachment if provided
-    attachment_data = None
-    attachment_mime_type = None
+    if not attachment:
+        event = event_manager.add_event_with_output(
+            type=type,
+            sub_type=sub_type,
+            status=status,
+            description=description,
+            details=details
+        )
+        if not event:
+            raise HTTPException(status_code=500, detail="Failed to create event")
+        return _event_response(event)
     
-    if attachment:
-        try:
-            attachment_data = await attachment.read()
-            
-            # Use provided attachment_type if specified, otherwise determine MIME type from file extension or content
-            if attachment_type:
-                attachment_mime_type = attachment_type
-            elif attachment.content_type:
-                attachment_mime_type = attachment.content_type
-            else:
-                # Try to determine MIME type from filename
-                filename = attachment.filename.lower() if attachment.filename else ""
-                if filename.endswith('.txt') or filename.endswith('.log'):
-                    attachment_mime_type = "text/plain"
-                elif filename.endswith('.json'):
-                    attachment_mime_type = "application/json"
-                elif filename.endswith('.md') or filename.endswith('.markdown'):
-                    attachment_mime_type = "text/markdown"
-                elif filename.endswith('.html') or filename.endswith('.htm'):
-                    attachment_mime_type = "text/html"
-                elif filename.endswith('.sh') or filename.endswith('.bash'):
-                    attachment_mime_type = "text/x-shellscript"
-                else:
-                    # Try to detect text content by attempting to decode as UTF-8
-                    try:
-                        content_str = attachment_data.decode('utf-8')
-                        # If it's valid UTF-8 and looks like text, treat as text/plain
-                        if content_str.isprintable() or '\n' in content_str:
-                            attachment_mime_type = "text/plain"
-                        else:
-                            attachment_mime_type = "application/octet-stream"
-                    except UnicodeDecodeError:
-                        # If it can't be decoded as UTF-8, it's likely binary
-                        attachment_mime_type = "application/octet-stream"
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error reading attachment: {str(e)}")
-    
-    # Create the event using the manager
-    event = event_manager.add_event_with_output(
-        type=type,
-        sub_type=sub_type,
-        status=status,
-        description=description,
-        details=details,
-        attachment_data=attachment_data,
-        attachment_mime_type=attachment_mime_type
-    )
+    # Handle attachment: file IO and blob writes run in a worker thread
+    try:
+        spooled = await run_in_threadpool(
+            spool_attachment,
+            attachment.file,
+            filename=attachment.filename,
+            content_type=attachment.content_type,
+            attachment_type=attachment_type
+        )
+    except AttachmentTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error reading attachment: {str(e)}")
+    
+    try:
+        event = await run_in_threadpool(
+            event_manager.add_event_with_spooled_attachment,
+            type=type,
+            sub_type=sub_type,
+            status=status,
+            description=description,
+            details=details,
+            attachment=spooled
+        )
+    finally:
+        spooled.close()
     
     if not event:
         raise HTTPException(status_code=500, detail="Failed to create event")
     
-    return event
+    return _event_response(event)
+
+@router.post("/batch")
+async def add_events_batch(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Add many events in a single transaction.
+
+    The body is a JSON array, an NDJSON stream (application/x-ndjson) that is
+    parsed as it arrives, or multipart form data with an "events" part plus
+    attachment parts that events reference by name in their "attachment" field.
+    The whole batch is read and validated before it is inserted, off the event
+    loop, so no write transaction is held while waiting for the client.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    form = None
+
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        events_part = form.get("events")
+        if events_part is None:
+            raise HTTPException(status_code=400, detail="Multipart batch requires an 'events' part")
+        data = await events_part.read() if hasattr(events_part, "read") else events_part.encode()
+        try:
+            items = _iter_list(_parse_events_document(data))
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid events part: {str(e)}")
+    elif content_type in NDJSON_CONTENT_TYPES:
+        items = _iter_ndjson(request.stream())
+    else:
+        try:
+            body = json.loads(await request.body())
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Batch body must be a JSON array of events")
+        items = _iter_list(body)
+
+    rows: List[Dict[str, Any]] = []
+    index = 0
+    try:
+        async for item in items:
+            try:
+                event = EventBatchItem.model_validate(item)
+            except ValidationError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid event at index {index}: {str(e)}")
+
+            row = event.model_dump(exclude={"attachment", "attachment_type"})
+            if event.attachment:
+                attachment = form.get(event.attachment) if form is not None else None
+                if attachment is None or not hasattr(attachment, "read"):
+                    raise HTTPException(status_code=400, detail=f"Attachment part '{event.attachment}' not found for event at index {index}")
+                row["attachment_data"] = await attachment.read(settings.ATTACHMENTS.MAX_SIZE + 1)
+                if len(row["attachment_data"]) > settings.ATTACHMENTS.MAX_SIZE:
+                    raise HTTPException(status_code=413, detail=str(AttachmentTooLargeError(settings.ATTACHMENTS.MAX_SIZE)))
+                row["attachment_mime_type"] = _attachment_mime_type(attachment, row["attachment_data"], event.attachment_type)
+            rows.append(row)
+            index += 1
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON at index {index}: {str(e)}")
+
+    try:
+        ids = await run_in_threadpool(_insert_events, db, rows)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to add events: {str(e)}")
+
+    return {"status": "success", "count": len(ids), "ids": ids}
+
+def _insert_events(db: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    """Insert a batch as one transaction, rolling it back if any chunk fails"""
+    try:
+        return EventManager(db).add_events(rows)
+    except Exception:
+        db.rollback()
+        raise
+
+def _parse_stats_date(value: Optional[str], name: str) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} format")
+
+@router.get("/stats")
+def get_event_stats(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    bucket: str = Query("day", description="day, week, month, year or total"),
+    group_by: Optional[str] = Query(None, description="Comma-separated fields to count separately: type, sub_type, status"),
+    type: Optional[str] = None,
+    sub_type: Optional[str] = None,
+    status: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Count events per time bucket from the pre-aggregated daily statistics"""
+    fields = [field.strip() for field in group_by.split(",") if field.strip()] if group_by else []
+    try:
+        return EventManager(db).get_event_stats(
+            start_date=_parse_stats_date(start_date, "start_date"),
+            end_date=_parse_stats_date(end_date, "end_date"),
+            bucket=bucket,
+            group_by=fields,
+            type=type,
+            sub_type=sub_type,
+            status=status
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{event_id}", response_model=EventSchema)
 def get_event(
@@ -108,7 +263,9 @@ def get_event(
     event = event_manager.get_event(event_id)
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
-    return event
+    response = _event_response(event)
+    response["attachment_data"] = event_manager.get_attachment_data(event)
+    return response
 
 @router.get("/", response_model=List[EventSchema])
 def list_events(
@@ -150,44 +307,111 @@ def list_events(
     
     return events_json
 
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=start-end" range into inclusive offsets.
+
+    Returns None for headers we don't handle (multiple ranges, other units),
+    in which case the full content is sent.
+
+    Raises:
+        HTTPException: 416 if the range cannot be satisfied
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec or "-" not in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
 @router.get("/{event_id}/attachment")
 def get_event_attachment(
     event_id: int,
+    request: Request,
+    tail: Optional[int] = Query(None, ge=1, description="Return only the last N lines"),
     db: Session = Depends(get_db)
 ):
-    """Get the attachment content for a specific event"""
+    """Get the attachment content for a specific event.
+
+    Content is streamed from the database rather than loaded into memory.
+    Supports single byte ranges (Range), the last N lines (?tail=N, with the
+    byte offset of the first line in X-Tail-Offset) and conditional requests
+    with ETag/If-None-Match, since attachments never change. Attachments stored
+    gzip or zstd compressed are sent as-is, with a Content-Encoding header, to
+    clients that accept that encoding.
+    """
     event_manager = EventManager(db)
     event = event_manager.get_event(event_id)
     
     if not event:
         raise HTTPException(status_code=404, detail="Event not found")
-        
-    if not event.has_attachment or not event.attachment_data:
+    
+    stored_size, header = event_manager.get_attachment_header(event_id)
+    if not event.has_attachment or not stored_size:
         raise HTTPException(status_code=404, detail="Event has no attachment")
-        
-    # For text-based content, return as JSON
-    if event.attachment_mime_type and event.attachment_mime_type.startswith(('text/', 'application/json', 'application/xml')):
+    
+    mime_type = event.attachment_mime_type or 'application/octet-stream'
+    codec = event.attachment_codec
+    size = event.attachment_size if event.attachment_size is not None else stored_size
+    etag = f'"{event.attachment_sha256}"' if event.attachment_sha256 else f'W/"event-{event_id}-{stored_size}"'
+    headers = {'Accept-Ranges': 'bytes', 'Vary': 'Accept-Encoding'}
+    if not mime_type.startswith(('text/', 'application/json', 'application/xml')):
+        headers['Content-Disposition'] = f'attachment; filename="event_{event_id}_attachment"'
+    
+    if tail:
+        offset, content = tail_attachment(event_id, codec, tail, size=event.attachment_size)
+        headers.update({'X-Tail-Offset': str(offset), 'X-Total-Size': str(size)})
+        return Response(content=content, media_type=mime_type, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    byte_range = _parse_range(range_header, size) if range_header and (not if_range or if_range == etag) else None
+    if byte_range:
+        start, end = byte_range
+        headers.update({
+            'ETag': etag,
+            'Content-Range': f'bytes {start}-{end}/{size}',
+            'Content-Length': str(end - start + 1)
+        })
+        return StreamingResponse(iter_attachment(event_id, codec, start, end), status_code=206, media_type=mime_type, headers=headers)
+    
+    accepted_encodings = [
+        encoding.split(";")[0].strip().lower()
+        for encoding in request.headers.get("accept-encoding", "").split(",")
+    ]
+    passthrough = not mime_type.startswith('application/json') and can_pass_through(header, codec, accepted_encodings)
+    if passthrough:
+        # Each encoding is a different representation, so it gets its own ETag
+        etag = f'{etag[:-1]}-{codec}"'
+    headers['ETag'] = etag
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    if passthrough:
+        headers.update({'Content-Encoding': codec, 'Content-Length': str(stored_size)})
+        return StreamingResponse(iter_attachment(event_id), media_type=mime_type, headers=headers)
+    
+    # JSON attachments are wrapped in a JSON response
+    if mime_type.startswith('application/json'):
         try:
-            content = event.attachment_data.decode('utf-8')
-            if event.attachment_mime_type.startswith('application/json'):
-                # Only wrap JSON content in a JSON response
-                return {"content": content}
-            # Return plain text directly
-            return Response(
-                content=content,
-                media_type=event.attachment_mime_type
-            )
+            return JSONResponse({"content": event_manager.get_attachment_data(event).decode('utf-8')}, headers=headers)
         except UnicodeDecodeError:
             raise HTTPException(status_code=400, detail="Attachment content is not readable text")
     
-    # For binary content, return as file download
-    return Response(
-        content=event.attachment_data,
-        media_type=event.attachment_mime_type or 'application/octet-stream',
-        headers={
-            'Content-Disposition': f'attachment; filename="event_{event_id}_attachment"'
-        }
-    )
+    headers['Content-Length'] = str(size)
+    return StreamingResponse(iter_attachment(event_id, codec), media_type=mime_type, headers=headers)
 
 @router.get("/{event_id}/details")
 def get_event_details(
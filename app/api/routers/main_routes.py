@@ -26,35 +26,7 @@ async def get_events(
     db: Session = Depends(get_db)
 ):
     try:
-        # Convert query parameters to filter
-        filter_params = {}
-        if type:
-            filter_params["type"] = type.lower()
-        if sub_type:
-            filter_params["sub_type"] = sub_type.lower()
-        if start_date:
-            try:
-                filter_params["start_date"] = datetime.fromisoformat(start_date)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid start_date format")
-        if end_date:
-            try:
-                filter_params["end_date"] = datetime.fromisoformat(end_date)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid end_date format")
-        if status:
-            filter_params["status"] = status
-
-        # Create filter object
-        event_filter = EventFilter(**filter_params)
-
-        # Calculate pagination - use 100 items per page for infinite scroll
-        per_page = 100
-        skip = (page - 1) * per_page
-
-        # Get events using EventManager
-        event_manager = EventManager(db)
-        events = event_manager.list_events(event_filter, skip, per_page, "timestamp", "desc")
+        events = _page_of_events(EventManager(db), page, type, sub_type, start_date, end_date, status)
 
         # Convert events to JSON-serializable format
         events_json = []
@@ -67,9 +39,85 @@ async def get_events(
                 "status": event.status,
                 "description": event.description,
                 "details": event.details,
+                "has_details": bool(event.details),
                 "has_attachment": event.has_attachment
             })
 
         return events_json
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/events/feed")
+async def get_events_feed(
+    page: int = Query(1, ge=1),
+    type: Optional[str] = None,
+    sub_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    status: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Events for the events page, without their details
+
+    The page only shows a button for details and fetches them on click, so
+    they aren't loaded or decompressed here.
+    """
+    try:
+        event_manager = EventManager(db)
+        events = _page_of_events(event_manager, page, type, sub_type, start_date, end_date, status, with_details=False)
+        with_details = event_manager.ids_with_details([event.id for event in events])
+
+        return [
+            {
+                "id": event.id,
+                "formatted_timestamp": event.formatted_timestamp,
+                "type": event.type,
+                "sub_type": event.sub_type,
+                "status": event.status,
+                "description": event.description,
+                "has_details": event.id in with_details,
+                "has_attachment": event.has_attachment
+            }
+            for event in events
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _page_of_events(
+    event_manager: EventManager,
+    page: int,
+    type: Optional[str],
+    sub_type: Optional[str],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    status: Optional[str],
+    with_details: bool = True
+) -> list:
+    """One page of events matching the filters, newest first"""
+    # Convert query parameters to filter
+    filter_params = {}
+    if type:
+        filter_params["type"] = type.lower()
+    if sub_type:
+        filter_params["sub_type"] = sub_type.lower()
+    if start_date:
+        try:
+            filter_params["start_date"] = datetime.fromisoformat(start_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid start_date format")
+    if end_date:
+        try:
+            filter_params["end_date"] = datetime.fromisoformat(end_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid end_date format")
+    if status:
+        filter_params["status"] = status
+
+    # Create filter object
+    event_filter = EventFilter(**filter_params)
+
+    # Calculate pagination - use 100 items per page for infinite scroll
+    per_page = 100
+    skip = (page - 1) * per_page
+
+    return event_manager.list_events(event_filter, skip, per_page, "timestamp", "desc", with_details=with_details) 
\ No newline at end of file
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.core.database import get_media_db
+from app.api.managers.media_cache_manager import MediaCacheManager
+from app.api.managers.media_merge_manager import MediaMergeManager
+from app.api.managers.media_probe_manager import MediaProbeManager
+from app.api.managers.media_scan_manager import MediaScanManager
+from app.api.managers.media_summary_manager import MediaSummaryManager
+from app.api.managers.media_verify_manager import MediaVerifyManager
+from app.models.media import MediaSourceItem, MediaType, PendingStatus, QualityLevel, TitleCacheState
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Scans write the whole library in one transaction, so only one runs at a time
+_scan_lock = asyncio.Lock()
+_cache_lock = asyncio.Lock()
+_verify_lock = asyncio.Lock()
+_probe_lock = asyncio.Lock()
+
+class CacheRequest(BaseModel):
+    pending: PendingStatus
+    pin: Optional[bool] = None
+
+@router.post("/refresh")
+async def refresh_media(full: bool = False, db: Session = Depends(get_media_db)):
+    """Scan the media libraries into the media database, only listing changed directories unless full"""
+    if _scan_lock.locked():
+        raise HTTPException(status_code=409, detail="A media scan is already running")
+
+    async with _scan_lock:
+        try:
+            return await run_in_threadpool(MediaScanManager(db).scan, full=full)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/merge")
+async def merge_media(
+    full: bool = False, title_id: Optional[List[int]] = Query(None), db: Session = Depends(get_media_db)
+):
+    """Update the merged libraries' links, only for the given titles if any, or rebuild them if full"""
+    try:
+        return await run_in_threadpool(MediaMergeManager(db).build, title_ids=title_id, full=full)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/cache")
+async def get_cache_plan(db: Session = Depends(get_media_db)):
+    """What the next cache run would promote, demote and evict"""
+    try:
+        return (await run_in_threadpool(MediaCacheManager(db).plan)).summary()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/cache/apply")
+async def apply_cache(db: Session = Depends(get_media_db)):
+    """Copy pending promotions to the cache and remove demoted and evicted items"""
+    if _cache_lock.locked():
+        raise HTTPException(status_code=409, detail="A cache run is already running")
+
+    async with _cache_lock:
+        try:
+            return await run_in_threadpool(MediaCacheManager(db).apply)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@router.put("/items/{item_id}/cache")
+def set_item_cache(item_id: int, request: CacheRequest, db: Session = Depends(get_media_db)):
+    """Request promotion or demotion of a media item, optionally pinning it"""
+    item = db.get(MediaSourceItem, item_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Media item not found")
+    return {"updated": MediaCacheManager(db).set_pending([item], request.pending, request.pin)}
+
+@router.put("/titles/{title_id}/cache")
+def set_title_cache(title_id: int, request: CacheRequest, db: Session = Depends(get_media_db)):
+    """Request promotion or demotion of every media item of a title, optionally pinning them"""
+    items = db.query(MediaSourceItem).filter(MediaSourceItem.media_title_id == title_id).all()
+    if not items:
+        raise HTTPException(status_code=404, detail="Media title not found")
+    return {"updated": MediaCacheManager(db).set_pending(items, request.pending, request.pin)}
+
+@router.post("/items/{item_id}/access")
+def record_item_access(item_id: int, db: Session = Depends(get_media_db)):
+    """Count an access (e.g. a play) of a media item"""
+    try:
+        item = MediaCacheManager(db).record_access(item_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {
+        "access_count": item.access_count,
+        "last_accessed": item.last_accessed,
+        "cache_status": item.cache_status.value,
+        "pending": item.pending.value
+    }
+
+@router.post("/verify")
+async def verify_media(db: Session = Depends(get_media_db)):
+    """Look for duplicate video files and cache copies that differ from their source"""
+    if _verify_lock.locked():
+        raise HTTPException(status_code=409, detail="A media verification is already running")
+
+    async with _verify_lock:
+        return await run_in_threadpool(MediaVerifyManager(db).verify)
+
+@router.post("/probe")
+async def probe_media(limit: Optional[int] = None, db: Session = Depends(get_media_db)):
+    """Probe new and changed video files with ffprobe and set their items' quality from the streams"""
+    if _probe_lock.locked():
+        raise HTTPException(status_code=409, detail="A media probe is already running")
+
+    async with _probe_lock:
+        try:
+            return await run_in_threadpool(MediaProbeManager(db).probe, limit=limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/findings")
+def get_findings(db: Session = Depends(get_media_db)):
+    """Duplicates and cache mismatches found by the last verification"""
+    return MediaVerifyManager(db).findings()
+
+@router.get("/titles")
+def list_titles(
+    media_type: Optional[MediaType] = None,
+    quality: Optional[str] = Query(None, description="Only titles with an item of this quality (UHD, FHD, HD, SD, LD, UNKNOWN)"),
+    cache_state: Optional[TitleCacheState] = None,
+    search: Optional[str] = Query(None, description="Only titles whose name contains this"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=10000),
+    db: Session = Depends(get_media_db)
+):
+    """Titles by name with their item counts by quality and cache state"""
+    try:
+        quality_level = QualityLevel[quality.upper()] if quality else None
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Unknown quality: {quality}")
+    return MediaSummaryManager(db).titles(media_type, quality_level, cache_state, search, offset, limit)
+
+@router.get("/titles/{title_id}")
+def get_title(title_id: int, db: Session = Depends(get_media_db)):
+    """A title's item counts by quality and cache state"""
+    title = MediaSummaryManager(db).title(title_id)
+    if not title:
+        raise HTTPException(status_code=404, detail="Media title not found")
+    return title
+
+@router.get("/titles/{title_id}/seasons")
+def get_title_seasons(title_id: int, db: Session = Depends(get_media_db)):
+    """A title's seasons and episodes with their items by quality and cache state"""
+    seasons = MediaSummaryManager(db).seasons(title_id)
+    if not seasons:
+        raise HTTPException(status_code=404, detail="Media title not found")
+    return seasons
+
+@router.get("/qualities")
+def get_qualities(db: Session = Depends(get_media_db)):
+    """Items and titles of each quality, per media type"""
+    return MediaSummaryManager(db).qualities()
+
+@router.get("/cache/status")
+def get_cache_status(db: Session = Depends(get_media_db)):
+    """Titles by cache state, and the items and bytes cached, pinned and pending"""
+    return MediaSummaryManager(db).cache_status()
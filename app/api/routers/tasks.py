@@ -22,6 +22,8 @@ class TaskStartAPIRequest(BaseModel):
 
 class TaskEndAPIRequest(BaseModel):
     status: str = "success"
+    host_url: Optional[str] = None
+    parent_id: Optional[int] = None  # Fan-out event this run belongs to
 
 class TaskCreateAPIRequest(BaseModel):
     name: str
@@ -30,6 +32,7 @@ class TaskCreateAPIRequest(BaseModel):
     task_type: str = "external"
     enabled: bool = True
     host_url: Optional[str] = None
+    host_group: Optional[str] = None
     hours: Optional[int] = None
     minutes: Optional[int] = None
     seconds: Optional[int] = None
@@ -53,14 +56,23 @@ def toggle_task_endpoint(task_id: str, request: TaskToggleAPIRequest, db: Sessio
         raise HTTPException(status_code=404, detail=str(e))
 
 @router.post("/{task_id}/run")
-def run_task_endpoint(task_id: str, db: Session = Depends(get_db)):
+async def run_task_endpoint(task_id: str, db: Session = Depends(get_db)):
     """Run a task immediately"""
     task_manager = TaskManager(db=db)
     try:
-        return task_manager.run_task(task_id)
+        return await task_manager.run_task(task_id)
     except ValueError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/{task_id}/cancel")
+def cancel_task_endpoint(task_id: str, db: Session = Depends(get_db)):
+    """Cancel a running task and kill its process tree"""
+    task_manager = TaskManager(db=db)
+    try:
+        return task_manager.cancel_task(task_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.post("/{task_id}/notify-start")
 def notify_task_start_endpoint(task_id: str, db: Session = Depends(get_db)):
     """Notify that a task has started"""
@@ -189,9 +201,12 @@ def end_task_endpoint(task_id: str, request: TaskEndAPIRequest, db: Session = De
             type="task",
             sub_type=task_id,
             status=request.status,
-            description=f"Task {task_id} ended with status: {request.status}",
-            details=f"Task {task_id} ended at {get_current_time()}"
+            description=f"Task {task_id} ended with status: {request.status}" + (f" on {request.host_url}" if request.host_url else ""),
+            details=f"Task {task_id} ended at {get_current_time()}",
+            parent_id=request.parent_id
         )
+        if request.parent_id:
+            task_manager.update_fan_out_event(request.parent_id, task_id, request.status, request.host_url)
         
         return {
             "status": "success",
@@ -224,6 +239,7 @@ def create_task_endpoint(task_id: str, request: TaskCreateAPIRequest, db: Sessio
             task_type=request.task_type,
             enabled=request.enabled,
             host_url=request.host_url,
+            host_group=request.host_group,
             hours=request.hours,
             minutes=request.minutes,
             seconds=request.seconds,
@@ -270,6 +286,7 @@ def create_task_endpoint(task_id: str, request: TaskCreateAPIRequest, db: Sessio
                 "task_type": task.task_type,
                 "enabled": task.enabled,
                 "host_url": task.host_url,
+                "host_group": task.host_group,
                 "schedule": schedule
             }
         }
@@ -1,6 +1,5 @@
 import typer
 import logging
-import sys
 import httpx
 import signal
 import os
@@ -8,20 +7,14 @@ from rich.panel import Panel
 from pathlib import Path
 
 from app.core.settings import settings
+from app.core.logging_config import setup_logging
 from app.cli.media import media_app
 from app.cli.notify import notify_app
 from app.cli.event import event_app
 from app.cli.utils import get_server_url, console, handle_server_error
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG if settings.DEBUG else logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(settings.LOG_FILE)
-    ]
-)
+# Configure logging; the CLI appends to the service's log without rotating it
+setup_logging(rotate=False)
 
 logger = logging.getLogger(__name__)
 
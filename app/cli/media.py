@@ -25,11 +25,13 @@ def config():
         typer.echo(f"{key}: {value}")
 
 @media_app.command()
-def refresh():
+def refresh(
+    full: bool = typer.Option(False, "--full", "-f", help="Rescan every directory, not just changed ones")
+):
     """Refresh the media library"""
     try:
-        with httpx.Client() as client:
-            response = client.post(f"{get_server_url()}/api/media/refresh")
+        with httpx.Client(timeout=None) as client:  # a full scan can take minutes
+            response = client.post(f"{get_server_url()}/api/media/refresh", params={"full": full})
             if response.status_code == 200:
                 console.print(Panel.fit("Media refresh completed successfully", style="green"))
             else:
@@ -38,11 +40,13 @@ def refresh():
         handle_server_error(e)
 
 @media_app.command()
-def merge():
+def merge(
+    full: bool = typer.Option(False, "--full", "-f", help="Rebuild the merged libraries and swap them in")
+):
     """Merge media files"""
     try:
-        with httpx.Client() as client:
-            response = client.post(f"{get_server_url()}/api/media/merge")
+        with httpx.Client(timeout=None) as client:
+            response = client.post(f"{get_server_url()}/api/media/merge", params={"full": full})
             if response.status_code == 200:
                 console.print(Panel.fit("Media merge completed successfully", style="green"))
             else:
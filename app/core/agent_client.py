@@ -0,0 +1,84 @@
+import asyncio
+import importlib.util
+import logging
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from app.core.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def agent_base_url(host_url: str) -> str:
+    """Normalise a task host_url ("host", "host:port" or a full URL) to http://host:port"""
+    if "://" not in host_url:
+        host_url = f"http://{host_url}"
+    parsed_url = urlparse(host_url)
+    port = parsed_url.port or settings.AGENTS.DEFAULT_PORT
+    return f"{parsed_url.scheme or 'http'}://{parsed_url.hostname}:{port}"
+
+
+class AgentClientPool:
+    """Shared async HTTP clients for talking to remote agents.
+
+    One keep-alive connection pool is kept per agent host, so repeated dispatches
+    reuse open connections instead of paying a new TCP handshake each time.
+    """
+
+    def __init__(self) -> None:
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create_client(self, base_url: str) -> httpx.AsyncClient:
+        agent_settings = settings.AGENTS
+        return httpx.AsyncClient(
+            base_url=base_url,
+            http2=agent_settings.HTTP2 and HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(agent_settings.ACK_TIMEOUT, connect=agent_settings.CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=agent_settings.MAX_CONNECTIONS,
+                max_keepalive_connections=agent_settings.MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=agent_settings.KEEPALIVE_EXPIRY
+            )
+        )
+
+    def get_client(self, host_url: str) -> httpx.AsyncClient:
+        """Get the pooled client for an agent host, creating it on first use"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Clients are bound to the event loop they were created on
+            self._clients = {}
+            self._loop = loop
+
+        base_url = agent_base_url(host_url)
+        client = self._clients.get(base_url)
+        if client is None or client.is_closed:
+            client = self._create_client(base_url)
+            self._clients[base_url] = client
+        return client
+
+    async def post(self, host_url: str, path: str, **kwargs) -> httpx.Response:
+        """POST to an agent using its pooled connection"""
+        return await self.get_client(host_url).post(path, **kwargs)
+
+    async def get(self, host_url: str, path: str, **kwargs) -> httpx.Response:
+        """GET from an agent using its pooled connection"""
+        return await self.get_client(host_url).get(path, **kwargs)
+
+    async def aclose(self) -> None:
+        """Close all pooled connections"""
+        clients = list(self._clients.values())
+        self._clients = {}
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing agent client {client.base_url}: {str(e)}")
+
+
+agent_clients = AgentClientPool()
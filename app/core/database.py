@@ -1,14 +1,19 @@
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, delete, event, insert, inspect, select
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
 from pathlib import Path
 from app.core.settings import settings
+from app.core.metrics import instrument_engine, instrument_sessions
 import os
 import logging
-from typing import Optional, TypeVar, Generic, Type, Any
+from itertools import islice
+from typing import Optional, TypeVar, Generic, Type, Any, Dict, Iterable, Mapping, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Rows per INSERT statement in bulk loads, well within SQLite's limits for executemany
+BULK_CHUNK_SIZE = 5000
+
 def setup_database(db_path: str) -> tuple[create_engine, sessionmaker, declarative_base]:
     """Setup a database with the given path"""
     try:
@@ -50,6 +55,11 @@ Base = MainBase
 # Setup media database
 media_engine, MediaSessionLocal, MediaBase = setup_database(settings.DATABASE.MEDIA_DB_PATH)
 
+# Record write latency, lock errors and commit times for /metrics
+instrument_engine(main_engine, "main")
+instrument_engine(media_engine, "media")
+instrument_sessions()
+
 # Type variable for generic model type
 T = TypeVar('T', bound=MainBase)
 M = TypeVar('M', bound=MediaBase)
@@ -66,10 +76,37 @@ __all__ = [
     'MediaSessionLocal',
     'get_db',
     'get_media_db',
+    'add_missing_columns',
     'DBManager',
     'MediaDBManager'
 ]
 
+def add_missing_columns(engine, base) -> None:
+    """Add columns and indexes that exist on the models but not yet in the database.
+
+    create_all only creates missing tables, so new nullable columns on existing
+    tables are added here with ALTER TABLE on startup, and new indexes with
+    CREATE INDEX.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                logger.info(f"Adding column {table.name}.{column.name} ({column_type})")
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    logger.info(f"Creating index {index.name}")
+                    index.create(bind=conn)
+
 class DBManager(Generic[T]):
     def __init__(self, model: Type[T], db: Session):
         self.model = model
@@ -130,6 +167,91 @@ class MediaDBManager(Generic[M]):
         self.db.refresh(db_obj)
         return db_obj
 
+    def key_map(self, *columns: str) -> Dict[Any, int]:
+        """IDs of every row by the given columns, read in one query
+
+        Lets bulk inserts resolve foreign keys from memory instead of one lookup
+        per row. Keys are the column's value, or a tuple of several columns' values.
+        """
+        query = select(*[getattr(self.model, column) for column in columns], self.model.id)
+        if len(columns) == 1:
+            return {key: row_id for key, row_id in self.db.execute(query)}
+        return {tuple(row[:-1]): row[-1] for row in self.db.execute(query)}
+
+    def bulk_insert(
+        self, rows: Iterable[Dict[str, Any]], resolve: Optional[Mapping[str, Tuple[str, Mapping[Any, int]]]] = None,
+        replace: bool = False, chunk_size: int = BULK_CHUNK_SIZE, commit_every: Optional[int] = None,
+        commit: bool = True
+    ) -> int:
+        """Insert many rows with one executemany INSERT per chunk, without loading them as objects
+
+        Args:
+            rows: Column values of each row; read a chunk at a time, so a generator keeps memory flat
+            resolve: Foreign key column -> (row key holding the referenced row's key, key -> ID
+                mapping e.g. from key_map). The key is replaced by the ID it maps to.
+            replace: Delete every existing row first, and drop the table's secondary indexes
+                while inserting, building them once at the end. Always one transaction, so a
+                failed reload leaves the old rows and indexes in place
+            chunk_size: Rows per INSERT statement
+            commit_every: Commit after about this many rows; by default everything is one transaction
+            commit: Commit at the end. Pass False to make the load part of the caller's transaction
+
+        Returns:
+            int: Number of rows inserted
+
+        Raises:
+            ValueError: If a key in resolve maps to no ID, or commit_every is combined with replace
+                or commit=False. On any error the transaction is rolled back if it is ours (chunks
+                already committed by commit_every stay); with commit=False it is left for the
+                caller to roll back
+        """
+        if commit_every and (replace or not commit):
+            raise ValueError("commit_every can't be combined with replace or commit=False")
+        table = self.model.__table__
+        connection = self.db.connection()
+        indexes = sorted(table.indexes, key=lambda index: index.name) if replace else []
+        try:
+            if replace:
+                self.db.execute(delete(self.model))
+                for index in indexes:
+                    index.drop(bind=connection, checkfirst=True)
+
+            count = uncommitted = 0
+            rows = iter(rows)
+            while chunk := list(islice(rows, chunk_size)):
+                if resolve:
+                    self._resolve(chunk, resolve)
+                # Core executemany: no ORM bookkeeping per row
+                connection.execute(insert(table), chunk)
+                count += len(chunk)
+                uncommitted += len(chunk)
+                if commit_every and uncommitted >= commit_every:
+                    self.db.commit()
+                    connection = self.db.connection()
+                    uncommitted = 0
+
+            for index in indexes:
+                index.create(bind=connection, checkfirst=True)
+            if commit:
+                self.db.commit()
+        except BaseException:
+            # SQLite's DDL is transactional, so rolling back also restores dropped indexes
+            if commit:
+                self.db.rollback()
+            raise
+        logger.info(f"Bulk inserted {count} rows into {table.name}")
+        return count
+
+    @staticmethod
+    def _resolve(rows: list, resolve: Mapping[str, Tuple[str, Mapping[Any, int]]]) -> None:
+        for row in rows:
+            for column, (key_field, ids) in resolve.items():
+                key = row.pop(key_field)
+                try:
+                    row[column] = ids[key]
+                except KeyError:
+                    raise ValueError(f"No {column} for {key_field} {key!r}") from None
+
     def get(self, id: int) -> Optional[M]:
         """Get a record by ID"""
         return self.db.query(self.model).filter(self.model.id == id).first()
@@ -0,0 +1,170 @@
+"""Append-only SQLite store of structured log records.
+
+Records are written in batches by the logging listener thread (see
+app.core.logging_config) into their own database, so log writes never contend
+with the main database. Indexes on level, logger, task and time keep the
+/logs page filters fast however large the store grows.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, Float, Index, Integer, String, Text, delete, event, insert, select
+from sqlalchemy.orm import declarative_base
+
+from app.core.database import setup_database
+from app.core.settings import settings
+from app.utils.log_reader import LogEntry, LogPage
+
+LogBase = declarative_base()
+
+
+class LogRecord(LogBase):
+    __tablename__ = "log_records"
+
+    id = Column(Integer, primary_key=True)
+    created = Column(Float, nullable=False, index=True)  # Unix time
+    level = Column(String(16), nullable=False)
+    logger = Column(String(255), nullable=False)
+    message = Column(Text, nullable=False)
+    task_id = Column(String(255))
+    request_id = Column(String(64))
+    module = Column(String(255))
+    line = Column(Integer)
+    exc_text = Column(Text)
+
+    # Pages are read newest first by id, so each filter column is indexed with it
+    __table_args__ = (
+        Index("ix_log_records_level_id", "level", "id"),
+        Index("ix_log_records_logger_id", "logger", "id"),
+        Index("ix_log_records_task_id_id", "task_id", "id"),
+    )
+
+
+def _to_unix_time(value) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _format_created(created: float) -> str:
+    """Format a record time like the text log's asctime"""
+    dt = datetime.fromtimestamp(created)
+    return f"{dt:%Y-%m-%d %H:%M:%S},{dt.microsecond // 1000:03d}"
+
+
+class LogStore:
+    """Batched writer and filtered reader for the log_records table"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.engine, self.SessionLocal, _ = setup_database(db_path or settings.LOGGING.STORE_PATH)
+
+        @event.listens_for(self.engine, "connect")
+        def _set_pragmas(dbapi_connection, connection_record):
+            # WAL lets the /logs page read while the listener thread appends
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        LogBase.metadata.create_all(bind=self.engine)
+
+    def write(self, records: List[Dict]) -> None:
+        """Append records (dicts of LogRecord columns) in one transaction"""
+        if not records:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(insert(LogRecord), records)
+
+    def prune(self, retention_days: Optional[int] = None) -> int:
+        """Delete records older than the retention period
+
+        Returns:
+            int: Number of records deleted
+        """
+        retention_days = retention_days or settings.LOGGING.STORE_RETENTION_DAYS
+        cutoff = time.time() - timedelta(days=retention_days).total_seconds()
+        with self.engine.begin() as conn:
+            return conn.execute(delete(LogRecord).where(LogRecord.created < cutoff)).rowcount
+
+    def query(
+        self,
+        limit: int = 1000,
+        level: Optional[str] = None,
+        logger: Optional[str] = None,
+        task_id: Optional[str] = None,
+        request_id: Optional[str] = None,
+        since=None,
+        until=None,
+        search: Optional[str] = None,
+        before: Optional[str] = None
+    ) -> LogPage:
+        """Query records newest first.
+
+        Args:
+            limit: Maximum number of entries to return
+            level: Only records with this level (e.g. "ERROR")
+            logger: Only records from this logger or its children
+            task_id: Only records logged while running this task
+            request_id: Only records logged while handling this request
+            since: Only records at or after this time (datetime or ISO string)
+            until: Only records at or before this time (datetime or ISO string)
+            search: Only records whose message contains this text
+            before: Cursor from a previous page; only older records are returned
+
+        Returns:
+            LogPage: The entries and the cursor of the next page, if there may be one
+        """
+        statement = select(LogRecord)
+        if level:
+            statement = statement.where(LogRecord.level == level.upper())
+        if logger:
+            statement = statement.where((LogRecord.logger == logger) | LogRecord.logger.startswith(f"{logger}."))
+        if task_id:
+            statement = statement.where(LogRecord.task_id == task_id)
+        if request_id:
+            statement = statement.where(LogRecord.request_id == request_id)
+        if since:
+            statement = statement.where(LogRecord.created >= _to_unix_time(since))
+        if until:
+            statement = statement.where(LogRecord.created <= _to_unix_time(until))
+        if search:
+            statement = statement.where(LogRecord.message.contains(search, autoescape=True))
+        if before and before.isdigit():
+            statement = statement.where(LogRecord.id < int(before))
+        statement = statement.order_by(LogRecord.id.desc()).limit(limit)
+
+        with self.SessionLocal() as db:
+            records = db.execute(statement).scalars().all()
+
+        entries = [
+            LogEntry(
+                timestamp=_format_created(record.created),
+                name=record.logger,
+                level=record.level,
+                message=f"{record.message}\n{record.exc_text}" if record.exc_text else record.message,
+                cursor=str(record.id),
+                task_id=record.task_id,
+                request_id=record.request_id
+            )
+            for record in records
+        ]
+        next_cursor = entries[-1].cursor if len(entries) >= limit else None
+        return LogPage(entries=entries, next_cursor=next_cursor)
+
+
+_log_store: Optional[LogStore] = None
+_log_store_lock = threading.Lock()
+
+
+def get_log_store() -> LogStore:
+    """Get the shared log store, creating its database on first use"""
+    global _log_store
+    with _log_store_lock:
+        if _log_store is None:
+            _log_store = LogStore()
+        return _log_store
@@ -0,0 +1,249 @@
+"""Logging setup shared by the service and the CLI.
+
+Records are put on an in-memory queue by the logging call and written out by
+a QueueListener thread, so request handlers and tasks never block on file or
+database I/O. The listener always writes the usual text log; with
+LOGGING.STRUCTURED enabled it also writes JSON lines and ingests records into
+the log store (app.core.log_store) that backs the /logs page.
+
+Records carry task_id and request_id context fields, set with log_context()
+by the scheduler's task wrapper and the request middleware.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from app.core.settings import settings
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+task_id_var: ContextVar[Optional[str]] = ContextVar("task_id", default=None)
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_listener: Optional[QueueListener] = None
+_store_handler: Optional["LogStoreHandler"] = None
+
+
+@contextmanager
+def log_context(task_id: Optional[str] = None, request_id: Optional[str] = None):
+    """Tag records logged inside the block with a task and/or request ID"""
+    tokens = []
+    if task_id is not None:
+        tokens.append((task_id_var, task_id_var.set(task_id)))
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextQueueHandler(QueueHandler):
+    """QueueHandler that captures context fields in the logging thread.
+
+    Unlike the default, the message and traceback are kept as separate fields
+    so the JSON and store handlers can record them separately.
+    """
+
+    _formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._formatter.formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        if getattr(record, "task_id", None) is None:
+            record.task_id = task_id_var.get()
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "task_id": getattr(record, "task_id", None),
+            "request_id": getattr(record, "request_id", None),
+            "module": record.module,
+            "line": record.lineno
+        }
+        if record.exc_text:
+            data["exc_text"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class LogStoreHandler(logging.Handler):
+    """Buffer records and append them to the log store in batches.
+
+    Runs on the listener thread. The buffer is written when it reaches
+    LOGGING.STORE_BATCH_SIZE records, and at least every
+    LOGGING.STORE_FLUSH_INTERVAL seconds by a background flusher that also
+    prunes records past the retention period once an hour.
+    """
+
+    PRUNE_INTERVAL = 3600
+
+    def __init__(self, level: int = logging.NOTSET):
+        super().__init__(level)
+        self.buffer: List[Dict] = []
+        self._store = None
+        self._stop = threading.Event()
+        self._last_prune = 0.0
+        self._flusher = threading.Thread(target=self._flush_periodically, name="log-store-flusher", daemon=True)
+        self._flusher.start()
+
+    @property
+    def store(self):
+        if self._store is None:
+            from app.core.log_store import get_log_store
+            self._store = get_log_store()
+        return self._store
+
+    def emit(self, record: logging.LogRecord) -> None:
+        with self.lock:
+            self.buffer.append({
+                "created": record.created,
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                "task_id": getattr(record, "task_id", None),
+                "request_id": getattr(record, "request_id", None),
+                "module": record.module,
+                "line": record.lineno,
+                "exc_text": record.exc_text
+            })
+            full = len(self.buffer) >= settings.LOGGING.STORE_BATCH_SIZE
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            records, self.buffer = self.buffer, []
+        if not records:
+            return
+        try:
+            self.store.write(records)
+        except Exception as e:
+            # Logging here would feed back into this handler
+            sys.stderr.write(f"Error writing {len(records)} records to the log store: {str(e)}\n")
+
+    def _flush_periodically(self) -> None:
+        while not self._stop.wait(settings.LOGGING.STORE_FLUSH_INTERVAL):
+            self.flush()
+            if time.monotonic() - self._last_prune > self.PRUNE_INTERVAL:
+                self._last_prune = time.monotonic()
+                try:
+                    self.store.prune()
+                except Exception as e:
+                    sys.stderr.write(f"Error pruning the log store: {str(e)}\n")
+
+    def close(self) -> None:
+        self._stop.set()
+        self.flush()
+        super().close()
+
+
+def _file_handler(path: Path, rotate: bool) -> logging.Handler:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if rotate:
+        return RotatingFileHandler(
+            path,
+            maxBytes=settings.LOGGING.MAX_BYTES,
+            backupCount=settings.LOGGING.BACKUP_COUNT,
+            encoding='utf-8'
+        )
+    return logging.FileHandler(path, encoding='utf-8')
+
+
+def setup_logging(log_file: Optional[Path] = None, rotate: bool = True) -> QueueListener:
+    """Route the root logger through a queue to the configured handlers.
+
+    Args:
+        log_file: Text log path (defaults to settings.LOG_FILE)
+        rotate: Rotate the text and JSON logs by size; the CLI appends
+            without rotating so it never renames files under the service
+
+    Returns:
+        QueueListener: The running listener (stopped by stop_logging or at exit)
+    """
+    global _listener, _store_handler
+    if _listener is not None:
+        return _listener
+
+    log_file = Path(log_file or settings.LOG_FILE)
+    try:
+        file_handler = _file_handler(log_file, rotate)
+    except PermissionError:
+        log_file = Path.home() / "medialab-manager.log"
+        file_handler = _file_handler(log_file, rotate)
+
+    text_formatter = logging.Formatter(TEXT_FORMAT)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    handlers: List[logging.Handler] = [stream_handler, file_handler]
+
+    if settings.LOGGING.STRUCTURED:
+        json_file = Path(settings.LOGGING.JSON_FILE) if settings.LOGGING.JSON_FILE else log_file.with_suffix(".jsonl")
+        json_handler = _file_handler(json_file, rotate)
+        json_handler.setFormatter(JsonFormatter())
+        _store_handler = LogStoreHandler()
+        handlers += [json_handler, _store_handler]
+
+    for handler in (stream_handler, file_handler):
+        handler.setFormatter(text_formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(ContextQueueHandler(log_queue))
+    root.setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging() -> None:
+    """Drain the queue and flush and close all handlers"""
+    global _listener, _store_handler
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _store_handler = None
+
+
+def flush_log_store() -> None:
+    """Write buffered records to the log store now, e.g. before querying it"""
+    if _store_handler is not None:
+        _store_handler.flush()
+
+
+def log_store_enabled() -> bool:
+    """Whether records are being ingested into the log store"""
+    return _store_handler is not None
@@ -0,0 +1,336 @@
+"""In-process metrics exposed in the Prometheus text format at /metrics.
+
+Hot paths (HTTP requests, SQL statements, task runs) only touch per-thread
+counters: each thread accumulates into its own cell, created on first use, and
+a scrape sums the cells of all threads. Updates therefore take no locks, and
+once a label combination has been seen an update allocates nothing beyond the
+label tuple used to look it up. Values that are cheaper to read than to track
+(e.g. the scheduler's queue depth) are gauges computed at scrape time.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TASK_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 1800.0, 3600.0, 7200.0, 21600.0)
+
+
+class _ThreadCells:
+    """Per-thread lists of floats that only their own thread writes to"""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._cells: List[List[float]] = []  # list.append is atomic, so no lock needed
+
+    def cell(self) -> List[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0.0] * self._size
+            self._local.cell = cell
+            self._cells.append(cell)
+            return cell
+
+    def totals(self) -> List[float]:
+        totals = [0.0] * self._size
+        for cell in list(self._cells):
+            for i, value in enumerate(cell):
+                totals[i] += value
+        return totals
+
+
+class _CounterChild:
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+
+    def inc(self, amount: float = 1) -> None:
+        self._cells.cell()[0] += amount
+
+    def value(self) -> float:
+        return self._cells.totals()[0]
+
+
+class _GaugeChild:
+    """A gauge is either set, tracked with inc/dec, or computed by a function"""
+
+    def __init__(self):
+        self._cells = _ThreadCells(1)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self._cells.cell()[0] += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._cells.cell()[0] -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._function = function
+
+    def value(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._value + self._cells.totals()[0]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        # One cell per bucket plus +Inf, then sum and count
+        self._cells = _ThreadCells(len(buckets) + 3)
+
+    def observe(self, value: float) -> None:
+        cell = self._cells.cell()
+        cell[bisect.bisect_left(self._buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Tuple[List[float], float, float]:
+        """Cumulative bucket counts (including +Inf), sum and count"""
+        totals = self._cells.totals()
+        cumulative = []
+        running = 0.0
+        for count in totals[:-2]:
+            running += count
+            cumulative.append(running)
+        return cumulative, totals[-2], totals[-1]
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: "Registry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+            self._children[()] = self._default
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Get the child for a combination of label values (in labelnames order)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def _label_string(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{self._label_string(values)} {_format_value(child.value())}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._default.dec(amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default.set_function(function)
+
+    def samples(self) -> List[str]:
+        samples = []
+        for values, child in list(self._children.items()):
+            try:
+                value = child.value()
+            except Exception:
+                continue
+            samples.append(f"{self.name}{self._label_string(values)} {_format_value(value)}")
+        return samples
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS, registry: "Registry" = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def samples(self) -> List[str]:
+        samples = []
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for values, child in list(self._children.items()):
+            cumulative, total, count = child.snapshot()
+            for bound, bucket_count in zip(bounds, cumulative):
+                le = f'le="{bound}"'
+                samples.append(f"{self.name}_bucket{self._label_string(values, le)} {_format_value(bucket_count)}")
+            samples.append(f"{self.name}_sum{self._label_string(values)} {_format_value(total)}")
+            samples.append(f"{self.name}_count{self._label_string(values)} {_format_value(count)}")
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value != value or value in (float("inf"), float("-inf")):
+        return {"nan": "NaN", "inf": "+Inf", "-inf": "-Inf"}[str(float(value))]
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+# HTTP
+HTTP_REQUEST_DURATION = Histogram(
+    "medialab_http_request_duration_seconds",
+    "Time to handle HTTP requests, by route template",
+    ["method", "route", "status"]
+)
+
+# Scheduler and tasks
+SCHEDULER_QUEUE_DEPTH = Gauge("medialab_scheduler_queue_depth", "Jobs submitted to the scheduler executor but not yet running")
+SCHEDULER_BUSY_THREADS = Gauge("medialab_scheduler_busy_threads", "Scheduler executor threads currently running a job")
+SCHEDULER_JOB_LAG = Histogram(
+    "medialab_scheduler_job_lag_seconds",
+    "Delay between a job's scheduled run time and the moment it started",
+    ["task_id"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0)
+)
+SCHEDULER_MISSED_JOBS = Counter("medialab_scheduler_missed_jobs_total", "Scheduled runs skipped because they were past their misfire grace time", ["task_id"])
+TASKS_RUNNING = Gauge("medialab_tasks_running", "Local task runs in progress")
+TASK_DURATION = Histogram("medialab_task_duration_seconds", "Duration of local task runs", ["task_id", "status"], buckets=TASK_BUCKETS)
+
+# Events and database
+EVENTS_INSERTED = Counter("medialab_events_inserted_total", "Events inserted")
+DB_COMMIT_DURATION = Histogram("medialab_db_commit_seconds", "Time to flush and commit ORM sessions", ["db"])
+DB_WRITE_DURATION = Histogram(
+    "medialab_db_write_seconds",
+    "Time in SQLite INSERT/UPDATE/DELETE statements; under contention this is mostly waiting for the write lock",
+    ["db"]
+)
+DB_LOCK_ERRORS = Counter("medialab_db_lock_errors_total", "Statements that failed with 'database is locked'", ["db"])
+
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "insert", "update", "delete")
+
+
+def instrument_engine(engine: Engine, name: Optional[str] = None) -> None:
+    """Time write statements and count lock errors on an engine"""
+    name = name or Path(engine.url.database or "memory").stem
+    write_duration = DB_WRITE_DURATION.labels(name)
+    lock_errors = DB_LOCK_ERRORS.labels(name)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and statement.startswith(_WRITE_PREFIXES):
+            context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_metrics_start", None)
+        if start is not None:
+            write_duration.observe(time.perf_counter() - start)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        if "database is locked" in str(exception_context.original_exception):
+            lock_errors.inc()
+
+
+def instrument_sessions() -> None:
+    """Time commits of every ORM session, labelled by database"""
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        session.info["metrics_commit_start"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def _after_commit(session):
+        start = session.info.pop("metrics_commit_start", None)
+        if start is None:
+            return
+        bind = session.bind
+        name = Path(bind.url.database).stem if bind is not None and bind.url.database else "unknown"
+        DB_COMMIT_DURATION.labels(name).observe(time.perf_counter() - start)
@@ -1,12 +1,34 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from functools import lru_cache
+from types import MappingProxyType
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Mapping
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+CONFIG_FILE = "config.json"
+
+def _freeze(value: Any) -> Any:
+    """Read-only copy of parsed JSON: dicts become mapping proxies and lists tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+@lru_cache(maxsize=None)
+def load_config() -> Mapping[str, Any]:
+    """Parse config.json once; the result is shared, so it is read-only
+
+    Raises:
+        FileNotFoundError: If config.json does not exist (not cached, so a later call retries)
+    """
+    with open(CONFIG_FILE) as f:
+        return _freeze(json.load(f))
+
 class DatabaseSettings(BaseSettings):
     MAIN_DB_PATH: str = "data/main.db"
     MEDIA_DB_PATH: str = "data/media.db"
@@ -14,12 +36,11 @@ class DatabaseSettings(BaseSettings):
     @classmethod
     def from_config(cls):
         try:
-            with open("config.json") as f:
-                config = json.load(f)
-                return cls(
-                    MAIN_DB_PATH=config["DATABASE"]["MAIN_DB_PATH"],
-                    MEDIA_DB_PATH=config["DATABASE"]["MEDIA_DB_PATH"]
-                )
+            config = load_config()
+            return cls(
+                MAIN_DB_PATH=config["DATABASE"]["MAIN_DB_PATH"],
+                MEDIA_DB_PATH=config["DATABASE"]["MEDIA_DB_PATH"]
+            )
         except (FileNotFoundError, KeyError):
             return cls()
 
@@ -32,14 +53,149 @@ class NotificationSettings(BaseSettings):
     @classmethod
     def from_config(cls):
         try:
-            with open("config.json") as f:
-                config = json.load(f)
-                return cls(
-                    SMTP_RELAY=config["NOTIFICATION"]["SMTP_RELAY"],
-                    SMTP_PORT=config["NOTIFICATION"]["SMTP_PORT"],
-                    SMTP_FROM=config["NOTIFICATION"]["SMTP_FROM"],
-                    SMTP_TO=config["NOTIFICATION"]["SMTP_TO"]
-                )
+            config = load_config()
+            return cls(
+                SMTP_RELAY=config["NOTIFICATION"]["SMTP_RELAY"],
+                SMTP_PORT=config["NOTIFICATION"]["SMTP_PORT"],
+                SMTP_FROM=config["NOTIFICATION"]["SMTP_FROM"],
+                SMTP_TO=config["NOTIFICATION"]["SMTP_TO"]
+            )
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class AgentSettings(BaseSettings):
+    DEFAULT_PORT: int = 4810
+    CONNECT_TIMEOUT: float = 5.0
+    ACK_TIMEOUT: float = 10.0
+    MAX_CONNECTIONS: int = 10
+    MAX_KEEPALIVE_CONNECTIONS: int = 5
+    KEEPALIVE_EXPIRY: float = 60.0
+    HTTP2: bool = True
+    POLL_INTERVAL: float = 30.0
+    HEARTBEAT_TIMEOUT: float = 90.0
+    DOWN_AFTER_FAILURES: int = 2
+    FANOUT_CONCURRENCY: int = 5
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["AGENTS"])
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class AttachmentSettings(BaseSettings):
+    MAX_SIZE: int = 1024 * 1024 * 1024  # Uploads larger than this are rejected while streaming
+    CHUNK_SIZE: int = 1024 * 1024
+    SNIFF_SIZE: int = 8192  # Bytes inspected to detect the MIME type
+    SPOOL_MEMORY_SIZE: int = 8 * 1024 * 1024  # Spooled uploads move to a temp file beyond this
+    COMPRESSION: str = "auto"  # auto (zstd if installed, else gzip), zstd, gzip or identity
+    COMPRESSION_LEVEL: int = 6
+    DETAILS_COMPRESSION_THRESHOLD: int = 1024  # Event details at least this long are stored compressed
+    DICTIONARY_SIZE: int = 112640  # Size of trained zstd dictionaries
+    DICTIONARY_SAMPLES: int = 2000  # Maximum samples used to train a dictionary
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["ATTACHMENTS"])
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class LoggingSettings(BaseSettings):
+    MAX_BYTES: int = 10 * 1024 * 1024  # Rotate the log file at this size
+    BACKUP_COUNT: int = 5
+    STRUCTURED: bool = False  # Also write JSON lines and ingest records into the log store
+    JSON_FILE: str = ""  # Defaults to LOG_FILE with a .jsonl suffix
+    STORE_PATH: str = "data/logs.db"
+    STORE_RETENTION_DAYS: int = 30
+    STORE_BATCH_SIZE: int = 500  # Records written to the store per transaction
+    STORE_FLUSH_INTERVAL: float = 1.0  # Seconds buffered records may wait before being written
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["LOGGING"])
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class MediaScanSettings(BaseSettings):
+    WORKERS_PER_DISK: int = 1  # Concurrent directory walkers per physical disk (st_dev)
+    BATCH_SIZE: int = 5000  # Rows per INSERT when writing scan results
+    WATCH: bool = True  # Keep the media database up to date with inotify
+    WATCH_STORAGE_TYPES: List[str] = ["source", "cache", "merge"]  # Libraries on source storages, cache copies, merged links
+    WATCH_DEBOUNCE: float = 5.0  # Seconds without changes before they are applied
+    WATCH_MAX_DELAY: float = 60.0  # Apply changes after this long even if more keep coming
+    WATCH_FALLBACK_INTERVAL: float = 900.0  # Seconds between incremental rescans if not everything could be watched
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["MEDIA_SCAN"])
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class MediaCacheSettings(BaseSettings):
+    STORAGE: str = ""  # MEDIA_DATA storage to cache on (defaults to the first one of type "cache")
+    BUDGET_BYTES: int = 0  # Bytes of media the cache may hold (0: as much as MIN_FREE_BYTES allows)
+    MIN_FREE_BYTES: int = 20 * 1024 ** 3  # Free space always left on the cache volume
+    COPY_WORKERS: int = 2  # Files copied to the cache at once
+    EVICTION: str = "lru"  # Which cached items make room first: "lru" (least recently) or "lfu" (least often accessed)
+    PROMOTE_AFTER_ACCESSES: int = 0  # Promote an item once accessed this often (0: only on request)
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["MEDIA_CACHE"])
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class MediaMergeSettings(BaseSettings):
+    STORAGE: str = ""  # MEDIA_DATA storage to build the merged libraries on (defaults to the first one of type "merge")
+    LINK_TYPE: str = "symlink"  # "symlink", or "hardlink" for source files on the same filesystem
+    FOLDERS: Dict[str, str] = {"movie": "movies", "tv_show": "tv"}  # Merged library folder per media type
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["MEDIA_MERGE"])
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class MediaVerifySettings(BaseSettings):
+    MIN_SIZE_BYTES: int = 1024 ** 2  # Smaller video files aren't checked
+    READ_BYTES_PER_SECOND: int = 50 * 1024 ** 2  # Read rate per disk (0: unlimited)
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["MEDIA_VERIFY"])
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class MediaProbeSettings(BaseSettings):
+    FFPROBE: str = "ffprobe"  # Path of the ffprobe binary
+    WORKERS: int = 4  # ffprobe processes run at once
+    TIMEOUT: float = 60.0  # Seconds before a probe is given up
+    BATCH_SIZE: int = 200  # Probes stored per commit, so an interrupted run resumes where it stopped
+    RETRY_AFTER: float = 6 * 3600  # Seconds before a failed probe is retried, doubled after each further failure
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["MEDIA_PROBE"])
+        except (FileNotFoundError, KeyError):
+            return cls()
+
+class DiskHealthSettings(BaseSettings):
+    SMARTCTL: str = "smartctl"  # Path of the smartctl binary
+    DISKS: List[str] = []  # Disks to sample besides those of the MEDIA_DATA storages, e.g. parity disks
+    RETENTION_DAYS: int = 365  # Samples older than this are deleted
+    FORECAST_DAYS: int = 30  # History that capacity trends are fitted to
+
+    @classmethod
+    def from_config(cls):
+        try:
+            return cls(**load_config()["DISK_HEALTH"])
         except (FileNotFoundError, KeyError):
             return cls()
 
@@ -62,9 +218,29 @@ class Settings(BaseSettings):
     # Notification settings
     NOTIFICATION: NotificationSettings = NotificationSettings.from_config()
     
+    # Remote agent settings
+    AGENTS: AgentSettings = AgentSettings.from_config()
+    
+    # Event attachment settings
+    ATTACHMENTS: AttachmentSettings = AttachmentSettings.from_config()
+    
+    # Logging settings
+    LOGGING: LoggingSettings = LoggingSettings.from_config()
+    
+    # Media library scanner settings
+    MEDIA_SCAN: MediaScanSettings = MediaScanSettings.from_config()
+    MEDIA_CACHE: MediaCacheSettings = MediaCacheSettings.from_config()
+    MEDIA_MERGE: MediaMergeSettings = MediaMergeSettings.from_config()
+    MEDIA_VERIFY: MediaVerifySettings = MediaVerifySettings.from_config()
+    MEDIA_PROBE: MediaProbeSettings = MediaProbeSettings.from_config()
+    
+    # Disk health and capacity collector settings
+    DISK_HEALTH: DiskHealthSettings = DiskHealthSettings.from_config()
+    
     # Task settings
     TASKS: Dict[str, Dict[str, Any]] = {}
     TASK_FILTERS: Dict[str, Dict[str, Any]] = {}
+    HOST_GROUPS: Dict[str, List[str]] = {}
     TASKS_FILE: str = "tasks.json"
     
     # Media data settings (kept from config.json for now)
@@ -73,33 +249,42 @@ class Settings(BaseSettings):
     @classmethod
     def from_config(cls):
         try:
-            with open("config.json") as f:
-                config = json.load(f)
-                settings = cls(
-                    DATABASE=DatabaseSettings.from_config(),
-                    NOTIFICATION=NotificationSettings.from_config(),
-                    PROJECT_NAME=config.get("PROJECT_NAME", "MediaLab Manager"),
-                    VERSION=config.get("VERSION", "0.1.0"),
-                    DESCRIPTION=config.get("DESCRIPTION", "MediaLab Management System"),
-                    TASKS_FILE=config.get("TASKS_FILE", "tasks.json"),
-                    MEDIA_DATA=config.get("MEDIA_DATA", {})
-                )
-                
-                logger.info(f"Loading tasks from file: {settings.TASKS_FILE}")
-                
-                # Load tasks and filters from the tasks file
-                try:
-                    with open(settings.TASKS_FILE) as f:
-                        tasks_config = json.load(f)
-                        settings.TASKS = tasks_config.get("TASKS", {})
-                        settings.TASK_FILTERS = tasks_config.get("TASK_FILTERS", {})
-                        logger.info(f"Successfully loaded {len(settings.TASKS)} tasks from {settings.TASKS_FILE}")
-                except FileNotFoundError:
-                    logger.warning(f"Tasks file {settings.TASKS_FILE} not found")
-                    settings.TASKS = {}
-                    settings.TASK_FILTERS = {}
-                
-                return settings
+            config = load_config()
+            settings = cls(
+                DATABASE=DatabaseSettings.from_config(),
+                NOTIFICATION=NotificationSettings.from_config(),
+                AGENTS=AgentSettings.from_config(),
+                ATTACHMENTS=AttachmentSettings.from_config(),
+                LOGGING=LoggingSettings.from_config(),
+                MEDIA_SCAN=MediaScanSettings.from_config(),
+                MEDIA_CACHE=MediaCacheSettings.from_config(),
+                MEDIA_MERGE=MediaMergeSettings.from_config(),
+                MEDIA_VERIFY=MediaVerifySettings.from_config(),
+                MEDIA_PROBE=MediaProbeSettings.from_config(),
+                DISK_HEALTH=DiskHealthSettings.from_config(),
+                PROJECT_NAME=config.get("PROJECT_NAME", "MediaLab Manager"),
+                VERSION=config.get("VERSION", "0.1.0"),
+                DESCRIPTION=config.get("DESCRIPTION", "MediaLab Management System"),
+                TASKS_FILE=config.get("TASKS_FILE", "tasks.json"),
+                MEDIA_DATA=config.get("MEDIA_DATA", {})
+            )
+            
+            logger.info(f"Loading tasks from file: {settings.TASKS_FILE}")
+            
+            # Load tasks and filters from the tasks file
+            try:
+                with open(settings.TASKS_FILE) as f:
+                    tasks_config = json.load(f)
+                    settings.TASKS = tasks_config.get("TASKS", {})
+                    settings.TASK_FILTERS = tasks_config.get("TASK_FILTERS", {})
+                    settings.HOST_GROUPS = tasks_config.get("HOST_GROUPS", {})
+                    logger.info(f"Successfully loaded {len(settings.TASKS)} tasks from {settings.TASKS_FILE}")
+            except FileNotFoundError:
+                logger.warning(f"Tasks file {settings.TASKS_FILE} not found")
+                settings.TASKS = {}
+                settings.TASK_FILTERS = {}
+            
+            return settings
         except FileNotFoundError:
             logger.warning("config.json not found, using default settings")
             return cls()
@@ -109,4 +294,16 @@ class Settings(BaseSettings):
         env_file_encoding = "utf-8"
         env_prefix = "MEDIALAB_"  # This allows setting PORT via MEDIALAB_PORT environment variable
 
-settings = Settings.from_config() 
\ No newline at end of file
+settings = Settings.from_config()
+
+def reload_settings() -> Settings:
+    """Re-read config.json and the tasks file into the shared settings object
+
+    Modules hold references to `settings`, so it is updated in place. Values read
+    once at startup (e.g. database paths) still need a restart to take effect.
+    """
+    load_config.cache_clear()
+    reloaded = Settings.from_config()
+    for name in Settings.model_fields:
+        setattr(settings, name, getattr(reloaded, name))
+    return settings 
\ No newline at end of file
@@ -6,29 +6,39 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
 import logging
-import sys
 import uvicorn
 import argparse
 from sqlalchemy.orm import Session
 from urllib.parse import urlencode, parse_qs
-from logging.handlers import RotatingFileHandler
+import time
+import uuid
 import json
 from typing import Optional
 
 from app.core.settings import settings
-from app.core.database import engine, Base, get_db, MainBase, main_engine, MediaBase, media_engine
+from app.core.logging_config import setup_logging, log_context
+from app.core.metrics import HTTP_REQUEST_DURATION
+from app.core.database import engine, Base, get_db, MainBase, main_engine, MediaBase, media_engine, MediaSessionLocal, add_missing_columns
 from app.api.routers.notify import router as notification_router
 from app.api.routers.event import router as event_router
 from app.api.routers.tasks import router as tasks_router
 from app.api.routers.backup import router as backup_router
 from app.api.routers.main_routes import router as main_routes_router
+from app.api.routers.agents import router as agents_router
+from app.api.routers.metrics import router as metrics_router
+from app.api.routers.admin import router as admin_router
 from app.views import router as views_router
-#from app.api.routers.media import router as media_router
+from app.api.routers.media import router as media_router
+from app.api.routers.disks import router as disks_router
 #from app.api.routers.search import router as search_router
 #from app.api.routers.cache import router as cache_router
 #from app.api.routers.sync import router as sync_router
 #from app.api.routers.system import router as system_router
 from app.scheduler import start_scheduler, stop_scheduler
+from app.core.agent_client import agent_clients
+from app.api.managers.agent_manager import agent_monitor
+from app.api.managers.media_summary_manager import MediaSummaryManager
+from app.api.managers.media_watch_manager import media_watcher
 from app.schemas.event import EventFilter
 from app.models.event import Event
 from app.api.managers.event_manager import EventManager
@@ -37,31 +47,8 @@ from app.models.event_types import EventType, SubEventType
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Use the log file path from settings
-log_file_path = str(settings.LOG_FILE)
-
-# Create the log directory if it doesn't exist, but if permissions fail create a log file in the current users home directory
-log_dir = Path(log_file_path).parent
-if not log_dir.exists():
-    try:
-        log_dir.mkdir(parents=True, exist_ok=True)
-    except PermissionError:
-        log_file_path = os.path.expanduser('~/medialab-manager.log')
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG if settings.DEBUG else logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        RotatingFileHandler(
-            log_file_path,
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=5,  # Keep 5 backup files
-            encoding='utf-8'
-        )
-    ]
-)
+# Queue-backed logging: text log, plus JSON lines and the log store when LOGGING.STRUCTURED is set
+setup_logging()
 
 def write_pid_file():
     """Write the current process ID to a file"""
@@ -85,6 +72,8 @@ async def lifespan(app: FastAPI):
     # Create database tables for both databases
     MainBase.metadata.create_all(bind=main_engine)
     MediaBase.metadata.create_all(bind=media_engine)
+    add_missing_columns(main_engine, MainBase)
+    add_missing_columns(media_engine, MediaBase)
     
     # Write PID file
     write_pid_file()
@@ -94,13 +83,27 @@ async def lifespan(app: FastAPI):
     try:
         from app.api.managers.task_manager import TaskManager
         TaskManager.sync_tasks_from_config(db)
+        EventManager(db).load_compression_dictionaries()
+        EventManager(db).ensure_event_stats()
     finally:
         db.close()
+    media_db = MediaSessionLocal()
+    try:
+        MediaSummaryManager(media_db).ensure()
+    finally:
+        media_db.close()
     
     start_scheduler()
+    agent_monitor.start()
+    media_watcher.start()
     yield
+    media_watcher.stop()
+    await agent_monitor.stop()
     stop_scheduler()
     
+    # Close pooled agent connections
+    await agent_clients.aclose()
+    
     # Remove PID file
     remove_pid_file()
 
@@ -111,6 +114,37 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+def route_template(scope: dict) -> str:
+    """Path template of the route that handled a request, e.g. /api/events/{event_id}"""
+    # Newer FastAPI versions resolve included routers lazily, so the matched
+    # route's own path lacks the router prefix
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    if context is not None:
+        return context.path
+    route = scope.get("route")
+    return route.path if route else "unmatched"
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Record request latency per route template (not per raw path, to bound label cardinality)"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUEST_DURATION.labels(request.method, route_template(request.scope), status).observe(time.perf_counter() - start)
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Tag log records with the request's ID and return it in X-Request-ID"""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    with log_context(request_id=request_id):
+        response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
@@ -130,10 +164,14 @@ templates.env.filters["remove_param"] = remove_query_param
 # Include routers
 app.include_router(views_router)
 app.include_router(main_routes_router)
+app.include_router(metrics_router)
 app.include_router(tasks_router, prefix="/api/tasks", tags=["tasks"])
 app.include_router(backup_router, prefix="/api/backup", tags=["backup"])
+app.include_router(agents_router, prefix="/api/agents", tags=["agents"])
+app.include_router(admin_router, prefix="/api/admin", tags=["admin"])
 #app.include_router(system_router, prefix="/api/system", tags=["system"])
-#app.include_router(media_router, prefix="/api/media", tags=["media"])
+app.include_router(media_router, prefix="/api/media", tags=["media"])
+app.include_router(disks_router, prefix="/api/disks", tags=["disks"])
 #app.include_router(search_router, prefix="/api/search", tags=["search"])
 #app.include_router(cache_router, prefix="/api/cache", tags=["cache"])
 #app.include_router(sync_router, prefix="/api/sync", tags=["sync"])
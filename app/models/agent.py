@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Text
+from app.core.database import Base
+from app.utils.time_utils import get_current_time, format_datetime
+
+class Agent(Base):
+    __tablename__ = "agents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    host_url = Column(String(255), unique=True, index=True)  # Normalised http://host:port
+    name = Column(String(100), nullable=True)
+    version = Column(String(50), nullable=True)
+    groups = Column(String(255), nullable=True)  # Comma-separated host groups
+    status = Column(String(10), default="unknown")  # up/down/unknown
+    load = Column(Float, nullable=True)
+    running_tasks = Column(Text, nullable=True)  # JSON list of task IDs
+    failure_count = Column(Integer, default=0)
+    last_heartbeat = Column(DateTime, nullable=True)
+    last_checked = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=get_current_time)
+    updated_at = Column(DateTime, default=get_current_time, onupdate=get_current_time)
+
+    def get_formatted_last_heartbeat(self) -> str:
+        """Get formatted last heartbeat time"""
+        return format_datetime(self.last_heartbeat) if self.last_heartbeat else None
+
+    def __repr__(self):
+        return f"<Agent(host_url={self.host_url}, status={self.status})>"
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, DateTime, Boolean, LargeBinary
+from app.core.database import Base
+from app.utils.time_utils import get_current_time
+
+class CompressionDictionary(Base):
+    __tablename__ = "compression_dictionaries"
+
+    id = Column(Integer, primary_key=True, index=True)
+    dict_id = Column(Integer, unique=True, nullable=False)  # zstd dictionary ID, recorded in every frame header
+    data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer, nullable=True)
+    active = Column(Boolean, default=True)  # New data is compressed with the active dictionary
+    created_at = Column(DateTime, default=get_current_time)
+
+    def __repr__(self):
+        return f"<CompressionDictionary(dict_id={self.dict_id}, size={len(self.data) if self.data else 0}, active={self.active})>"
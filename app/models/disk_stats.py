@@ -0,0 +1,58 @@
+from datetime import UTC, datetime
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, String
+from app.core.database import Base
+
+class StorageSample(Base):
+    """Capacity of a MEDIA_DATA storage at one collection, the history capacity trends are fitted to"""
+    __tablename__ = "storage_samples"
+    __table_args__ = (Index("ix_storage_samples_storage_timestamp", "storage", "timestamp"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    storage = Column(String(100), nullable=False)  # Name in MEDIA_DATA
+    path = Column(String(255), nullable=False)
+    disk = Column(String(64), nullable=True)  # None on pooled and network filesystems
+    total_bytes = Column(Integer, nullable=False)
+    used_bytes = Column(Integer, nullable=False)
+    free_bytes = Column(Integer, nullable=False)  # Available to unprivileged users, as df reports it
+    timestamp = Column(DateTime, nullable=False, default=lambda: datetime.now(UTC), index=True)
+
+    def __repr__(self):
+        return f"<StorageSample(storage={self.storage}, used_bytes={self.used_bytes}, timestamp={self.timestamp})>"
+
+class DiskSample(Base):
+    """Power state, I/O rates and SMART health of a disk at one collection
+
+    SMART data is only read from awake disks; samples of a sleeping disk carry
+    the last values read, and smart_at tells how old they are.
+    """
+    __tablename__ = "disk_samples"
+    __table_args__ = (Index("ix_disk_samples_disk_timestamp", "disk", "timestamp"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    disk = Column(String(64), nullable=False)  # e.g. /dev/sdb
+    power_state = Column(String(32), nullable=True)  # As reported by hdparm -C; None if unknown
+    rotational = Column(Boolean, nullable=True)
+    size_bytes = Column(Integer, nullable=True)
+
+    # /proc/diskstats counters since boot, and the rates since the previous sample
+    read_bytes = Column(Integer, nullable=True)
+    written_bytes = Column(Integer, nullable=True)
+    io_ms = Column(Integer, nullable=True)
+    read_rate = Column(Float, nullable=True)  # Bytes per second; None for the first sample after a reboot
+    write_rate = Column(Float, nullable=True)
+    busy_percent = Column(Float, nullable=True)  # Share of the time with I/O in flight
+
+    # SMART data, as of smart_at
+    model = Column(String(100), nullable=True)
+    serial = Column(String(100), nullable=True)
+    smart_passed = Column(Boolean, nullable=True)
+    temperature = Column(Integer, nullable=True)  # Celsius
+    power_on_hours = Column(Integer, nullable=True)
+    reallocated_sectors = Column(Integer, nullable=True)
+    pending_sectors = Column(Integer, nullable=True)
+    smart_at = Column(DateTime, nullable=True)  # None if SMART was never read
+
+    timestamp = Column(DateTime, nullable=False, default=lambda: datetime.now(UTC), index=True)
+
+    def __repr__(self):
+        return f"<DiskSample(disk={self.disk}, power_state={self.power_state}, timestamp={self.timestamp})>"
@@ -1,6 +1,8 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, LargeBinary, Text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, LargeBinary
+from sqlalchemy.orm import deferred
 from app.core.database import Base
+from app.utils.compression_utils import CompressedText
 from app.utils.time_utils import get_current_time, format_datetime
 
 class Event(Base):
@@ -13,10 +15,13 @@ class Event(Base):
     sub_type = Column(String(50), nullable=True)
     status = Column(String(10), nullable=True)  # success, error, warning, info
     description = Column(String(255))
-    details = Column(Text, nullable=True)
+    details = deferred(Column(CompressedText, nullable=True))  # Long values are stored compressed; only loaded (and decompressed) when accessed
     has_attachment = Column(Boolean, default=False)
-    attachment_data = Column(LargeBinary, nullable=True)
+    attachment_data = deferred(Column(LargeBinary, nullable=True))  # Only loaded when accessed
     attachment_mime_type = Column(String(100), nullable=True)  # MIME type
+    attachment_size = Column(Integer, nullable=True)  # Uncompressed size in bytes
+    attachment_sha256 = Column(String(64), nullable=True)  # Of the uncompressed content
+    attachment_codec = Column(String(10), nullable=True)  # identity, gzip or zstd; NULL means identity
     
     @property
     def formatted_timestamp(self):
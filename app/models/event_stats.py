@@ -0,0 +1,42 @@
+from sqlalchemy import Column, Integer, String
+from app.core.database import Base
+
+class EventStatsDaily(Base):
+    """Event counts per day, type, sub-type and status, kept up to date by triggers on events"""
+    __tablename__ = "event_stats_daily"
+
+    day = Column(String(10), primary_key=True)  # YYYY-MM-DD of events.timestamp
+    type = Column(String(50), primary_key=True)
+    sub_type = Column(String(50), primary_key=True)  # '' for events without a sub-type
+    status = Column(String(10), primary_key=True)  # '' for events without a status
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<EventStatsDaily(day={self.day}, type={self.type}, sub_type={self.sub_type}, status={self.status}, count={self.count})>"
+
+# Key of an events row in event_stats_daily; NULLs become '' so they can be part of the primary key
+_KEY = "coalesce(date({row}.timestamp), ''), coalesce({row}.type, ''), coalesce({row}.sub_type, ''), coalesce({row}.status, '')"
+_MATCH = "(day, type, sub_type, status) = (" + _KEY + ")"
+
+_INCREMENT = (
+    "INSERT INTO event_stats_daily (day, type, sub_type, status, count) VALUES (" + _KEY + ", 1) "
+    "ON CONFLICT (day, type, sub_type, status) DO UPDATE SET count = count + 1;"
+)
+_DECREMENT = "UPDATE event_stats_daily SET count = count - 1 WHERE " + _MATCH + ";"
+
+# The triggers run in the same transaction as every insert, update and delete of events,
+# whether it comes from the ORM, a bulk INSERT or a retention DELETE
+EVENT_STATS_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS event_stats_after_insert AFTER INSERT ON events BEGIN "
+    + _INCREMENT.format(row="NEW") + " END",
+    "CREATE TRIGGER IF NOT EXISTS event_stats_after_delete AFTER DELETE ON events BEGIN "
+    + _DECREMENT.format(row="OLD") + " END",
+    "CREATE TRIGGER IF NOT EXISTS event_stats_after_update AFTER UPDATE OF timestamp, type, sub_type, status ON events "
+    "WHEN (" + _KEY.format(row="OLD") + ") IS NOT (" + _KEY.format(row="NEW") + ") BEGIN "
+    + _DECREMENT.format(row="OLD") + " " + _INCREMENT.format(row="NEW") + " END",
+]
+
+EVENT_STATS_BACKFILL = (
+    "INSERT INTO event_stats_daily (day, type, sub_type, status, count) "
+    "SELECT " + _KEY.format(row="events") + ", count(*) FROM events GROUP BY 1, 2, 3, 4"
+)
@@ -16,4 +16,6 @@ class Status(str, Enum):
     """Status enum for event status values."""
     INFO = "info"
     SUCCESS = "success"
-    ERROR = "error" 
\ No newline at end of file
+    ERROR = "error"
+    WARNING = "warning"
+    CANCELLED = "cancelled" 
\ No newline at end of file
@@ -1,5 +1,5 @@
 from datetime import UTC, datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.core.database import MediaBase
 import enum
@@ -18,7 +18,8 @@ class MediaType(enum.Enum):
 
 class CacheStatus(enum.Enum):
     NONE = "none"
-    MANUAL = "manual"
+    MANUAL = "manual"  # Pinned in the cache, never evicted
+    CACHED = "cached"  # Copied to the cache, evicted when space is needed
 
 class PendingStatus(enum.Enum):
     NONE = "none"
@@ -36,6 +37,15 @@ class FolderType(enum.Enum):
     MERGE = "merge"
     SOURCE = "source"
 
+class TitleCacheState(enum.Enum):
+    NONE = "none"  # No item of the title is cached
+    PARTIAL = "partial"
+    FULL = "full"  # Every item of the title is cached
+
+class FileFindingType(enum.Enum):
+    DUPLICATE = "duplicate"  # Same content as another source file
+    CACHE_MISMATCH = "cache_mismatch"  # Cache copy differs from its source file
+
 class MediaTitle(MediaBase):
     __tablename__ = 'media_titles'
 
@@ -48,8 +58,8 @@ class MediaTitle(MediaBase):
     title = Column(String(255), nullable=False)
     media_type = Column(Enum(MediaType), nullable=False)
 
-    created_at = Column(DateTime, default=datetime.now(UTC))
-    updated_at = Column(DateTime, default=datetime.now(UTC), onupdate=datetime.now(UTC))
+    created_at = Column(DateTime, default=lambda: datetime.now(UTC))
+    updated_at = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
 
 
 class MediaSourceItem(MediaBase):
@@ -58,7 +68,7 @@ class MediaSourceItem(MediaBase):
     id = Column(Integer, primary_key=True, index=True)
 
     # Relationships
-    media_title_id = Column(Integer, ForeignKey('media_titles.id'))
+    media_title_id = Column(Integer, ForeignKey('media_titles.id'), index=True)
     media_title = relationship("MediaTitle", back_populates="media_source_items")
 
     source_folder_group_id = Column(Integer, ForeignKey('media_folder_groups.id'))
@@ -71,6 +81,8 @@ class MediaSourceItem(MediaBase):
     source_files = relationship("MediaSourceFile", back_populates="media_source_item")
     cache_status = Column(Enum(CacheStatus), nullable=False)
     pending = Column(Enum(PendingStatus), nullable=False)
+    last_accessed = Column(DateTime, nullable=True)  # Drive LRU/LFU eviction from the cache
+    access_count = Column(Integer, nullable=True)
 
 class MediaSourceFile(MediaBase):
     __tablename__ = 'media_source_files'
@@ -78,17 +90,19 @@ class MediaSourceFile(MediaBase):
     id = Column(Integer, primary_key=True, index=True)
 
     # Relationships
-    media_source_item_id = Column(Integer, ForeignKey('media_source_items.id'))
+    media_source_item_id = Column(Integer, ForeignKey('media_source_items.id'), index=True)
     media_source_item = relationship("MediaSourceItem", back_populates="source_files")
 
     cache_folder_group_id = Column(Integer, ForeignKey('media_folder_groups.id'))
     cache_folder_group = relationship("MediaFolderGroup", back_populates="source_files")
 
     # Data
-    relative_title_path = Column(String(255), nullable=False)
+    relative_title_path = Column(String(255), nullable=False, index=True)
     file_type = Column(Enum(MediaFileType), nullable=False)
     file_attributes = Column(String(255), nullable=False)
     cache_status = Column(Enum(CacheStatus), nullable=False)
+    probe_id = Column(Integer, ForeignKey('media_probes.id'), nullable=True)  # Of the file as of the last probe
+    probe = relationship("MediaProbe")
     
     linked_files = relationship("MediaLinkedFile", back_populates="source_file")    
 
@@ -98,11 +112,17 @@ class MediaLinkedFile(MediaBase):
     id = Column(Integer, primary_key=True, index=True)
 
     # Relationships
+    source_file_id = Column(Integer, ForeignKey('media_source_files.id'))
+    source_file = relationship("MediaSourceFile", back_populates="linked_files")
+
     source_folder_group_id = Column(Integer, ForeignKey('media_folder_groups.id'))
-    source_folder_group = relationship("MediaFolderGroup", backref="source_linked_files", secondary="media_linked_files")
+    source_folder_group = relationship("MediaFolderGroup", foreign_keys=[source_folder_group_id], back_populates="source_linked_files")
 
     target_folder_group_id = Column(Integer, ForeignKey('media_folder_groups.id')) 
-    target_folder_group = relationship("MediaFolderGroup", backref="target_linked_files", secondary="media_linked_files")
+    target_folder_group = relationship("MediaFolderGroup", foreign_keys=[target_folder_group_id], back_populates="target_linked_files")
+
+    # Data
+    relative_path = Column(String(255), nullable=True, index=True)  # Of the link, relative to the target folder group's base path
 
 
 class MediaFolderGroup(MediaBase):
@@ -111,11 +131,122 @@ class MediaFolderGroup(MediaBase):
     id = Column(Integer, primary_key=True, index=True)
 
     # Relationships
-    source_linked_files = relationship("MediaLinkedFile", backref="source_folder_group", secondary="media_linked_files")
-    target_linked_files = relationship("MediaLinkedFile", backref="target_folder_group", secondary="media_linked_files")
-    media_source_items = relationship("MediaSourceItem", back_populates="media_folder_group")
+    source_linked_files = relationship("MediaLinkedFile", foreign_keys="MediaLinkedFile.source_folder_group_id", back_populates="source_folder_group")
+    target_linked_files = relationship("MediaLinkedFile", foreign_keys="MediaLinkedFile.target_folder_group_id", back_populates="target_folder_group")
+    media_source_items = relationship("MediaSourceItem", back_populates="source_folder_group")
+    source_files = relationship("MediaSourceFile", back_populates="cache_folder_group")
+    scan_directories = relationship("MediaScanDirectory", back_populates="folder_group")
 
     # Data
     base_path = Column(String(255), nullable=False)
     type = Column(Enum(FolderType), nullable=False)
 
+class MediaScanDirectory(MediaBase):
+    """Fingerprint of a library directory as of the last scan that listed it
+
+    Rescans only list directories whose inode or mtime changed since.
+    """
+    __tablename__ = 'media_scan_directories'
+    __table_args__ = (UniqueConstraint('folder_group_id', 'relative_path'),)
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Relationships
+    folder_group_id = Column(Integer, ForeignKey('media_folder_groups.id'), nullable=False)
+    folder_group = relationship("MediaFolderGroup", back_populates="scan_directories")
+
+    # Data
+    relative_path = Column(String(255), nullable=False)  # Relative to the folder group's base path
+    inode = Column(Integer, nullable=False)
+    mtime_ns = Column(Integer, nullable=True)  # NULL if it changed too close to the scan to be trusted
+    entry_count = Column(Integer, nullable=False)
+    subdirectories = Column(Text, nullable=False)  # JSON list of subdirectory names
+
+class MediaFileHash(MediaBase):
+    """Content hashes of a file version, so unchanged files are never read again"""
+    __tablename__ = 'media_file_hashes'
+    __table_args__ = (UniqueConstraint('inode', 'size', 'mtime_ns'),)
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Data
+    inode = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    mtime_ns = Column(Integer, nullable=False)
+    partial_hash = Column(String(64), nullable=False)  # Of the first, middle and last blocks
+    full_hash = Column(String(64), nullable=True)  # Only computed for files whose partial hash collides
+    hashed_at = Column(DateTime, default=lambda: datetime.now(UTC))
+
+class MediaFileFinding(MediaBase):
+    """A duplicate or corrupt file found by the last verification run"""
+    __tablename__ = 'media_file_findings'
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Relationships
+    source_file_id = Column(Integer, ForeignKey('media_source_files.id'), nullable=False)
+    source_file = relationship("MediaSourceFile")
+
+    # Data
+    type = Column(Enum(FileFindingType), nullable=False)
+    group_key = Column(String(64), nullable=False)  # Findings with the same key are copies of each other
+    path = Column(String(255), nullable=False)  # The file that was checked
+    size = Column(Integer, nullable=False)
+    detected_at = Column(DateTime, default=lambda: datetime.now(UTC))
+
+class MediaProbe(MediaBase):
+    """Streams of a video file version as reported by ffprobe, so unchanged files are never probed again"""
+    __tablename__ = 'media_probes'
+    __table_args__ = (UniqueConstraint('inode', 'size', 'mtime_ns'),)
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Data
+    inode = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)
+    mtime_ns = Column(Integer, nullable=False)
+    video_codec = Column(String(32), nullable=True)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    duration = Column(Float, nullable=True)  # Seconds
+    audio_tracks = Column(Text, nullable=True)  # JSON list of {codec, channels, language}
+    subtitle_tracks = Column(Text, nullable=True)  # JSON list of {codec, language, forced}
+    quality = Column(Enum(QualityLevel), nullable=False)  # From the resolution; UNKNOWN without a video stream
+    error = Column(Text, nullable=True)  # Why ffprobe failed; retried after MEDIA_PROBE.RETRY_AFTER, doubled per failure
+    attempts = Column(Integer, nullable=True)  # Failed probes of this file version in a row; 0 once it succeeds
+    probed_at = Column(DateTime, default=lambda: datetime.now(UTC))
+
+class MediaTitleSummary(MediaBase):
+    """Per-title counts of items by quality and cache state, kept up to date by the scanner and cache runs
+
+    Lets the library be listed from one table without loading items and files.
+    """
+    __tablename__ = 'media_title_summary'
+    __table_args__ = (Index('ix_media_title_summary_type_title', 'media_type', 'title'),)
+
+    media_title_id = Column(Integer, ForeignKey('media_titles.id'), primary_key=True)
+
+    # Copied from the title, so listings never join it
+    title = Column(String(255), nullable=False, index=True)
+    media_type = Column(Enum(MediaType), nullable=False)
+
+    # Data
+    item_count = Column(Integer, nullable=False)
+    season_count = Column(Integer, nullable=False)
+    episode_count = Column(Integer, nullable=False)  # Distinct (season, episode) pairs; 0 for movies
+    file_count = Column(Integer, nullable=False)
+    size_bytes = Column(Integer, nullable=False)  # Of every file, as of the last scan
+    uhd_items = Column(Integer, nullable=False)
+    fhd_items = Column(Integer, nullable=False)
+    hd_items = Column(Integer, nullable=False)
+    sd_items = Column(Integer, nullable=False)
+    ld_items = Column(Integer, nullable=False)
+    unknown_items = Column(Integer, nullable=False)
+    best_quality = Column(Enum(QualityLevel), nullable=False, index=True)
+    cached_items = Column(Integer, nullable=False)  # Including pinned ones
+    pinned_items = Column(Integer, nullable=False)
+    pending_items = Column(Integer, nullable=False)
+    cached_bytes = Column(Integer, nullable=False)  # Of files with a cache copy
+    cache_state = Column(Enum(TitleCacheState), nullable=False, index=True)
+    last_accessed = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=lambda: datetime.now(UTC), onupdate=lambda: datetime.now(UTC))
@@ -15,6 +15,7 @@ class Task(Base):
     task_type = Column(String(20), default="interval")
     function_name = Column(String(100))
     host_url = Column(String(255), nullable=True)  # Can store full URLs or host:port combinations
+    host_group = Column(String(50), nullable=True)  # Run on every agent in this group instead of host_url
     hours = Column(Integer, default=0)
     minutes = Column(Integer, default=0)
     seconds = Column(Integer, default=0)
@@ -23,7 +24,7 @@ class Task(Base):
     cron_second = Column(String(10), default="*")
     last_start_time = Column(DateTime, nullable=True)
     last_end_time = Column(DateTime, nullable=True)
-    last_status = Column(String(10), nullable=True)  # success/error/running
+    last_status = Column(String(10), nullable=True)  # success/error/running/cancelled
     created_at = Column(DateTime, default=get_current_time)
     updated_at = Column(DateTime, default=get_current_time, onupdate=get_current_time)
 
@@ -33,7 +34,7 @@ class Task(Base):
             name='valid_task_type'
         ),
         CheckConstraint(
-            "last_status IN ('success', 'error', 'running', NULL)",
+            "last_status IN ('success', 'error', 'running', 'cancelled', NULL)",
             name='valid_last_status'
         ),
     )
@@ -3,19 +3,26 @@ from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.events import EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED
 from datetime import datetime, timedelta
-from typing import Dict, Callable, Any, List, Optional
+from typing import Dict, Callable, Any, List, Optional, Union
 from dataclasses import dataclass
 import asyncio
+import importlib
 import logging
+import threading
+import time
 import pytz
 
 # from app.api.managers.sync_manager import SyncManager
 from app.core.settings import settings
-from app.tasks import backup_opnsense, run_script, run_snapraid, test_task, spindown_disks, sync_data_cloud
-from app.tasks.restic_backup import restic_backup
-from app.tasks.backup_stacks import backup_stacks
+from app.core.logging_config import log_context
+from app.core.metrics import (
+    SCHEDULER_BUSY_THREADS, SCHEDULER_JOB_LAG, SCHEDULER_MISSED_JOBS, SCHEDULER_QUEUE_DEPTH, TASK_DURATION, TASKS_RUNNING
+)
 from app.utils.event_utils import EventManagerUtil
+from app.utils.process_utils import TaskCancelledError, start_run, finish_run
+from app.utils.profiler import DEFAULT_INTERVAL, SamplingProfiler
 from app.models.event_types import EventType, SubEventType
 
 logger = logging.getLogger(__name__)
@@ -38,6 +45,33 @@ scheduler = BackgroundScheduler(
     timezone=pytz.timezone('Europe/London')
 )
 
+# Wall-clock start of each task's latest run, used to measure how late scheduled jobs start
+_job_start_times: Dict[str, float] = {}
+
+def _executor_queue_depth() -> int:
+    """Jobs waiting for a free executor thread"""
+    pool = getattr(scheduler._lookup_executor('default'), '_pool', None)
+    return pool._work_queue.qsize() if pool else 0
+
+def _executor_busy_threads() -> int:
+    """Executor threads running a job (submitted jobs minus those still queued)"""
+    executor = scheduler._lookup_executor('default')
+    return max(sum(executor._instances.values()) - _executor_queue_depth(), 0)
+
+SCHEDULER_QUEUE_DEPTH.set_function(_executor_queue_depth)
+SCHEDULER_BUSY_THREADS.set_function(_executor_busy_threads)
+
+def _record_job_metrics(event) -> None:
+    """Scheduler listener recording missed runs and the start lag of completed runs"""
+    if event.code == EVENT_JOB_MISSED:
+        SCHEDULER_MISSED_JOBS.labels(event.job_id).inc()
+        return
+    started = _job_start_times.pop(event.job_id, None)
+    scheduled = event.scheduled_run_time.timestamp() if event.scheduled_run_time else None
+    # A start before the scheduled time belongs to a manual run, not this one
+    if started is not None and scheduled is not None and started >= scheduled:
+        SCHEDULER_JOB_LAG.labels(event.job_id).observe(started - scheduled)
+
 @dataclass
 class TaskConfig:
     task_id: str
@@ -67,8 +101,25 @@ class Task:
 # Dictionary to store registered task functions
 task_registry: Dict[str, Callable] = {}
 
-def create_task_event(task_id: str, status: str = "started") -> None:
-    """Create a task event in the database and update task status"""
+# Task functions registered by dotted path, imported on their first run
+_resolved_functions: Dict[str, Callable] = {}
+
+def resolve_task_function(func: Union[str, Callable]) -> Callable:
+    """Get a task function, importing it first if it was registered by "package.module:function" path"""
+    if callable(func):
+        return func
+    resolved = _resolved_functions.get(func)
+    if resolved is None:
+        module_name, _, function_name = func.partition(":")
+        resolved = getattr(importlib.import_module(module_name), function_name)
+        _resolved_functions[func] = resolved
+    return resolved
+
+def create_task_event(task_id: str, status: str = "started", reason: str = None, profile: SamplingProfiler = None) -> None:
+    """Create a task event in the database and update task status
+
+    A profile recorded for the run is attached to the event as speedscope JSON.
+    """
     try:
         # Update task status in database
         from app.core.database import MainSessionLocal
@@ -81,7 +132,7 @@ def create_task_event(task_id: str, status: str = "started") -> None:
             if task:
                 if status == "started":
                     task.last_start_time = datetime.now()
-                elif status in ["success", "error"]:
+                elif status in ["success", "error", "cancelled"]:
                     task.last_end_time = datetime.now()
                 task.last_status = status
                 db.commit()
@@ -89,18 +140,21 @@ def create_task_event(task_id: str, status: str = "started") -> None:
             db.close()
             
         # Create event
+        attachment_data, attachment_mime_type = profile.export(name=f"Task {task_id}") if profile else (None, None)
         with EventManagerUtil.get_event_manager() as event_manager:
-            event_manager.add_event(
+            event_manager.add_event_with_output(
                 type=EventType.TASK,
                 sub_type=task_id,
                 status=status,
-                description=f"Task {task_id} {status}",
-                details=f"Task {task_id} {status} at {datetime.now()}"
+                description=f"Task {task_id} {reason or status}",
+                details=f"Task {task_id} {reason or status} at {datetime.now()}",
+                attachment_data=attachment_data,
+                attachment_mime_type=attachment_mime_type
             )
     except Exception as e:
         logger.error(f"Error creating task event: {str(e)}", exc_info=True)
 
-def task_wrapper(func_task_id: str, func: Callable, default_args: List[Any] = None, default_parameters: Dict[str, Any] = None) -> Callable:
+def task_wrapper(func_task_id: str, func: Union[str, Callable], default_args: List[Any] = None, default_parameters: Dict[str, Any] = None) -> Callable:
     """Wrapper function that creates events before and after task execution"""
     if default_args is None:
         default_args = []
@@ -108,6 +162,14 @@ def task_wrapper(func_task_id: str, func: Callable, default_args: List[Any] = No
         default_parameters = {}
 
     def wrapped(*args, **kwargs):
+        # Tag everything logged during the run with the task ID
+        task_id = args[0] if args else kwargs.get('task_id', func_task_id)
+        with log_context(task_id=task_id):
+            return run_wrapped(*args, **kwargs)
+
+    def run_wrapped(*args, **kwargs):
+        started = time.perf_counter()
+        profiler = None
         try:
             # Check if task is enabled in database
             try:
@@ -129,56 +191,86 @@ def task_wrapper(func_task_id: str, func: Callable, default_args: List[Any] = No
                 logger.error(f"Error checking task status in database: {str(e)}")
                 return
                 
-            # Notify task start
+            # Notify task start and register the live run so it can be cancelled
+            _job_start_times[task_id] = time.time()
             create_task_event(task_id, "started")
+            task_data = settings.TASKS.get(task_id, {})
+            run = start_run(task_id, timeout=task_data.get("timeout"))
+            TASKS_RUNNING.inc()
+            if task_data.get("profile"):
+                # Sample only this run's thread, including its waits: for tasks that run a
+                # subprocess, waiting on it is where the time goes
+                profiler = SamplingProfiler(
+                    interval=task_data.get("profile_interval", DEFAULT_INTERVAL),
+                    thread_ids=[threading.get_ident()],
+                    include_idle=True
+                ).start()
             
-            # Get function signature to check if it accepts arguments
-            import inspect
-            sig = inspect.signature(func)
-            
-            # Only merge args/kwargs if the function accepts them
-            if len(sig.parameters) > 0:
-                # Get task configuration
-                task_data = settings.TASKS.get(task_id, {})
-                task_params = task_data.get("params", {})
-                
-                # Merge default args/kwargs with provided ones and task params
-                merged_args = list(default_args) + list(args)
-                merged_kwargs = {**default_parameters, **task_params, **kwargs}
+            try:
+                # Task modules are only imported once one of their tasks runs
+                task_func = resolve_task_function(func)
+
+                # Get function signature to check if it accepts arguments
+                import inspect
+                sig = inspect.signature(task_func)
                 
-                # Check if the function is a coroutine
-                if asyncio.iscoroutinefunction(func):
-                    # Create event loop if it doesn't exist
-                    try:
-                        loop = asyncio.get_event_loop()
-                    except RuntimeError:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-                    # Run the async function
-                    result = loop.run_until_complete(func(*merged_args, **merged_kwargs))
+                # Only merge args/kwargs if the function accepts them
+                if len(sig.parameters) > 0:
+                    # Get task configuration
+                    task_params = task_data.get("params", {})
+                    
+                    # Merge default args/kwargs with provided ones and task params
+                    merged_args = list(default_args) + list(args)
+                    merged_kwargs = {**default_parameters, **task_params, **kwargs}
+                    
+                    # Check if the function is a coroutine
+                    if asyncio.iscoroutinefunction(task_func):
+                        # Create event loop if it doesn't exist
+                        try:
+                            loop = asyncio.get_event_loop()
+                        except RuntimeError:
+                            loop = asyncio.new_event_loop()
+                            asyncio.set_event_loop(loop)
+                        # Run the async function
+                        result = loop.run_until_complete(task_func(*merged_args, **merged_kwargs))
+                    else:
+                        # Run the sync function directly
+                        result = task_func(*merged_args, **merged_kwargs)
                 else:
-                    # Run the sync function directly
-                    result = func(*merged_args, **merged_kwargs)
-            else:
-                # Function doesn't accept arguments, call it directly
-                result = func()
+                    # Function doesn't accept arguments, call it directly
+                    result = task_func()
+                
+                # Tasks may swallow errors from killed commands, so check the run itself
+                run.check_cancelled()
+            finally:
+                finish_run(run)
+                TASKS_RUNNING.dec()
+                if profiler:
+                    profiler.stop()
                 
             # Notify task success
-            create_task_event(task_id, "success")
+            TASK_DURATION.labels(task_id, "success").observe(time.perf_counter() - started)
+            create_task_event(task_id, "success", profile=profiler)
             return result
+        except TaskCancelledError as e:
+            # Cancelled or timed out runs are recorded with their own status
+            TASK_DURATION.labels(task_id, "cancelled").observe(time.perf_counter() - started)
+            create_task_event(task_id, "cancelled", reason=e.reason, profile=profiler)
+            logger.warning(f"Task {task_id} {e.reason}")
         except Exception as e:
             # Notify task error
-            create_task_event(task_id, "error")
+            TASK_DURATION.labels(task_id, "error").observe(time.perf_counter() - started)
+            create_task_event(task_id, "error", profile=profiler)
             logger.error(f"Error in task {task_id}: {str(e)}", exc_info=True)
             raise e
     return wrapped
 
-def register_task(name: str, func: Callable, create_events: bool = True, default_args: List[Any] = None, default_parameters: Dict[str, Any] = None, task_id_prefix: str = None) -> None:
+def register_task(name: str, func: Union[str, Callable], create_events: bool = True, default_args: List[Any] = None, default_parameters: Dict[str, Any] = None, task_id_prefix: str = None) -> None:
     """Register a task function with the scheduler
     
     Args:
         name: The name of the task
-        func: The function to execute
+        func: The function to execute, or its "package.module:function" path to import it on first run
         create_events: Whether to create events for this task
         default_args: Default positional arguments to pass to the task
         default_parameters: Default keyword arguments to pass to the task
@@ -200,6 +292,7 @@ def get_task_function(name: str) -> Callable:
 def start_scheduler():
     """Start the scheduler and add default jobs"""
     if not scheduler.running:
+        scheduler.add_listener(_record_job_metrics, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
         scheduler.start()
         
         # Check if tasks configuration exists, if not, don't add any tasks
@@ -334,14 +427,21 @@ def sync_task():
 
 # Register example tasks
 register_task("sync", sync_task)
-register_task("snapraid", run_snapraid.run_snapraid)
-register_task("test_task", test_task.dummy_task, create_events=False)  # Register once, used by multiple config entries
-register_task("spindown_disks", spindown_disks.spindown_disks)
-register_task("sync_data_cloud", sync_data_cloud.sync_data_cloud)
-register_task("backup_opnsense", backup_opnsense.backup_opnsense)
-register_task("run_script", run_script.run_script_task)
-register_task("run_media_systems_script", run_script.run_media_systems_script_task)
-register_task("restic_backup", restic_backup)
-register_task("backup_stacks", backup_stacks)
+register_task("snapraid", "app.tasks.run_snapraid:run_snapraid")
+register_task("test_task", "app.tasks.test_task:dummy_task", create_events=False)  # Register once, used by multiple config entries
+register_task("spindown_disks", "app.tasks.spindown_disks:spindown_disks")
+register_task("sync_data_cloud", "app.tasks.sync_data_cloud:sync_data_cloud")
+register_task("backup_opnsense", "app.tasks.backup_opnsense:backup_opnsense")
+register_task("run_script", "app.tasks.run_script:run_script_task")
+register_task("run_media_systems_script", "app.tasks.run_script:run_media_systems_script_task")
+register_task("restic_backup", "app.tasks.restic_backup:restic_backup")
+register_task("backup_stacks", "app.tasks.backup_stacks:backup_stacks")
+register_task("compact_events", "app.tasks.compact_events:compact_events")
+register_task("scan_media", "app.tasks.scan_media:scan_media")
+register_task("cache_media", "app.tasks.cache_media:cache_media")
+register_task("merge_media", "app.tasks.merge_media:merge_media")
+register_task("verify_media", "app.tasks.verify_media:verify_media")
+register_task("probe_media", "app.tasks.probe_media:probe_media")
+register_task("collect_disk_stats", "app.tasks.collect_disk_stats:collect_disk_stats")
 
 # You can add more task functions here 
\ No newline at end of file
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import List, Optional
+
+class AgentHeartbeatAPIRequest(BaseModel):
+    host_url: str
+    name: Optional[str] = None
+    version: Optional[str] = None
+    load: Optional[float] = None
+    running_tasks: List[str] = []
+    groups: List[str] = []
@@ -12,6 +12,13 @@ class EventBase(BaseModel):
 class EventCreate(EventBase):
     pass
 
+class EventBatchItem(EventBase):
+    details: str = ""
+    parent_id: Optional[int] = None
+    timestamp: Optional[datetime] = None
+    attachment: Optional[str] = None  # Name of the multipart part holding the attachment
+    attachment_type: Optional[str] = None
+
 class Event(EventBase):
     id: int
     timestamp: datetime
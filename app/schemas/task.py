@@ -11,6 +11,8 @@ class TaskStartAPIRequest(BaseModel):
 
 class TaskEndAPIRequest(BaseModel):
     status: str = "success"
+    host_url: Optional[str] = None
+    parent_id: Optional[int] = None  # Fan-out event this run belongs to
 
 class TaskCreateAPIRequest(BaseModel):
     name: str
@@ -19,6 +21,7 @@ class TaskCreateAPIRequest(BaseModel):
     task_type: str = "external"
     enabled: bool = True
     host_url: Optional[str] = None
+    host_group: Optional[str] = None
     hours: Optional[int] = None
     minutes: Optional[int] = None
     seconds: Optional[int] = None
@@ -5,6 +5,7 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime
 from app.utils.event_utils import EventManagerUtil
 from app.utils.file_utils import AttachDataMimeType
+from app.utils.process_utils import run_process, TaskCancelledError
 
 logger = logging.getLogger(__name__)
 
@@ -30,15 +31,16 @@ def _create_event(status: str, description: str, details: str, attachment_data:
                 details=details
             )
 
-def _run_command(cmd: List[str], env: Dict[str, str], capture_output: bool = True) -> subprocess.CompletedProcess:
+def _run_command(cmd: List[str], env: Dict[str, str], capture_output: bool = True, cancellable: bool = True) -> subprocess.CompletedProcess:
     """Helper function to run commands with consistent error handling."""
     try:
-        return subprocess.run(
+        return run_process(
             cmd,
             check=True,
             capture_output=capture_output,
             text=True,
-            env=env
+            env=env,
+            cancellable=cancellable
         )
     except subprocess.CalledProcessError as e:
         error_msg = f"Command failed: {' '.join(cmd)}\nError: {str(e)}"
@@ -123,23 +125,27 @@ def backup_stacks(task_id: str, **params: Dict[str, Any]) -> None:
                 logger.info(f"Stopping containers for {stack}...")
                 _run_command(["docker", "stop"] + running_containers, env)
             
-            # Run backup
-            logger.info(f"Running restic backup for {stack}...")
-            restic_cmd = ["sudo", restic_path, "backup", "-r", restic_repo]
-            restic_cmd.extend(additional_args)
-            restic_cmd.append(backup_path)
-            
-            backup_result = _run_command(restic_cmd, env)
-            _create_event("success", f"Backup completed for stack: {stack}",
-                         f"Backup path: {backup_path}\nRepository: {restic_repo}",
-                         backup_result.stdout.encode('utf-8'))
-            
-            if running_containers:
-                logger.info(f"Starting containers for {stack}...")
-                _run_command(["docker", "start"] + running_containers, env)
+            try:
+                # Run backup
+                logger.info(f"Running restic backup for {stack}...")
+                restic_cmd = ["sudo", restic_path, "backup", "-r", restic_repo]
+                restic_cmd.extend(additional_args)
+                restic_cmd.append(backup_path)
+                
+                backup_result = _run_command(restic_cmd, env)
+                _create_event("success", f"Backup completed for stack: {stack}",
+                             f"Backup path: {backup_path}\nRepository: {restic_repo}",
+                             backup_result.stdout.encode('utf-8'))
+            finally:
+                # Always bring the stack back up, even if the backup was cancelled
+                if running_containers:
+                    logger.info(f"Starting containers for {stack}...")
+                    _run_command(["docker", "start"] + running_containers, env, cancellable=False)
             
             logger.info(f"Backup completed for {stack}")
             
+        except TaskCancelledError:
+            raise
         except subprocess.CalledProcessError as e:
             error_msg = f"Error backing up stack {stack}: {str(e)}"
             logger.error(error_msg)
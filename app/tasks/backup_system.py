@@ -4,6 +4,7 @@ import time
 from typing import Optional
 from app.utils.file_utils import AttachDataMimeType
 from app.utils.event_utils import EventManagerUtil
+from app.utils.process_utils import run_process
 
 
 def _create_event(status: str, description: str, details: str, attachment_data: Optional[bytes] = None) -> None:
@@ -54,7 +55,7 @@ def backup_system_task() -> str:
     # Run the script and capture its output
     try:
         # Run the script with subprocess
-        script_result = subprocess.run(['bash', script_path], 
+        script_result = run_process(['bash', script_path], 
             capture_output=True, 
             text=True, 
             check=True)
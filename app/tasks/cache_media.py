@@ -0,0 +1,27 @@
+from app.core.database import MediaSessionLocal
+from app.api.managers.media_cache_manager import MediaCacheManager
+from app.utils.event_utils import create_event
+
+
+def cache_media() -> str:
+    """
+    Promote pending media items to the cache and demote and evict others to stay within its budget.
+        
+    Returns:
+        str: Summary of the cache run
+    """
+    db = MediaSessionLocal()
+    try:
+        result = MediaCacheManager(db).apply()
+    finally:
+        db.close()
+    
+    summary = "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in result.items())
+    create_event(
+        status="warning" if result["failed_items"] or result["deferred_items"] else "success",
+        event_type="task",
+        sub_type="cache_media",
+        description="Media cache run completed",
+        details=summary
+    )
+    return summary
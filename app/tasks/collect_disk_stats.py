@@ -0,0 +1,27 @@
+from app.core.database import MainSessionLocal
+from app.api.managers.disk_health_manager import DiskHealthManager
+from app.utils.event_utils import create_event
+
+
+def collect_disk_stats() -> str:
+    """
+    Sample storage capacity, disk I/O rates and SMART health for the disk manager page, without waking sleeping disks.
+    
+    Returns:
+        str: Summary of the collection
+    """
+    db = MainSessionLocal()
+    try:
+        result = DiskHealthManager(db).collect()
+    finally:
+        db.close()
+    
+    summary = "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in result.items())
+    create_event(
+        status="warning" if result["disks_unhealthy"] or result["storages_failed"] else "success",
+        event_type="task",
+        sub_type="collect_disk_stats",
+        description="Disk health collection completed",
+        details=summary
+    )
+    return summary
@@ -0,0 +1,62 @@
+import time
+from app.core.database import main_engine
+from app.utils.compression_utils import resolve_codec
+from app.utils.event_utils import EventManagerUtil, create_event
+
+
+def _database_size() -> int:
+    with main_engine.connect() as conn:
+        page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    return page_count * page_size
+
+
+def compact_events(train_dictionary: bool = True, vacuum: bool = True) -> str:
+    """
+    Compress stored event attachments and details, then reclaim the freed space.
+    
+    Trains a new zstd dictionary from recent logs (when zstandard is installed),
+    re-encodes attachments and long details that are not yet stored with the
+    configured codec and active dictionary, and runs VACUUM.
+    
+    Args:
+        train_dictionary (bool): Train a new dictionary before recompressing
+        vacuum (bool): Run VACUUM afterwards to shrink the database file
+        
+    Returns:
+        str: Summary of the compaction
+    """
+    start_time = time.time()
+    size_before = _database_size()
+    
+    with EventManagerUtil.get_event_manager() as event_manager:
+        event_manager.load_compression_dictionaries()
+        dictionary = event_manager.train_compression_dictionary() if train_dictionary else None
+        dict_id = dictionary.dict_id if dictionary else None
+        attachment_stats = event_manager.recompress_attachments()
+        details_rewritten = event_manager.recompress_details(include_compressed=dict_id is not None)
+    
+    if vacuum:
+        with main_engine.connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("VACUUM")
+    
+    size_after = _database_size()
+    duration = time.time() - start_time
+    summary = (
+        f"Codec: {resolve_codec()}\n"
+        f"Dictionary: {dict_id or 'unchanged'}\n"
+        f"Attachments recompressed: {attachment_stats['recompressed']} "
+        f"({attachment_stats['bytes_before']} -> {attachment_stats['bytes_after']} bytes)\n"
+        f"Details rewritten: {details_rewritten}\n"
+        f"Database size: {size_before} -> {size_after} bytes\n"
+        f"Duration: {duration:.2f} seconds"
+    )
+    
+    create_event(
+        status="success",
+        event_type="task",
+        sub_type="compact_events",
+        description="Event storage compaction completed",
+        details=summary
+    )
+    return summary
@@ -0,0 +1,30 @@
+from app.core.database import MediaSessionLocal
+from app.api.managers.media_merge_manager import MediaMergeManager
+from app.utils.event_utils import create_event
+
+
+def merge_media(full: bool = False) -> str:
+    """
+    Update the merged media libraries' links to match the media database.
+    
+    Args:
+        full (bool): Rebuild the merged libraries and swap them in instead of only changing links that differ
+        
+    Returns:
+        str: Summary of the links changed
+    """
+    db = MediaSessionLocal()
+    try:
+        result = MediaMergeManager(db).build(full=full)
+    finally:
+        db.close()
+    
+    summary = "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in result.items())
+    create_event(
+        status="success",
+        event_type="task",
+        sub_type="merge_media",
+        description="Merged media libraries updated",
+        details=summary
+    )
+    return summary
@@ -0,0 +1,30 @@
+from app.core.database import MediaSessionLocal
+from app.api.managers.media_probe_manager import MediaProbeManager
+from app.utils.event_utils import create_event
+
+
+def probe_media(limit: int = None) -> str:
+    """
+    Probe new and changed video files with ffprobe and set their items' quality from the streams.
+    
+    Args:
+        limit (int, optional): Probe at most this many files per run
+        
+    Returns:
+        str: Summary of the probe run
+    """
+    db = MediaSessionLocal()
+    try:
+        result = MediaProbeManager(db).probe(limit=limit)
+    finally:
+        db.close()
+    
+    summary = "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in result.items())
+    create_event(
+        status="warning" if result["files_failed"] else "success",
+        event_type="task",
+        sub_type="probe_media",
+        description="Media probe completed",
+        details=summary
+    )
+    return summary
@@ -5,6 +5,7 @@ import time
 from typing import List, Dict, Any, Optional
 from app.utils.file_utils import AttachDataMimeType
 from app.utils.event_utils import EventManagerUtil
+from app.utils.process_utils import run_process
 
 # Get the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -50,7 +51,7 @@ def _run_restic_command(cmd: List[str], password: str, capture_output: bool = Tr
         # Print the command being run (without the password)
         print(f"Running command: {' '.join(cmd)}")
         
-        result = subprocess.run(
+        result = run_process(
             ['sudo'] + cmd,
             capture_output=capture_output,
             text=True,
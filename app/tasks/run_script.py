@@ -5,6 +5,7 @@ import time
 from typing import Optional
 from app.utils.file_utils import AttachDataMimeType
 from app.utils.event_utils import EventManagerUtil
+from app.utils.process_utils import run_process
 
 
 def _create_event(status: str, description: str, details: str, sub_type: str, attachment_data: Optional[bytes] = None) -> None:
@@ -58,7 +59,7 @@ def _run_script_base(script_path: str, sub_type: str, description_prefix: str) -
     print(f"Executing script at: {script_path}")
     
     try:
-        script_result = subprocess.run(['python', script_path], 
+        script_result = run_process(['python', script_path], 
             capture_output=True, 
             text=True, 
             check=True)
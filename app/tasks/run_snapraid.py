@@ -3,6 +3,7 @@ import sys
 import time
 from app.utils.file_utils import AttachDataMimeType
 from app.utils.event_utils import create_event
+from app.utils.process_utils import run_process
 
 
 def run_snapraid(message: str = "Starting SnapRAID sync") -> str:
@@ -31,7 +32,7 @@ def run_snapraid(message: str = "Starting SnapRAID sync") -> str:
     # Run snapraid sync command and capture its output
     try:
         # Run snapraid sync command
-        snapraid_result = subprocess.run(['sudo', 'snapraid', 'sync'], 
+        snapraid_result = run_process(['sudo', 'snapraid', 'sync'], 
             capture_output=True, 
             text=True, 
             check=True)
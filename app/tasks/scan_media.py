@@ -0,0 +1,31 @@
+from app.core.database import MediaSessionLocal
+from app.api.managers.media_scan_manager import MediaScanManager
+from app.utils.event_utils import create_event
+
+
+def scan_media(workers_per_disk: int = None, full: bool = False) -> str:
+    """
+    Scan the configured media libraries into the media database.
+    
+    Args:
+        workers_per_disk (int): Walker threads per physical disk (defaults to MEDIA_SCAN.WORKERS_PER_DISK)
+        full (bool): List every directory, not just those changed since the last scan, waking sleeping disks
+        
+    Returns:
+        str: Summary of the scan
+    """
+    db = MediaSessionLocal()
+    try:
+        result = MediaScanManager(db).scan(workers_per_disk=workers_per_disk, full=full)
+    finally:
+        db.close()
+    
+    summary = "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in result.items())
+    create_event(
+        status="success",
+        event_type="task",
+        sub_type="scan_media",
+        description="Media library scan completed",
+        details=summary
+    )
+    return summary
@@ -5,6 +5,7 @@ import os
 from typing import Dict, Any
 from app.utils.file_utils import AttachDataMimeType
 from app.utils.event_utils import create_event
+from app.utils.process_utils import run_process
 
 
 def sync_data_cloud(task_id: str, **params: Dict[str, Any]) -> str:
@@ -72,7 +73,7 @@ def sync_data_cloud(task_id: str, **params: Dict[str, Any]) -> str:
         rclone_cmd.extend([backup_path, bucket_name])
         
         # Run rclone sync command
-        rclone_result = subprocess.run(
+        rclone_result = run_process(
             rclone_cmd,
             capture_output=True,
             text=True,
@@ -4,6 +4,7 @@ import time
 from typing import Optional
 from app.utils.file_utils import AttachDataMimeType
 from app.utils.event_utils import EventManagerUtil
+from app.utils.process_utils import run_process
 
 
 def _create_event(status: str, description: str, details: str, attachment_data: Optional[bytes] = None) -> None:
@@ -53,7 +54,7 @@ def dummy_task(message: str = "Hello from dummy task!") -> str:
     # Run cat command and capture its output
     try:
         # Run cat command with the input text
-        cat_result = subprocess.run(['echo', 'test'], 
+        cat_result = run_process(['echo', 'test'], 
             capture_output=True, 
             text=True, 
             check=True)
@@ -119,7 +120,7 @@ def run_script_task(script_path: str) -> str:
     # Run the script and capture its output
     try:
         # Run the script with subprocess
-        script_result = subprocess.run(['python', script_path], 
+        script_result = run_process(['python', script_path], 
             capture_output=True, 
             text=True, 
             check=True)
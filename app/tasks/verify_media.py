@@ -0,0 +1,27 @@
+from app.core.database import MediaSessionLocal
+from app.api.managers.media_verify_manager import MediaVerifyManager
+from app.utils.event_utils import create_event
+
+
+def verify_media() -> str:
+    """
+    Look for duplicate video files and cache copies that differ from their source.
+        
+    Returns:
+        str: Summary of the verification
+    """
+    db = MediaSessionLocal()
+    try:
+        result = MediaVerifyManager(db).verify()
+    finally:
+        db.close()
+    
+    summary = "\n".join(f"{key.replace('_', ' ').capitalize()}: {value}" for key, value in result.items())
+    create_event(
+        status="warning" if result["cache_mismatches"] else "success",
+        event_type="task",
+        sub_type="verify_media",
+        description="Media verification completed",
+        details=summary
+    )
+    return summary
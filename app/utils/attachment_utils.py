@@ -0,0 +1,284 @@
+"""Streaming ingestion and retrieval of event attachments.
+
+Uploads are read in fixed-size chunks: the MIME type is sniffed from the first
+few KB only, the content is hashed and size-checked as it streams, and it is
+optionally compressed into a spool file that is later copied into the
+database blob chunk by chunk. Reads go through SQLite incremental blob I/O
+the same way, so at no point is a whole attachment in memory.
+"""
+
+import codecs
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+from app.core.database import MainSessionLocal
+from app.core.settings import settings
+from app.utils.compression_utils import CODEC_IDENTITY, decoding_reader, get_compressor, resolve_codec
+
+logger = logging.getLogger(__name__)
+
+
+class AttachmentTooLargeError(ValueError):
+    """Raised when an attachment exceeds the configured maximum size."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"Attachment exceeds the maximum size of {max_size} bytes")
+
+
+@dataclass
+class SpooledAttachment:
+    file: BinaryIO
+    size: int  # Uncompressed size
+    stored_size: int  # Size as stored, after compression
+    sha256: str
+    codec: str
+    mime_type: str
+    owns_file: bool = True
+
+    def iter_chunks(self, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+        """Read the stored bytes back in chunks"""
+        chunk_size = chunk_size or settings.ATTACHMENTS.CHUNK_SIZE
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self) -> None:
+        if self.owns_file:
+            self.file.close()
+
+
+def sniff_mime_type(
+    head: bytes,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    attachment_type: Optional[str] = None
+) -> str:
+    """Determine an attachment's MIME type from its name and first bytes.
+
+    The provided attachment_type wins, then the client's content type, then the
+    file extension; otherwise the head is checked for UTF-8 text.
+    """
+    if attachment_type:
+        return attachment_type
+    if content_type:
+        return content_type
+
+    filename = filename.lower() if filename else ""
+    if filename.endswith('.txt') or filename.endswith('.log'):
+        return "text/plain"
+    elif filename.endswith('.json'):
+        return "application/json"
+    elif filename.endswith('.md') or filename.endswith('.markdown'):
+        return "text/markdown"
+    elif filename.endswith('.html') or filename.endswith('.htm'):
+        return "text/html"
+    elif filename.endswith('.sh') or filename.endswith('.bash'):
+        return "text/x-shellscript"
+
+    # Incremental decoding tolerates a multi-byte character cut off at the end of the head
+    try:
+        content_str = codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+    except UnicodeDecodeError:
+        return "application/octet-stream"
+    if content_str.isprintable() or '\n' in content_str:
+        return "text/plain"
+    return "application/octet-stream"
+
+
+def spool_attachment(
+    source: BinaryIO,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    attachment_type: Optional[str] = None,
+    max_size: Optional[int] = None,
+    codec: Optional[str] = None
+) -> SpooledAttachment:
+    """Stream an attachment from a file-like object, ready to be stored.
+
+    Args:
+        source: Readable binary stream, e.g. UploadFile.file
+        filename: Original file name, used for MIME detection
+        content_type: Content type sent by the client
+        attachment_type: Explicit MIME type override
+        max_size: Maximum uncompressed size (defaults to ATTACHMENTS.MAX_SIZE)
+        codec: Storage codec (defaults to ATTACHMENTS.COMPRESSION, "auto" picks zstd when available)
+
+    Returns:
+        SpooledAttachment: Spooled content with its size, hash, codec and MIME type
+
+    Raises:
+        AttachmentTooLargeError: As soon as more than max_size bytes have been read
+    """
+    attachment_settings = settings.ATTACHMENTS
+    max_size = max_size or attachment_settings.MAX_SIZE
+    codec = resolve_codec(codec)
+    compressor = get_compressor(codec, attachment_settings.COMPRESSION_LEVEL)
+
+    # Uncompressed seekable uploads are already spooled by the multipart parser; reuse them
+    reuse_source = codec == CODEC_IDENTITY and hasattr(source, "seekable") and source.seekable()
+    spool = source if reuse_source else tempfile.SpooledTemporaryFile(max_size=attachment_settings.SPOOL_MEMORY_SIZE)
+    if reuse_source:
+        source.seek(0)
+
+    try:
+        digest = hashlib.sha256()
+        head = b""
+        size = 0
+        stored_size = 0
+        while True:
+            chunk = source.read(attachment_settings.CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise AttachmentTooLargeError(max_size)
+            if len(head) < attachment_settings.SNIFF_SIZE:
+                head += chunk[:attachment_settings.SNIFF_SIZE - len(head)]
+            digest.update(chunk)
+            if not reuse_source:
+                compressed = compressor.compress(chunk)
+                spool.write(compressed)
+                stored_size += len(compressed)
+        if reuse_source:
+            stored_size = size
+        else:
+            compressed = compressor.flush()
+            spool.write(compressed)
+            stored_size += len(compressed)
+    except Exception:
+        if not reuse_source:
+            spool.close()
+        raise
+
+    return SpooledAttachment(
+        file=spool,
+        size=size,
+        stored_size=stored_size,
+        sha256=digest.hexdigest(),
+        codec=codec,
+        mime_type=sniff_mime_type(head, filename, content_type, attachment_type),
+        owns_file=not reuse_source
+    )
+
+
+@contextmanager
+def open_attachment(event_id: int, codec: Optional[str] = None) -> Iterator[BinaryIO]:
+    """Open an event's stored attachment for incremental reading.
+
+    Uses its own database session, so it can outlive the request's session
+    (e.g. inside a StreamingResponse).
+
+    Args:
+        event_id: ID of the event
+        codec: Codec the attachment is stored with; the reader yields decoded
+            bytes. Pass None to read the stored bytes as-is.
+    """
+    db = MainSessionLocal()
+    try:
+        sqlite_connection = db.connection().connection.driver_connection
+        with sqlite_connection.blobopen("events", "attachment_data", event_id, readonly=True) as blob:
+            yield decoding_reader(blob, codec)
+    finally:
+        db.close()
+
+
+def iter_attachment(event_id: int, codec: Optional[str] = None, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """Yield an attachment's bytes from start to end (inclusive) in chunks.
+
+    Uncompressed attachments seek straight to start; compressed ones are
+    decoded from the beginning and the bytes before start discarded.
+    """
+    chunk_size = settings.ATTACHMENTS.CHUNK_SIZE
+    with open_attachment(event_id, codec) as reader:
+        if start:
+            if not codec or codec == CODEC_IDENTITY:
+                reader.seek(start)
+            else:
+                skip = start
+                while skip > 0:
+                    skipped = len(reader.read(min(chunk_size, skip)))
+                    if not skipped:
+                        return
+                    skip -= skipped
+
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = reader.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+
+def _tail_start(data: bytes, lines: int) -> int:
+    """Index in data where its last `lines` lines begin (0 if it has fewer).
+
+    A trailing newline ends the last line rather than starting an empty one.
+    """
+    index = len(data) - 1
+    for _ in range(lines):
+        index = data.rfind(b"\n", 0, index)
+        if index == -1:
+            return 0
+    return index + 1
+
+
+def tail_attachment(event_id: int, codec: Optional[str], lines: int, size: Optional[int] = None) -> Tuple[int, bytes]:
+    """Read the last lines of an attachment.
+
+    Uncompressed attachments are read backwards from the end in chunks.
+    Compressed ones are decoded front to back, keeping only a rolling window
+    of the last lines.
+
+    Args:
+        event_id: ID of the event
+        codec: Codec the attachment is stored with
+        lines: Number of lines to return
+        size: Decoded size of the attachment, if known
+
+    Returns:
+        Tuple[int, bytes]: Byte offset of the first returned line, and the lines
+    """
+    chunk_size = settings.ATTACHMENTS.CHUNK_SIZE
+    with open_attachment(event_id, codec) as reader:
+        if not codec or codec == CODEC_IDENTITY:
+            if size is None:
+                # Blob.seek returns None rather than the new position
+                reader.seek(0, 2)
+                size = reader.tell()
+            end = size
+            data = b""
+            while end > 0:
+                start = max(0, end - chunk_size)
+                reader.seek(start)
+                data = reader.read(end - start) + data
+                end = start
+                if data.count(b"\n", 0, max(len(data) - 1, 0)) >= lines:
+                    break
+            cut = _tail_start(data, lines)
+            return end + cut, data[cut:]
+
+        buffer = bytearray()
+        buffer_start = 0
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            buffer += chunk
+            if len(buffer) > 2 * chunk_size:
+                # Keep one extra line in case the next chunk starts with the final newline
+                cut = _tail_start(buffer, lines + 1)
+                if cut:
+                    del buffer[:cut]
+                    buffer_start += cut
+        cut = _tail_start(buffer, lines)
+        return buffer_start + cut, bytes(buffer[cut:])
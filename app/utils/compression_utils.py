@@ -0,0 +1,233 @@
+"""Codecs used to store event attachments and large details compressed.
+
+zstd (with an optional trained dictionary) is used when the optional
+``zstandard`` package is installed, gzip otherwise. Compressed values carry
+their own magic bytes, and zstd frames record the ID of the dictionary they
+were compressed with, so any stored value can be decompressed later even
+after a new dictionary has been trained.
+"""
+
+import gzip
+import logging
+import threading
+import zlib
+from typing import BinaryIO, Dict, List, Optional
+
+from sqlalchemy import Text
+from sqlalchemy.types import TypeDecorator
+
+from app.core.settings import settings
+
+try:
+    import zstandard
+except ImportError:  # Optional: pip install zstandard
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_AVAILABLE = zstandard is not None
+
+CODEC_IDENTITY = "identity"
+CODEC_GZIP = "gzip"
+CODEC_ZSTD = "zstd"
+CODEC_AUTO = "auto"
+
+SUPPORTED_CODECS = (CODEC_IDENTITY, CODEC_GZIP, CODEC_ZSTD)
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ZSTD_FRAME_HEADER_MAX = 18  # Enough leading bytes to read a frame's dictionary ID
+
+# Trained zstd dictionaries by dictionary ID, and the one new data is compressed with
+_dictionaries: Dict[int, bytes] = {}
+_active_dictionary_id: Optional[int] = None
+_dictionaries_lock = threading.Lock()
+
+
+class IdentityCompressor:
+    """Pass-through compressor with the same interface as zlib compress objects."""
+
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+def resolve_codec(codec: Optional[str] = None) -> str:
+    """Resolve a configured codec ("auto" or unavailable zstd) to one that can be used"""
+    codec = codec or settings.ATTACHMENTS.COMPRESSION
+    if codec == CODEC_AUTO:
+        return CODEC_ZSTD if ZSTD_AVAILABLE else CODEC_GZIP
+    if codec == CODEC_ZSTD and not ZSTD_AVAILABLE:
+        logger.warning("zstd compression requested but zstandard is not installed, using gzip")
+        return CODEC_GZIP
+    if codec not in SUPPORTED_CODECS:
+        raise ValueError(f"Unsupported compression codec: {codec}")
+    return codec
+
+
+def sniff_codec(data: bytes) -> str:
+    """Detect the codec of stored bytes from their magic number"""
+    if data.startswith(ZSTD_MAGIC):
+        return CODEC_ZSTD
+    if data.startswith(GZIP_MAGIC):
+        return CODEC_GZIP
+    return CODEC_IDENTITY
+
+
+def register_dictionary(dict_id: int, data: bytes, active: bool = False) -> None:
+    """Make a trained dictionary available for compression and decompression"""
+    global _active_dictionary_id
+    with _dictionaries_lock:
+        _dictionaries[dict_id] = data
+        if active:
+            _active_dictionary_id = dict_id
+
+
+def active_dictionary_id() -> Optional[int]:
+    """ID of the dictionary new zstd data is compressed with, if any"""
+    return _active_dictionary_id
+
+
+def _load_dictionary(dict_id: int) -> Optional[bytes]:
+    data = _dictionaries.get(dict_id)
+    if data is None:
+        # Not registered in this process yet (e.g. a CLI run), so look it up
+        from app.core.database import MainSessionLocal
+        from app.models.compression_dictionary import CompressionDictionary
+
+        db = MainSessionLocal()
+        try:
+            row = db.query(CompressionDictionary).filter(CompressionDictionary.dict_id == dict_id).first()
+            if row:
+                register_dictionary(row.dict_id, row.data)
+                data = row.data
+        finally:
+            db.close()
+    return data
+
+
+def _zstd_dictionary(dict_id: Optional[int]):
+    if not dict_id:
+        return None
+    data = _load_dictionary(dict_id)
+    if data is None:
+        raise ValueError(f"zstd dictionary {dict_id} not found")
+    return zstandard.ZstdCompressionDict(data)
+
+
+def frame_dictionary_id(data: bytes) -> int:
+    """ID of the dictionary a zstd frame was compressed with (0 for none)"""
+    return zstandard.get_frame_parameters(data).dict_id
+
+
+def get_compressor(codec: str, level: int = None):
+    """Get an incremental compressor for a codec.
+
+    Returns:
+        An object with compress(chunk) and flush() methods
+
+    Raises:
+        ValueError: If the codec is not supported
+    """
+    level = level or settings.ATTACHMENTS.COMPRESSION_LEVEL
+    if codec == CODEC_IDENTITY:
+        return IdentityCompressor()
+    if codec == CODEC_GZIP:
+        # wbits=31 writes a gzip header, so stored bytes are a valid .gz stream
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if codec == CODEC_ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd compression requires the zstandard package")
+        compressor = zstandard.ZstdCompressor(level=level, dict_data=_zstd_dictionary(_active_dictionary_id))
+        return compressor.compressobj()
+    raise ValueError(f"Unsupported compression codec: {codec}")
+
+
+def compress(data: bytes, codec: str, level: int = None) -> bytes:
+    """Compress a complete value"""
+    compressor = get_compressor(codec, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes, codec: Optional[str]) -> bytes:
+    """Decompress stored data; a missing codec means the data is stored as-is"""
+    if not codec or codec == CODEC_IDENTITY:
+        return data
+    if codec == CODEC_GZIP:
+        return zlib.decompress(data, 31)
+    if codec == CODEC_ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise ValueError("Data is zstd compressed but the zstandard package is not installed")
+        decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dictionary(frame_dictionary_id(data)))
+        # decompressobj copes with frames written without a content size (streamed uploads)
+        return decompressor.decompressobj().decompress(data)
+    raise ValueError(f"Unsupported compression codec: {codec}")
+
+
+def decoding_reader(fileobj: BinaryIO, codec: Optional[str]) -> BinaryIO:
+    """Wrap a seekable stream of stored bytes in a reader of the decoded content.
+
+    The result is read incrementally, so memory stays bounded by the read size
+    rather than the size of the value.
+    """
+    if not codec or codec == CODEC_IDENTITY:
+        return fileobj
+    if codec == CODEC_GZIP:
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if codec == CODEC_ZSTD:
+        if not ZSTD_AVAILABLE:
+            raise ValueError("Data is zstd compressed but the zstandard package is not installed")
+        header = fileobj.read(ZSTD_FRAME_HEADER_MAX)
+        fileobj.seek(0)
+        decompressor = zstandard.ZstdDecompressor(dict_data=_zstd_dictionary(frame_dictionary_id(header)))
+        return decompressor.stream_reader(fileobj, read_size=settings.ATTACHMENTS.CHUNK_SIZE)
+    raise ValueError(f"Unsupported compression codec: {codec}")
+
+
+def train_dictionary(samples: List[bytes], dict_size: int = None) -> "zstandard.ZstdCompressionDict":
+    """Train a zstd dictionary from sample values (e.g. recent task logs)"""
+    if not ZSTD_AVAILABLE:
+        raise ValueError("Training a dictionary requires the zstandard package")
+    return zstandard.train_dictionary(dict_size or settings.ATTACHMENTS.DICTIONARY_SIZE, samples)
+
+
+def can_pass_through(data: bytes, codec: Optional[str], accepted_encodings: List[str]) -> bool:
+    """Whether stored bytes can be sent as-is to a client with these Accept-Encoding values.
+
+    Only the start of the stored bytes is needed (ZSTD_FRAME_HEADER_MAX bytes).
+
+    zstd frames that need one of our trained dictionaries are not decodable by
+    clients, so those are only served decompressed.
+    """
+    if codec == CODEC_GZIP:
+        return CODEC_GZIP in accepted_encodings
+    if codec == CODEC_ZSTD and ZSTD_AVAILABLE:
+        return CODEC_ZSTD in accepted_encodings and frame_dictionary_id(data) == 0
+    return False
+
+
+class CompressedText(TypeDecorator):
+    """Text column whose long values are stored compressed.
+
+    SQLite is dynamically typed, so values under
+    ATTACHMENTS.DETAILS_COMPRESSION_THRESHOLD stay TEXT while longer ones are
+    stored as compressed BLOBs and recognised on read by their magic bytes.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or len(value) < settings.ATTACHMENTS.DETAILS_COMPRESSION_THRESHOLD:
+            return value
+        codec = resolve_codec()
+        if codec == CODEC_IDENTITY:
+            return value
+        return compress(value.encode("utf-8"), codec)
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return decompress(value, sniff_codec(value)).decode("utf-8")
+        return value
@@ -0,0 +1,166 @@
+"""Block device lookup, power state and health checks that never spin a disk up.
+
+Paths are mapped to their disk through /proc/self/mounts and /sys, and the power
+state is read with `hdparm -C` (CHECK POWER MODE), which does not spin a disk up.
+Paths on FUSE or network filesystems (mergerfs, NFS) have no single disk, so their
+power state is unknown. I/O counters come from /proc/diskstats, and SMART data from
+`smartctl -n standby`, which refuses to read a disk that is spun down.
+"""
+
+import json
+import logging
+import os
+import re
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# `hdparm -C` states in which reading the disk would spin it up
+SLEEPING_STATES = {"standby", "sleeping"}
+
+
+def _as_root(command: List[str]) -> List[str]:
+    # Disk commands need root; otherwise they are run through `sudo -n`, which needs a sudoers entry
+    return command if os.geteuid() == 0 else ["sudo", "-n"] + command
+
+
+def _unescape_mount_field(field: str) -> str:
+    # /proc/self/mounts escapes spaces, tabs, newlines and backslashes as octal; other characters are left as UTF-8
+    return re.sub(r"\\([0-7]{3})", lambda match: chr(int(match[1], 8)), field)
+
+
+def mount_source(path: str) -> Optional[str]:
+    """Source device (e.g. /dev/sdb1) of the mount containing path, without accessing path"""
+    path = os.path.abspath(path)
+    best_mount, best_source = "", None
+    try:
+        with open("/proc/self/mounts") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 2:
+                    continue
+                source, mount_point = _unescape_mount_field(fields[0]), _unescape_mount_field(fields[1])
+                inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+                if inside and len(mount_point) >= len(best_mount):
+                    best_mount, best_source = mount_point, source
+    except OSError:
+        return None
+    return best_source
+
+
+def disk_for_path(path: str) -> Optional[str]:
+    """Whole-disk device (e.g. /dev/sdb) holding path, or None if it isn't on a local block device"""
+    source = mount_source(path)
+    if not source or not source.startswith("/dev/"):
+        return None
+    try:
+        name = os.path.basename(os.path.realpath(source))
+        sys_path = os.path.realpath(f"/sys/class/block/{name}")
+        if os.path.exists(os.path.join(sys_path, "partition")):
+            name = os.path.basename(os.path.dirname(sys_path))
+        # Device-mapper and md devices sit on one or more other disks
+        slaves = f"/sys/class/block/{name}/slaves"
+        if os.path.isdir(slaves) and os.listdir(slaves):
+            return None
+    except OSError:
+        return None
+    return f"/dev/{name}"
+
+
+def disk_power_state(disk: str) -> Optional[str]:
+    """Power state of a disk as reported by `hdparm -C` ("active/idle", "standby", ...), or None if unknown
+
+    hdparm needs root; otherwise it is run through `sudo -n`, which needs a sudoers entry.
+    """
+    try:
+        result = subprocess.run(_as_root(["hdparm", "-C", disk]), capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug(f"Could not check power state of {disk}: {str(e)}")
+        return None
+    for line in result.stdout.splitlines():
+        if "drive state is:" in line:
+            return line.split(":", 1)[1].strip()
+    logger.debug(f"Could not check power state of {disk}: {result.stderr.strip()}")
+    return None
+
+
+def is_disk_asleep(path: str) -> bool:
+    """Whether the disk holding path is spun down; False if that can't be told"""
+    disk = disk_for_path(path)
+    return disk is not None and disk_power_state(disk) in SLEEPING_STATES
+
+
+def block_device_info(disk: str) -> Dict[str, Any]:
+    """Size in bytes and whether a whole-disk device is rotational, from /sys; None where unknown"""
+    name = os.path.basename(disk)
+    info: Dict[str, Any] = {"size_bytes": None, "rotational": None}
+    try:
+        with open(f"/sys/class/block/{name}/size") as f:
+            info["size_bytes"] = int(f.read()) * 512  # Always in 512-byte sectors
+        with open(f"/sys/class/block/{name}/queue/rotational") as f:
+            info["rotational"] = f.read().strip() == "1"
+    except (OSError, ValueError):
+        pass
+    return info
+
+
+def read_diskstats(path: str = "/proc/diskstats") -> Dict[str, Tuple[int, int, int]]:
+    """Bytes read, bytes written and milliseconds spent doing I/O since boot, per block device name
+
+    Sector counts in /proc/diskstats are always of 512 bytes, whatever the disk's sector size.
+    """
+    stats = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 13:
+                    continue
+                stats[fields[2]] = (int(fields[5]) * 512, int(fields[9]) * 512, int(fields[12]))
+    except OSError as e:
+        logger.debug(f"Could not read {path}: {str(e)}")
+    return stats
+
+
+def parse_smart(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Model, serial, health verdict, temperature, power-on hours and bad sector counts from `smartctl -j` output"""
+    attributes = {
+        attribute.get("id"): attribute.get("raw", {}).get("value")
+        for attribute in data.get("ata_smart_attributes", {}).get("table", [])
+    }
+    nvme = data.get("nvme_smart_health_information_log", {})
+    return {
+        "model": data.get("model_name") or data.get("model_family"),
+        "serial": data.get("serial_number"),
+        "smart_passed": data.get("smart_status", {}).get("passed"),
+        "temperature": data.get("temperature", {}).get("current"),
+        "power_on_hours": data.get("power_on_time", {}).get("hours"),
+        "reallocated_sectors": attributes.get(5),
+        # NVMe drives don't remap sectors; their unrecovered media errors are the nearest count
+        "pending_sectors": attributes.get(197, nvme.get("media_errors"))
+    }
+
+
+def smart_info(disk: str, smartctl: str = "smartctl", timeout: float = 30.0) -> Optional[Dict[str, Any]]:
+    """SMART data of an awake disk from `smartctl -j -n standby`, or None if it is spun down or can't be read
+
+    With `-n standby` smartctl exits without reading a disk in standby or sleep
+    mode, so this never spins one up even if its power state changed since it
+    was checked. smartctl needs root, like hdparm.
+    """
+    command = _as_root([smartctl, "-j", "-n", "standby", "-i", "-H", "-A", disk])
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug(f"Could not read SMART data of {disk}: {str(e)}")
+        return None
+    # Exit status bits 0 and 1: bad command line, device open failed or, with -n, the disk is asleep
+    if result.returncode & 0b11:
+        logger.debug(f"No SMART data read from {disk}: smartctl exited with status {result.returncode}")
+        return None
+    try:
+        return parse_smart(json.loads(result.stdout))
+    except ValueError as e:
+        logger.debug(f"Unreadable smartctl output for {disk}: {str(e)}")
+        return None
@@ -0,0 +1,76 @@
+"""Fast file fingerprints: a partial hash of a few blocks, and a full hash, with throttled reads.
+
+xxh3-128 is used when the optional ``xxhash`` package is installed, BLAKE2b
+otherwise. Hashes are prefixed with their algorithm, so hashes stored with one
+are never compared with the other's.
+"""
+
+import hashlib
+import os
+import time
+from typing import Optional
+
+try:
+    import xxhash
+except ImportError:  # Optional: pip install xxhash
+    xxhash = None
+
+XXHASH_AVAILABLE = xxhash is not None
+HASH_ALGORITHM = "xxh128" if XXHASH_AVAILABLE else "blake2b"
+
+PARTIAL_BLOCK_SIZE = 1024 * 1024
+READ_SIZE = 4 * 1024 * 1024
+
+
+def _hasher():
+    return xxhash.xxh3_128() if XXHASH_AVAILABLE else hashlib.blake2b(digest_size=16)
+
+
+class ReadThrottle:
+    """Limits the read rate of one disk's reader by sleeping between reads"""
+
+    def __init__(self, bytes_per_second: int = 0):
+        self.bytes_per_second = bytes_per_second
+        self.bytes_read = 0
+        self._started = time.monotonic()
+
+    def consumed(self, count: int) -> None:
+        self.bytes_read += count
+        if self.bytes_per_second > 0:
+            ahead = self.bytes_read / self.bytes_per_second - (time.monotonic() - self._started)
+            if ahead > 0:
+                time.sleep(ahead)
+
+
+def partial_hash(path: str, size: int, throttle: Optional[ReadThrottle] = None) -> str:
+    """Hash of a file's size and its first, middle and last PARTIAL_BLOCK_SIZE bytes"""
+    hasher = _hasher()
+    hasher.update(size.to_bytes(8, "little"))
+    with open(path, "rb") as file:
+        for offset in sorted({0, max(0, size // 2 - PARTIAL_BLOCK_SIZE // 2), max(0, size - PARTIAL_BLOCK_SIZE)}):
+            file.seek(offset)
+            block = file.read(PARTIAL_BLOCK_SIZE)
+            hasher.update(block)
+            if throttle:
+                throttle.consumed(len(block))
+    return f"{HASH_ALGORITHM}:{hasher.hexdigest()}"
+
+
+def full_hash(path: str, throttle: Optional[ReadThrottle] = None) -> str:
+    """Hash of a file's whole content"""
+    hasher = _hasher()
+    with open(path, "rb") as file:
+        try:
+            os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except (AttributeError, OSError):
+            pass
+        while block := file.read(READ_SIZE):
+            hasher.update(block)
+            if throttle:
+                throttle.consumed(len(block))
+    return f"{HASH_ALGORITHM}:{hasher.hexdigest()}"
+
+
+def is_current(stored: Optional[str]) -> bool:
+    """Whether a stored hash was made with the algorithm in use"""
+    return bool(stored) and stored.startswith(f"{HASH_ALGORITHM}:")
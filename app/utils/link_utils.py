@@ -0,0 +1,89 @@
+"""Link and directory operations that are never seen half-done by readers of the tree."""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import shutil
+
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+_libc = None
+
+
+def replace_link(target: str, link_path: str, hardlink: bool = False) -> bool:
+    """Create or replace a link, so link_path always exists as the old or the new link
+
+    A hard link that can't be made (e.g. across filesystems) is made a symlink.
+
+    Returns:
+        bool: Whether a hard link was made
+    """
+    directory, name = os.path.split(link_path)
+    os.makedirs(directory, exist_ok=True)
+    temporary = os.path.join(directory, f".{name}.link")
+    try:
+        os.unlink(temporary)
+    except FileNotFoundError:
+        pass
+    made_hardlink = False
+    if hardlink:
+        try:
+            os.link(target, temporary)
+            made_hardlink = True
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+    if not made_hardlink:
+        os.symlink(target, temporary)
+    os.rename(temporary, link_path)
+    return made_hardlink
+
+
+def remove_link(link_path: str, stop_at: str) -> None:
+    """Remove a link and the directories it leaves empty, up to stop_at"""
+    try:
+        os.unlink(link_path)
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(link_path)
+    while directory != stop_at and directory.startswith(stop_at + os.sep):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def exchange_paths(first: str, second: str) -> None:
+    """Atomically swap two paths with renameat2(RENAME_EXCHANGE)
+
+    Falls back to two renames, with a moment where neither exists at first,
+    where the kernel, C library or filesystem can't exchange them.
+    """
+    global _libc
+    try:
+        if _libc is None:
+            _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        result = _libc.renameat2(AT_FDCWD, os.fsencode(first), AT_FDCWD, os.fsencode(second), RENAME_EXCHANGE)
+        if result == 0:
+            return
+        error = ctypes.get_errno()
+        if error not in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
+            raise OSError(error, os.strerror(error), first, None, second)
+    except AttributeError:
+        pass  # C library without renameat2
+    backup = f"{first}.swap"
+    os.rename(first, backup)
+    os.rename(second, first)
+    os.rename(backup, second)
+
+
+def swap_in_tree(shadow: str, path: str) -> None:
+    """Replace the tree at path with a completed shadow tree, then delete the old one"""
+    if os.path.lexists(path):
+        exchange_paths(path, shadow)
+        shutil.rmtree(shadow)
+    else:
+        os.rename(shadow, path)
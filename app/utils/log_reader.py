@@ -0,0 +1,299 @@
+"""Newest-first reading of the application log and its rotated backups.
+
+Log files are read backwards from the end, so showing the latest lines costs
+O(lines shown) rather than O(total log size). Rotated backups never change, so
+each gets a small sidecar index of ~64KB blocks with the time span and level
+counts of the entries in each block; level and time-range filters use it to
+skip straight to the blocks that can match.
+
+Entries are located by cursors of the form "<file key>:<offset>". A file's
+key is derived from its first line, so it survives the renames done by
+RotatingFileHandler (app.log -> app.log.1 -> app.log.2 ...).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+INDEX_BLOCK_SIZE = 64 * 1024
+INDEX_VERSION = 1
+
+# Lines look like "2024-01-01 12:00:00,123 - name - LEVEL - message"; anything else
+# (tracebacks, multi-line messages) continues the previous entry
+HEADER_RE = re.compile(rb"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}) - (.*?) - ([A-Z]+) - ")
+
+# Parsed indexes by file key, so repeated page loads don't re-read the sidecars
+_index_cache: Dict[str, dict] = {}
+
+
+@dataclass
+class LogEntry:
+    timestamp: str
+    name: str
+    level: str
+    message: str
+    cursor: str
+    task_id: Optional[str] = None
+    request_id: Optional[str] = None
+
+
+@dataclass
+class LogPage:
+    entries: List[LogEntry]
+    next_cursor: Optional[str]  # Pass as `before` to get the next (older) page
+
+
+def log_files(log_file: Path) -> List[Path]:
+    """The log file and its rotated backups, newest first"""
+    backups = []
+    for path in log_file.parent.glob(f"{log_file.name}.*"):
+        suffix = path.name[len(log_file.name) + 1:]
+        if suffix.isdigit():
+            backups.append((int(suffix), path))
+    return [log_file] + [path for _, path in sorted(backups)]
+
+
+def file_key(path: Path) -> Optional[str]:
+    """Stable key for a log file, from its first line (None while it is empty)"""
+    try:
+        with open(path, "rb") as f:
+            first_line = f.readline(1024)
+    except FileNotFoundError:
+        return None
+    if not first_line.endswith(b"\n"):
+        return None
+    return hashlib.sha1(first_line).hexdigest()[:16]
+
+
+def to_log_timestamp(value) -> Optional[str]:
+    """Convert a datetime or ISO string to the log's timestamp format for comparison"""
+    if value is None or value == "":
+        return None
+    if not isinstance(value, str):
+        value = value.isoformat(sep=" ")
+    # Timestamps compare as strings: "2024-01-01T12:00" -> "2024-01-01 12:00"
+    return value.replace("T", " ").replace(".", ",")
+
+
+def _iter_lines_reverse(f: BinaryIO, start: int, end: int) -> Iterator[Tuple[int, bytes]]:
+    """Yield (offset, line) for the lines between start and end, last line first.
+
+    start must be the beginning of a line.
+    """
+    position = end
+    remainder = b""
+    while position > start:
+        read_start = max(start, position - READ_CHUNK_SIZE)
+        f.seek(read_start)
+        chunk = f.read(position - read_start) + remainder
+        position = read_start
+
+        lines = chunk.split(b"\n")
+        # The first piece may be the tail of a line that starts in an earlier chunk
+        remainder = lines.pop(0)
+        offsets = []
+        offset = position + len(remainder) + 1
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+        for offset, line in zip(reversed(offsets), reversed(lines)):
+            if line:
+                yield offset, line
+    if remainder:
+        yield start, remainder
+
+
+def _iter_entries_reverse(f: BinaryIO, key: str, start: int, end: int) -> Iterator[LogEntry]:
+    """Yield the entries between start and end, newest first"""
+    continuation: List[bytes] = []
+    for offset, line in _iter_lines_reverse(f, start, end):
+        match = HEADER_RE.match(line)
+        if not match:
+            continuation.append(line)
+            continue
+        message = line[match.end():]
+        if continuation:
+            message = b"\n".join([message] + continuation[::-1])
+            continuation = []
+        yield LogEntry(
+            timestamp=match.group(1).decode("ascii"),
+            name=match.group(2).decode("utf-8", errors="replace"),
+            level=match.group(3).decode("ascii"),
+            message=message.decode("utf-8", errors="replace").rstrip(),
+            cursor=f"{key}:{offset}"
+        )
+
+
+def build_index(path: Path) -> dict:
+    """Scan a log file once and record its blocks.
+
+    Each block starts at an entry, spans about INDEX_BLOCK_SIZE bytes and records
+    the first and last timestamp and the number of entries per level.
+    """
+    blocks = []
+    block = None
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            match = HEADER_RE.match(line)
+            if match:
+                timestamp = match.group(1).decode("ascii")
+                level = match.group(3).decode("ascii")
+                if block is None or offset - block["start"] >= INDEX_BLOCK_SIZE:
+                    if block is not None:
+                        block["end"] = offset
+                        blocks.append(block)
+                    block = {"start": offset, "first": timestamp, "levels": {}}
+                block["last"] = timestamp
+                block["levels"][level] = block["levels"].get(level, 0) + 1
+            offset += len(line)
+    if block is not None:
+        block["end"] = offset
+        blocks.append(block)
+    return {"version": INDEX_VERSION, "size": offset, "blocks": blocks}
+
+
+def _index_dir(log_file: Path) -> Path:
+    return log_file.parent / f".{log_file.name}.idx"
+
+
+def load_index(log_file: Path, path: Path, key: str) -> dict:
+    """Get the block index of a rotated log file, building its sidecar if needed"""
+    size = path.stat().st_size
+    index = _index_cache.get(key)
+    if index and index["size"] == size:
+        return index
+
+    index_path = _index_dir(log_file) / f"{key}.json"
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION and index.get("size") == size:
+            _index_cache[key] = index
+            return index
+    except (FileNotFoundError, ValueError):
+        pass
+
+    index = build_index(path)
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        logger.debug(f"Could not write log index {index_path}: {str(e)}")
+    _index_cache[key] = index
+    return index
+
+
+def prune_indexes(log_file: Path, keys: List[str]) -> None:
+    """Remove sidecar indexes of log files that have rotated away"""
+    index_dir = _index_dir(log_file)
+    if not index_dir.exists():
+        return
+    for index_path in index_dir.glob("*.json"):
+        if index_path.stem not in keys:
+            _index_cache.pop(index_path.stem, None)
+            try:
+                index_path.unlink()
+            except OSError:
+                pass
+
+
+def read_logs(
+    log_file: Path,
+    limit: int = 1000,
+    level: Optional[str] = None,
+    since=None,
+    until=None,
+    search: Optional[str] = None,
+    before: Optional[str] = None
+) -> LogPage:
+    """Read log entries newest first, stopping as soon as a page is full.
+
+    Args:
+        log_file: Path of the active log file
+        limit: Maximum number of entries to return
+        level: Only entries with this level (e.g. "ERROR")
+        since: Only entries at or after this time (datetime or ISO string)
+        until: Only entries at or before this time (datetime or ISO string)
+        search: Only entries whose message contains this text (case-insensitive)
+        before: Cursor from a previous page; only entries older than it are returned
+
+    Returns:
+        LogPage: The entries and the cursor of the next page, if there may be one
+    """
+    level = level.upper() if level else None
+    since = to_log_timestamp(since)
+    until = to_log_timestamp(until)
+    search = search.lower() if search else None
+
+    before_key, before_offset = None, None
+    if before:
+        before_key, _, offset = before.partition(":")
+        before_offset = int(offset) if offset.isdigit() else None
+
+    def matches(entry: LogEntry) -> bool:
+        if level and entry.level != level:
+            return False
+        if until and entry.timestamp > until:
+            return False
+        if search and search not in entry.message.lower() and search not in entry.name.lower():
+            return False
+        return True
+
+    entries: List[LogEntry] = []
+    files = [(path, file_key(path)) for path in log_files(log_file)]
+    prune_indexes(log_file, [key for path, key in files[1:] if key])
+    skipping = before_key is not None
+
+    for position, (path, key) in enumerate(files):
+        if not key:
+            continue
+        end = None
+        if skipping:
+            if key != before_key:
+                continue
+            skipping = False
+            end = before_offset
+
+        with open(path, "rb") as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size if end is None else min(end, size)
+
+            if position == 0:
+                # The active file is still being written, so it is read without an index
+                ranges = [(0, end)]
+            else:
+                ranges = []
+                for block in reversed(load_index(log_file, path, key)["blocks"]):
+                    if block["start"] >= end:
+                        continue
+                    if since and block["last"] < since:
+                        break
+                    if until and block["first"] > until:
+                        continue
+                    if level and not block["levels"].get(level):
+                        continue
+                    ranges.append((block["start"], min(block["end"], end)))
+
+            for start, range_end in ranges:
+                for entry in _iter_entries_reverse(f, key, start, range_end):
+                    if since and entry.timestamp < since:
+                        # Everything further back is older still
+                        return LogPage(entries=entries, next_cursor=None)
+                    if matches(entry):
+                        entries.append(entry)
+                        if len(entries) >= limit:
+                            return LogPage(entries=entries, next_cursor=entry.cursor)
+
+    return LogPage(entries=entries, next_cursor=None)
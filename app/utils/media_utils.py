@@ -0,0 +1,165 @@
+"""Parsing of media library paths: titles, season/episode numbers, quality and file types.
+
+Libraries are laid out as <storage path>/<library id>/<title>/..., e.g.
+
+    /srv/storage/media/tv-hd/Some Show (2019)/Season 01/Some.Show.S01E02.1080p.mkv
+    /srv/storage/media/movies/Some Film (2020)/Some Film (2020) 2160p.mkv
+"""
+
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, List, Mapping, Optional, Tuple
+
+from app.models.media import FolderType, MediaFileType, MediaType, QualityLevel
+
+VIDEO_EXTENSIONS = {".mkv", ".mp4", ".m4v", ".avi", ".mov", ".wmv", ".ts", ".m2ts", ".mpg", ".mpeg", ".webm"}
+AUDIO_EXTENSIONS = {".mp3", ".flac", ".aac", ".m4a", ".ogg", ".opus", ".wav", ".ac3", ".dts", ".mka"}
+SUBTITLE_EXTENSIONS = {".srt", ".ass", ".ssa", ".sub", ".idx", ".vtt", ".sup"}
+
+# Library "quality" and "type" values in MEDIA_DATA
+LIBRARY_QUALITIES = {
+    "uhd": QualityLevel.UHD,
+    "4k": QualityLevel.UHD,
+    "fhd": QualityLevel.FHD,
+    "hd": QualityLevel.HD,
+    "sd": QualityLevel.SD,
+    "ld": QualityLevel.LD,
+}
+LIBRARY_MEDIA_TYPES = {
+    "tv": MediaType.TV_SHOW,
+    "tv_show": MediaType.TV_SHOW,
+    "movie": MediaType.MOVIE,
+    "movies": MediaType.MOVIE,
+}
+
+_EPISODE_RE = re.compile(r"(?i)(?<![a-z0-9])s(\d{1,4})[ ._-]?e(\d{1,4})|(?<![a-z0-9])(\d{1,2})x(\d{1,4})(?![0-9])")
+_SEASON_DIR_RE = re.compile(r"(?i)^(?:season|series|s)[ ._-]?(\d{1,4})$")
+_QUALITY_RE = re.compile(r"(?i)(?<![a-z0-9])(2160p|4k|uhd|1080[pi]|720p|576p|480p|360p)(?![a-z0-9])")
+_QUALITY_TAGS = {
+    "2160p": QualityLevel.UHD, "4k": QualityLevel.UHD, "uhd": QualityLevel.UHD,
+    "1080p": QualityLevel.FHD, "1080i": QualityLevel.FHD,
+    "720p": QualityLevel.HD,
+    "576p": QualityLevel.SD, "480p": QualityLevel.SD,
+    "360p": QualityLevel.LD,
+}
+# Metadata-agent tags such as "{tvdb-12345}" or "[imdbid-tt0123]" are not part of the title
+_TITLE_TAG_RE = re.compile(r"\s*[\[{][^\]}]*[\]}]")
+
+
+@dataclass
+class LibraryConfig:
+    """A configured library and the storage it lives on"""
+    id: str
+    root: Path
+    storage_path: Path
+    folder_type: FolderType
+    media_type: MediaType
+    quality: QualityLevel
+
+
+@dataclass
+class ParsedPath:
+    title: str
+    season: Optional[int]
+    episode: Optional[int]
+    quality: Optional[QualityLevel]
+    file_type: MediaFileType
+
+
+def classify_file(name: str) -> MediaFileType:
+    """File type from a file name's extension"""
+    extension = name[name.rfind("."):].lower() if "." in name else ""
+    if extension in VIDEO_EXTENSIONS:
+        return MediaFileType.VIDEO
+    if extension in SUBTITLE_EXTENSIONS:
+        return MediaFileType.SUBTITLE
+    if extension in AUDIO_EXTENSIONS:
+        return MediaFileType.AUDIO
+    return MediaFileType.OTHER
+
+
+def parse_quality(text: str) -> Optional[QualityLevel]:
+    """Quality from a resolution tag such as 1080p or 2160p, if there is one"""
+    match = _QUALITY_RE.search(text)
+    return _QUALITY_TAGS[match.group(1).lower()] if match else None
+
+
+def parse_episode(name: str) -> Tuple[Optional[int], Optional[int]]:
+    """Season and episode from S01E02 or 1x02 markers"""
+    match = _EPISODE_RE.search(name)
+    if not match:
+        return None, None
+    if match.group(1) is not None:
+        return int(match.group(1)), int(match.group(2))
+    return int(match.group(3)), int(match.group(4))
+
+
+def parse_season_dir(name: str) -> Optional[int]:
+    """Season number of a "Season 01"-style directory"""
+    if name.lower() == "specials":
+        return 0
+    match = _SEASON_DIR_RE.match(name.strip())
+    return int(match.group(1)) if match else None
+
+
+def clean_title(folder_name: str) -> str:
+    """Title from a title folder name, without metadata tags or dot/underscore separators"""
+    title = _TITLE_TAG_RE.sub("", folder_name)
+    if " " not in title:
+        title = title.replace(".", " ").replace("_", " ")
+    return " ".join(title.split())
+
+
+def parse_path(title_dir: str, relative_parts: List[str], media_type: MediaType) -> ParsedPath:
+    """Parse a file's path within its title folder
+
+    Args:
+        title_dir: Name of the title folder
+        relative_parts: Path components below the title folder, ending with the file name
+        media_type: Type of the library the file is in
+    """
+    name = relative_parts[-1]
+    season, episode = (None, None)
+    if media_type == MediaType.TV_SHOW:
+        season, episode = parse_episode(name)
+        if season is None:
+            for part in reversed(relative_parts[:-1]):
+                season = parse_season_dir(part)
+                if season is not None:
+                    break
+    return ParsedPath(
+        title=clean_title(title_dir),
+        season=season,
+        episode=episode,
+        quality=parse_quality(name),
+        file_type=classify_file(name)
+    )
+
+
+def get_libraries(media_data: Mapping[str, Any]) -> List[LibraryConfig]:
+    """Libraries from the MEDIA_DATA config section
+
+    Raises:
+        ValueError: If a library references an unknown storage or has an unknown type
+    """
+    storage = media_data.get("storage", {})
+    libraries = []
+    for name, library in media_data.get("libraries", {}).items():
+        storage_config = storage.get(library.get("storage"))
+        if not storage_config:
+            raise ValueError(f"Library '{name}' references unknown storage '{library.get('storage')}'")
+        media_type = LIBRARY_MEDIA_TYPES.get(str(library.get("type", "")).lower())
+        if not media_type:
+            raise ValueError(f"Library '{name}' has unknown type '{library.get('type')}'")
+        storage_path = Path(storage_config["path"])
+        library_id = library.get("id", name)
+        libraries.append(LibraryConfig(
+            id=library_id,
+            root=storage_path / library_id,
+            storage_path=storage_path,
+            folder_type=FolderType(storage_config.get("type", FolderType.SOURCE.value)),
+            media_type=media_type,
+            quality=LIBRARY_QUALITIES.get(str(library.get("quality", "")).lower(), QualityLevel.UNKNOWN)
+        ))
+    return libraries
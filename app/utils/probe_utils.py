@@ -0,0 +1,90 @@
+"""Stream information of media files from ffprobe, and the QualityLevel of a video resolution."""
+
+import json
+import subprocess
+from typing import Any, Dict, Optional
+
+from app.models.media import QualityLevel
+
+
+class ProbeError(Exception):
+    """Raised when ffprobe fails or its output can't be read"""
+
+
+def quality_for_resolution(width: Optional[int], height: Optional[int]) -> QualityLevel:
+    """QualityLevel of a video resolution
+
+    Either dimension is enough, so widescreen films cropped to e.g. 1920x800 are still FHD.
+    """
+    width, height = width or 0, height or 0
+    if width >= 3200 or height >= 2000:
+        return QualityLevel.UHD
+    if width >= 1800 or height >= 1000:
+        return QualityLevel.FHD
+    if width >= 1200 or height >= 700:
+        return QualityLevel.HD
+    if width >= 640 or height >= 440:
+        return QualityLevel.SD
+    if width or height:
+        return QualityLevel.LD
+    return QualityLevel.UNKNOWN
+
+
+def parse_probe(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Codec, resolution, duration, audio and subtitle tracks from ffprobe's JSON output"""
+    streams = data.get("streams", [])
+    # Cover art is reported as a video stream too
+    videos = [
+        stream for stream in streams
+        if stream.get("codec_type") == "video" and not stream.get("disposition", {}).get("attached_pic")
+    ]
+    video = max(videos, key=lambda stream: (stream.get("width") or 0) * (stream.get("height") or 0), default={})
+    duration = data.get("format", {}).get("duration") or video.get("duration")
+    try:
+        duration = float(duration) if duration is not None else None
+    except ValueError:
+        duration = None
+
+    return {
+        "video_codec": video.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "duration": duration,
+        "audio_tracks": [
+            {
+                "codec": stream.get("codec_name"),
+                "channels": stream.get("channels"),
+                "language": stream.get("tags", {}).get("language")
+            }
+            for stream in streams if stream.get("codec_type") == "audio"
+        ],
+        "subtitle_tracks": [
+            {
+                "codec": stream.get("codec_name"),
+                "language": stream.get("tags", {}).get("language"),
+                "forced": bool(stream.get("disposition", {}).get("forced"))
+            }
+            for stream in streams if stream.get("codec_type") == "subtitle"
+        ],
+        "quality": quality_for_resolution(video.get("width"), video.get("height"))
+    }
+
+
+def probe_file(path: str, ffprobe: str = "ffprobe", timeout: float = 60.0) -> Dict[str, Any]:
+    """Probe a file with `ffprobe -print_format json`
+
+    Raises:
+        ProbeError: If ffprobe fails, times out or prints something that isn't JSON
+        FileNotFoundError: If ffprobe isn't installed
+    """
+    command = [ffprobe, "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise ProbeError(f"ffprobe timed out after {timeout:.0f}s")
+    if result.returncode != 0:
+        raise ProbeError(result.stderr.strip() or f"ffprobe exited with status {result.returncode}")
+    try:
+        return parse_probe(json.loads(result.stdout))
+    except ValueError as e:
+        raise ProbeError(f"Unreadable ffprobe output: {str(e)}")
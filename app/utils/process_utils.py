@@ -0,0 +1,255 @@
+"""Live task run registry and process-tree aware subprocess helpers.
+
+Every task executed through the scheduler gets a ``TaskRun`` in ``active_runs``.
+Child processes started with ``run_process`` are attached to the current run in
+their own process group, so a cancel or timeout can terminate the whole tree,
+including commands started via ``sudo``.
+"""
+
+import contextvars
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait after SIGTERM before escalating to SIGKILL
+KILL_GRACE_PERIOD = 10.0
+
+
+class TaskCancelledError(Exception):
+    """Raised inside a task when its run has been cancelled or timed out."""
+
+    def __init__(self, task_id: str, reason: str = "cancelled"):
+        self.task_id = task_id
+        self.reason = reason
+        super().__init__(f"Task {task_id} {reason}")
+
+
+@dataclass
+class TaskRun:
+    task_id: str
+    timeout: Optional[float] = None
+    started_at: float = field(default_factory=time.time)
+    cancel_reason: Optional[str] = None
+    processes: List[subprocess.Popen] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _timer: Optional[threading.Timer] = field(default=None, repr=False)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_reason is not None
+
+    def attach(self, proc: subprocess.Popen) -> None:
+        """Attach a child process to this run, killing it at once if the run is already cancelled"""
+        with self._lock:
+            self.processes.append(proc)
+            cancelled = self.cancelled
+        if cancelled:
+            kill_process_tree(proc)
+
+    def detach(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            if proc in self.processes:
+                self.processes.remove(proc)
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Cancel the run and terminate every attached process tree.
+
+        Returns:
+            bool: False if the run had already been cancelled
+        """
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.cancel_reason = reason
+            processes = list(self.processes)
+        logger.warning(f"Cancelling task {self.task_id}: {reason}")
+        for proc in processes:
+            kill_process_tree(proc)
+        return True
+
+    def check_cancelled(self) -> None:
+        """Raise TaskCancelledError if the run has been cancelled"""
+        if self.cancelled:
+            raise TaskCancelledError(self.task_id, self.cancel_reason)
+
+    def to_dict(self) -> Dict:
+        return {
+            "task_id": self.task_id,
+            "started_at": self.started_at,
+            "timeout": self.timeout,
+            "cancel_reason": self.cancel_reason,
+            "pids": [proc.pid for proc in self.processes]
+        }
+
+
+# Runs currently executing, keyed by task_id (max_instances=1 means one run per task)
+active_runs: Dict[str, TaskRun] = {}
+_runs_lock = threading.Lock()
+_current_run: contextvars.ContextVar[Optional[TaskRun]] = contextvars.ContextVar("current_task_run", default=None)
+
+
+def start_run(task_id: str, timeout: Optional[float] = None) -> TaskRun:
+    """Register a new live run for the calling thread and arm its timeout"""
+    run = TaskRun(task_id=task_id, timeout=timeout)
+    if timeout:
+        run._timer = threading.Timer(timeout, run.cancel, kwargs={"reason": f"timed out after {timeout:g}s"})
+        run._timer.daemon = True
+        run._timer.start()
+    with _runs_lock:
+        active_runs[task_id] = run
+    _current_run.set(run)
+    return run
+
+
+def finish_run(run: TaskRun) -> None:
+    """Unregister a run once its task function has returned"""
+    if run._timer:
+        run._timer.cancel()
+    with _runs_lock:
+        if active_runs.get(run.task_id) is run:
+            del active_runs[run.task_id]
+    if _current_run.get() is run:
+        _current_run.set(None)
+
+
+def get_run(task_id: str) -> Optional[TaskRun]:
+    """Get the live run for a task, if it is running"""
+    return active_runs.get(task_id)
+
+
+def current_run() -> Optional[TaskRun]:
+    """Get the run executing in the calling thread, if any"""
+    return _current_run.get()
+
+
+def _child_pids(pid: int) -> List[int]:
+    """Return all descendants of pid by walking /proc"""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+            # The command name may contain spaces, so split after the closing paren
+            ppid = int(stat[stat.rindex(b")") + 2:].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    descendants = []
+    stack = [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            descendants.append(child)
+            stack.append(child)
+    return descendants
+
+
+def _signal_pid(pid: int, sig: signal.Signals) -> None:
+    """Signal a process, falling back to sudo for processes owned by root (e.g. sudo children)"""
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
+    except PermissionError:
+        try:
+            subprocess.run(
+                ["sudo", "-n", "kill", f"-{sig.name[3:]}", str(pid)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=5
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logger.error(f"Failed to send {sig.name} to pid {pid}: {str(e)}")
+
+
+def _signal_tree(pgid: int, pids: List[int], sig: signal.Signals) -> None:
+    try:
+        os.killpg(pgid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+    # Signal leaves first so parents like sudo don't respawn or relay late
+    for pid in reversed(pids):
+        if os.path.exists(f"/proc/{pid}"):
+            _signal_pid(pid, sig)
+
+
+def kill_process_tree(proc: subprocess.Popen, grace_period: float = KILL_GRACE_PERIOD) -> None:
+    """Terminate a process and all of its descendants.
+
+    Sends SIGTERM to the process group and every descendant, waits for the
+    grace period and then sends SIGKILL to anything still alive. Descendants
+    are collected up front because they are reparented once the leader exits.
+    """
+    if proc.poll() is not None:
+        return
+    logger.info(f"Terminating process tree of pid {proc.pid}")
+    pids = [proc.pid] + _child_pids(proc.pid)
+    _signal_tree(proc.pid, pids, signal.SIGTERM)
+    try:
+        proc.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        logger.warning(f"Process {proc.pid} did not exit after SIGTERM, sending SIGKILL")
+        pids += [pid for pid in _child_pids(proc.pid) if pid not in pids]
+    _signal_tree(proc.pid, pids[1:] if proc.poll() is not None else pids, signal.SIGKILL)
+
+
+def run_process(
+    cmd: List[str],
+    capture_output: bool = False,
+    text: bool = False,
+    check: bool = False,
+    env: Optional[Dict[str, str]] = None,
+    timeout: Optional[float] = None,
+    cancellable: bool = True,
+    **kwargs
+) -> subprocess.CompletedProcess:
+    """Drop-in replacement for subprocess.run that is cancellable.
+
+    The child is started in its own session and attached to the current task run
+    so that cancelling the run, or hitting the task timeout, kills the whole
+    process tree. Pass cancellable=False for cleanup commands that must still
+    run after a cancel (e.g. restarting stopped containers).
+
+    Raises:
+        TaskCancelledError: If the current run is cancelled or the timeout expires
+        subprocess.CalledProcessError: If check is True and the command fails
+    """
+    run = current_run() if cancellable else None
+    if run:
+        run.check_cancelled()
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+
+    proc = subprocess.Popen(cmd, text=text, env=env, start_new_session=True, **kwargs)
+    if run:
+        run.attach(proc)
+    try:
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(proc)
+            proc.communicate()
+            raise TaskCancelledError(run.task_id if run else cmd[0], f"timed out after {timeout:g}s")
+    finally:
+        if run:
+            run.detach(proc)
+
+    if run:
+        run.check_cancelled()
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
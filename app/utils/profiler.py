@@ -0,0 +1,166 @@
+"""Low-overhead sampling profiler for the running process.
+
+A background thread snapshots every thread's Python stack with
+sys._current_frames() at a fixed interval and counts identical stacks, so the
+profiled code runs unmodified (no tracing hooks) and the overhead depends only
+on the sampling rate. Results are exported as speedscope JSON
+(https://www.speedscope.app) or as collapsed stacks for flamegraph.pl/inferno.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_INTERVAL = 0.01
+MAX_DURATION = 300
+
+FORMAT_SPEEDSCOPE = "speedscope"
+FORMAT_COLLAPSED = "collapsed"
+
+# Leaf functions of threads that are just waiting (idle pool workers, event loop
+# polling); stacks ending in them are dropped unless include_idle is set
+IDLE_FUNCTIONS = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("handlers.py", "dequeue"),
+}
+
+_FrameKey = Tuple[str, str, int]
+
+
+def _frame_key(code) -> _FrameKey:
+    return code.co_name, code.co_filename, code.co_firstlineno
+
+
+class SamplingProfiler:
+    """Sample Python stacks on a background thread until stopped.
+
+    Args:
+        interval: Seconds between samples
+        thread_ids: Only sample these threads (default: all but the profiler's own)
+        include_idle: Keep samples of threads that are waiting for work
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_ids: Optional[Iterable[int]] = None, include_idle: bool = False):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.include_idle = include_idle
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._stacks: Counter = Counter()
+        self._thread_names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.duration = time.perf_counter() - self.started_at
+        return self
+
+    def __enter__(self) -> "SamplingProfiler":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample(own_id)
+
+    def _sample(self, own_id: int) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if not codes:
+                continue
+            leaf = codes[0]
+            if not self.include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FUNCTIONS:
+                continue
+            # Code objects are hashable and cheap to count; they are resolved to names on export
+            self._stacks[(thread_id, tuple(reversed(codes)))] += 1
+            if thread_id not in self._thread_names:
+                self._thread_names.update((thread.ident, thread.name) for thread in threading.enumerate())
+        self.samples += 1
+
+    def _thread_name(self, thread_id: int) -> str:
+        return self._thread_names.get(thread_id, f"thread-{thread_id}")
+
+    def to_collapsed(self) -> str:
+        """Collapsed stacks ("thread;outer;inner count" lines) for flamegraph tools"""
+        lines = []
+        for (thread_id, codes), count in self._stacks.most_common():
+            names = [self._thread_name(thread_id)]
+            names += [f"{name} ({os.path.basename(filename)}:{line})" for name, filename, line in map(_frame_key, codes)]
+            lines.append(f"{';'.join(names)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self, name: str = "medialab-manager") -> dict:
+        """Profile in speedscope's file format, with one sampled profile per thread"""
+        frames: List[dict] = []
+        frame_index: Dict[_FrameKey, int] = {}
+        profiles: Dict[int, dict] = {}
+        for (thread_id, codes), count in self._stacks.items():
+            stack = []
+            for code in codes:
+                key = _frame_key(code)
+                if key not in frame_index:
+                    frame_index[key] = len(frames)
+                    frames.append({"name": key[0], "file": key[1], "line": key[2]})
+                stack.append(frame_index[key])
+            profile = profiles.setdefault(thread_id, {
+                "type": "sampled",
+                "name": self._thread_name(thread_id),
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": [],
+                "weights": []
+            })
+            profile["samples"].append(stack)
+            profile["weights"].append(count * self.interval)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "medialab-manager",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": sorted(profiles.values(), key=lambda profile: -sum(profile["weights"]))
+        }
+
+    def export(self, format: str = FORMAT_SPEEDSCOPE, name: str = "medialab-manager") -> Tuple[bytes, str]:
+        """Serialise the profile
+
+        Returns:
+            Tuple[bytes, str]: Content and its MIME type
+
+        Raises:
+            ValueError: If the format is not speedscope or collapsed
+        """
+        if format == FORMAT_SPEEDSCOPE:
+            return json.dumps(self.to_speedscope(name)).encode("utf-8"), "application/json"
+        if format == FORMAT_COLLAPSED:
+            return self.to_collapsed().encode("utf-8"), "text/plain"
+        raise ValueError(f"Unsupported profile format: {format}")
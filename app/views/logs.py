@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Request, Query
 from fastapi.templating import Jinja2Templates
 from datetime import datetime
-from pathlib import Path
+from typing import Optional
 
 from app.core.settings import settings
+from app.core.log_store import get_log_store
+from app.core.logging_config import flush_log_store
+from app.utils.log_reader import read_logs
 
 def format_timestamp(timestamp_str: str) -> str:
     try:
@@ -18,55 +21,58 @@ router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 @router.get("/logs")
-async def view_logs(request: Request):
+def view_logs(
+    request: Request,
+    level: Optional[str] = Query(None, description="Only show entries with this level"),
+    since: Optional[str] = Query(None, description="Only show entries at or after this time"),
+    until: Optional[str] = Query(None, description="Only show entries at or before this time"),
+    q: Optional[str] = Query(None, description="Only show entries containing this text"),
+    logger: Optional[str] = Query(None, description="Only show entries from this logger (structured logging only)"),
+    task_id: Optional[str] = Query(None, description="Only show entries logged by this task (structured logging only)"),
+    before: Optional[str] = Query(None, description="Cursor of the page to continue from"),
+    limit: int = Query(1000, ge=1, le=5000)
+):
     # Get the log file path from settings
     log_file = settings.LOG_FILE
-    logs = []
     
     # Ensure the logs directory exists
     log_file.parent.mkdir(parents=True, exist_ok=True)
     
-    # Get all log files (main file and rotated backups)
-    log_files = [log_file]
-    for i in range(1, 6):  # Check for up to 5 backup files
-        backup_file = log_file.parent / f"{log_file.name}.{i}"
-        if backup_file.exists():
-            log_files.append(backup_file)
-    
-    # Read logs from all files
-    for log_file in log_files:
-        try:
-            with open(log_file, 'r') as f:
-                for line in f:
-                    try:
-                        # Parse log line (format: timestamp - name - level - message)
-                        parts = line.strip().split(' - ', 3)  # Split into max 4 parts
-                        if len(parts) == 4:
-                            timestamp = parts[0].strip()
-                            name = parts[1].strip()
-                            level = parts[2].strip()
-                            message = parts[3].strip()
-                            logs.append({
-                                'timestamp': format_timestamp(timestamp),
-                                'level': level,
-                                'message': message
-                            })
-                    except Exception as e:
-                        continue
-        except Exception as e:
-            continue
-    
-    # Sort logs by timestamp in reverse order (newest first)
-    logs.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    # Limit to last 1000 logs to prevent UI performance issues
-    logs = logs[:1000]
+    level = None if level == "ALL" else level
+    structured = settings.LOGGING.STRUCTURED
+    if structured:
+        # Query the indexed log store
+        flush_log_store()
+        page = get_log_store().query(
+            limit=limit, level=level, logger=logger, task_id=task_id,
+            since=since, until=until, search=q, before=before
+        )
+    else:
+        # Read the text log newest first, stopping once the page is full
+        page = read_logs(log_file, limit=limit, level=level, since=since, until=until, search=q, before=before)
+    logs = [
+        {
+            'timestamp': format_timestamp(entry.timestamp),
+            'level': entry.level,
+            'message': entry.message,
+            'logger': entry.name,
+            'task_id': entry.task_id,
+            'request_id': entry.request_id
+        }
+        for entry in page.entries
+    ]
     
     return templates.TemplateResponse(
         "pages/logs.html",
         {
             "request": request,
             "title": "System Logs",
-            "logs": logs
+            "logs": logs,
+            "filters": {
+                "level": level or "ALL", "since": since or "", "until": until or "", "q": q or "",
+                "logger": logger or "", "task_id": task_id or ""
+            },
+            "structured": structured,
+            "next_cursor": page.next_cursor
         }
-    ) 
\ No newline at end of file
+    ) 
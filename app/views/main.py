@@ -10,6 +10,7 @@ from app.views.logs import router as logs_router
 from app.api.managers.task_manager import TaskManager
 from app.schemas.event import EventFilter
 from app.api.managers.event_manager import EventManager
+from app.api.managers.disk_health_manager import DiskHealthManager
 
 router = APIRouter()
 router.include_router(logs_router)
@@ -69,13 +70,14 @@ async def media_data(request: Request):
     )
 
 @router.get("/disk-manager")
-async def disk_manager(request: Request):
-    """Disk manager page view"""
+async def disk_manager(request: Request, db: Session = Depends(get_db)):
+    """Disk manager page view, from the samples of the collect_disk_stats task only"""
     return templates.TemplateResponse(
         "pages/disk_manager.html",
         {
             "request": request,
-            "title": "Disk Manager"
+            "title": "Disk Manager",
+            "status": DiskHealthManager(db).status()
         }
     )
 
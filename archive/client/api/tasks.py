@@ -1,12 +1,84 @@
 from fastapi import APIRouter, HTTPException
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
+import asyncio
 import logging
 import json
-from managers.task_manager import TaskManager
+import os
+import httpx
+from managers.task_manager import TaskConfig, TaskManager, load_tasks, get_task_function
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Tasks started by the server that are still running, keyed by task_id
+running_tasks: Dict[str, asyncio.Task] = {}
+
+async def _notify_server(path: str, payload: Dict) -> None:
+    """Report task progress back to the server"""
+    server_url = os.getenv("SERVER_URL", "http://192.168.10.10:4800")
+    try:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.post(f"{server_url}{path}", json=payload)
+            response.raise_for_status()
+    except Exception as e:
+        logger.error(f"Failed to notify server at {path}: {str(e)}")
+
+async def _run_and_report(task_config: TaskConfig, task_func: Callable, parent_event_id: Optional[int] = None) -> None:
+    """Run a task and report its start and end to the server"""
+    await _notify_server(f"/api/tasks/{task_config.task_id}/start", {
+        "name": task_config.name,
+        "description": task_config.description,
+        "group": task_config.group
+    })
+    status = "success"
+    try:
+        await task_func(task_config)
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    except Exception as e:
+        status = "error"
+        logger.error(f"Error running task {task_config.task_id}: {str(e)}")
+    finally:
+        running_tasks.pop(task_config.task_id, None)
+        await _notify_server(f"/api/tasks/{task_config.task_id}/end", {
+            "status": status,
+            "host_url": os.getenv("HOST_URL"),
+            "parent_id": parent_event_id
+        })
+
+@router.post("/{task_id}/run", status_code=202)
+async def run_task_by_id(task_id: str, parent_event_id: Optional[int] = None) -> Dict:
+    """
+    Accept a run request from the server and execute the task in the background.
+    
+    The server only waits for this acknowledgement; progress is reported back
+    through the server's /start and /end task endpoints.
+    
+    Args:
+        task_id: The ID of the task as registered with the server
+        parent_event_id: Server event of a host-group fan-out, reported back on completion
+        
+    Returns:
+        Dict containing the status of the request
+    """
+    if task_id in running_tasks:
+        raise HTTPException(status_code=409, detail=f"Task '{task_id}' is already running")
+    
+    task_config = next((task for task in load_tasks() if task.task_id == task_id), None)
+    if not task_config:
+        raise HTTPException(status_code=404, detail=f"Task '{task_id}' not found in configuration")
+    
+    task_func = get_task_function(task_config.function_name)
+    if not task_func:
+        raise HTTPException(status_code=404, detail=f"Task function '{task_config.function_name}' not found")
+    
+    running_tasks[task_id] = asyncio.create_task(_run_and_report(task_config, task_func, parent_event_id))
+    return {
+        "status": "accepted",
+        "message": f"Task {task_id} accepted"
+    }
+
 @router.post("/run/{task_name}")
 async def run_task(task_name: str) -> Dict:
     """
@@ -9,10 +9,11 @@ from apscheduler.triggers.cron import CronTrigger
 import logging
 from contextlib import asynccontextmanager
 from api.health import router as health_router
-from api.tasks import router as tasks_router
+from api.tasks import router as tasks_router, running_tasks
 from tasks.backup_project_stacks import backup_project_stacks_task
 from managers.task_manager import TaskConfig, TaskManager, register_task, get_task_function, load_tasks
 from managers.event_manager import event_manager
+from managers.heartbeat_manager import HeartbeatManager
 import pytz
 import os
 
@@ -27,11 +28,16 @@ timezone = pytz.timezone('Europe/London')
 # Create scheduler with timezone configuration
 scheduler = AsyncIOScheduler(timezone=timezone)
 
+# Report liveness, load and running tasks to the server
+heartbeat_manager = HeartbeatManager(lambda: list(running_tasks.keys()))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await setup_scheduler()
     scheduler.start()
+    heartbeat_manager.start()
     yield
+    await heartbeat_manager.stop()
     scheduler.shutdown()
     await event_manager.close()
 
@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import os
+from typing import Callable, List, Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+AGENT_VERSION = "0.1.0"
+
+class HeartbeatManager:
+    """Periodically reports this agent's state to the server."""
+
+    def __init__(self, get_running_tasks: Callable[[], List[str]]):
+        self.server_url = os.getenv("SERVER_URL", "http://192.168.10.10:4800")
+        self.host_url = os.getenv("HOST_URL", "http://192.168.10.30:4810")
+        self.name = os.getenv("AGENT_NAME", self.host_url)
+        self.interval = float(os.getenv("HEARTBEAT_INTERVAL", "30"))
+        self.groups = [group.strip() for group in os.getenv("AGENT_GROUPS", "").split(",") if group.strip()]
+        self.get_running_tasks = get_running_tasks
+        self._task: Optional[asyncio.Task] = None
+
+    async def send_heartbeat(self, client: httpx.AsyncClient) -> None:
+        """Send a single heartbeat to the server"""
+        payload = {
+            "host_url": self.host_url,
+            "name": self.name,
+            "version": AGENT_VERSION,
+            "load": os.getloadavg()[0],
+            "running_tasks": self.get_running_tasks(),
+            "groups": self.groups
+        }
+        try:
+            response = await client.post(f"{self.server_url}/api/agents/heartbeat", json=payload)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Failed to send heartbeat: {str(e)}")
+
+    async def _run(self) -> None:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            while True:
+                await self.send_heartbeat(client)
+                await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
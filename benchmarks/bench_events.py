@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Benchmark event ingestion: one request per event vs. /api/events/batch.
+
+Runs the events router in-process against a throwaway SQLite database, so no
+server needs to be running:
+
+    python benchmarks/bench_events.py --events 10000
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.common import make_client
+
+
+def make_events(count: int) -> list:
+    return [
+        {
+            "type": "benchmark",
+            "sub_type": "ingest",
+            "status": "success",
+            "description": f"Benchmark event {i}",
+            "details": json.dumps({"index": i})
+        }
+        for i in range(count)
+    ]
+
+
+def timed(label: str, count: int, func) -> float:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count:>7} events  {elapsed:8.3f}s  {count / elapsed:>10.0f} events/s")
+    return elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000, help="Events per batch run")
+    parser.add_argument("--single", type=int, default=500, help="Events for the one-request-per-event baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = make_client(str(Path(tmp) / "bench.db"))
+        events = make_events(args.events)
+
+        def single():
+            for event in events[:args.single]:
+                response = client.post("/api/events/add_event", data=event)
+                response.raise_for_status()
+
+        def batch_json():
+            response = client.post("/api/events/batch", json=events)
+            response.raise_for_status()
+            assert response.json()["count"] == len(events)
+
+        def batch_ndjson():
+            def body():
+                for event in events:
+                    yield (json.dumps(event) + "\n").encode()
+            response = client.post(
+                "/api/events/batch",
+                content=body(),
+                headers={"Content-Type": "application/x-ndjson"}
+            )
+            response.raise_for_status()
+            assert response.json()["count"] == len(events)
+
+        single_elapsed = timed("add_event (one per request)", args.single, single)
+        json_elapsed = timed("batch (JSON array)", args.events, batch_json)
+        ndjson_elapsed = timed("batch (NDJSON stream)", args.events, batch_ndjson)
+
+        per_event = single_elapsed / args.single
+        print(f"\nBatch speedup vs one request per event: "
+              f"{per_event * args.events / json_elapsed:.0f}x (JSON), "
+              f"{per_event * args.events / ndjson_elapsed:.0f}x (NDJSON)")
+        if max(json_elapsed, ndjson_elapsed) >= 1.0:
+            print(f"WARNING: batch ingestion of {args.events} events took over a second")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
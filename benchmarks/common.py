@@ -0,0 +1,273 @@
+"""Shared helpers for the benchmark suite: datasets, timing and result files.
+
+Datasets are synthetic main.db files (events spread over a year, ~1% with a
+text attachment) generated once per size and cached in benchmarks/.data.
+Benchmarks point the app's session factory at a dataset with use_database(),
+so code that opens its own sessions (attachments, the task wrapper) reads
+the same file.
+"""
+
+import json
+import logging
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.database import MainBase, MainSessionLocal, get_db, setup_database
+from app.api.routers.event import router as event_router
+from app.api.routers.main_routes import router as main_routes_router
+import app.models.event  # noqa: F401  (register the events table)
+import app.models.task  # noqa: F401  (register the tasks table)
+import app.models.compression_dictionary  # noqa: F401
+import app.models.event_stats  # noqa: F401
+
+DATA_DIR = Path(__file__).resolve().parent / ".data"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+EVENT_TYPES = ["task", "system", "backup", "notification"]
+STATUSES = ["success", "success", "success", "error", "warning", "started"]
+TASK_IDS = [f"task_{i:02d}" for i in range(20)]
+ATTACHMENT_RATE = 0.01
+
+# The app logs every engine it creates; keep benchmark output readable
+logging.getLogger("app").setLevel(logging.WARNING)
+
+
+# Registry
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable
+    group: str
+    per_size: bool = True  # Run once per dataset size
+
+
+BENCHMARKS: List[Benchmark] = []
+
+
+def benchmark(name: str, group: str, per_size: bool = True):
+    """Register a benchmark function.
+
+    Per-size benchmarks are called as func(size_label, db_path) and others as
+    func(); either returns a dict of measurement name -> Timing.
+    """
+    def decorator(func):
+        BENCHMARKS.append(Benchmark(name=name, func=func, group=group, per_size=per_size))
+        return func
+    return decorator
+
+
+# Timing
+
+@dataclass
+class Timing:
+    """Seconds per operation over several repeats"""
+    samples: List[float] = field(default_factory=list)
+    operations: int = 1  # Operations per sample
+
+    def to_dict(self) -> Dict:
+        per_op = [sample / self.operations for sample in self.samples]
+        median = statistics.median(per_op)
+        return {
+            "median": median,
+            "min": min(per_op),
+            "max": max(per_op),
+            "stdev": statistics.stdev(per_op) if len(per_op) > 1 else 0.0,
+            "ops_per_sec": 1 / median if median else None,
+            "repeat": len(per_op),
+            "operations": self.operations
+        }
+
+
+def measure(func: Callable, repeat: int = 5, operations: int = 1, warmup: int = 1, setup: Callable = None) -> Timing:
+    """Time func() repeat times after warming up; func performs `operations` operations"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+    timing = Timing(operations=operations)
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timing.samples.append(time.perf_counter() - start)
+    return timing
+
+
+# Datasets
+
+def _log_text(rng: random.Random, lines: int) -> bytes:
+    return "".join(
+        f"2024-01-01 00:{i // 60 % 60:02d}:{i % 60:02d} INFO step {i}: processed {rng.randint(0, 10**6)} files\n"
+        for i in range(lines)
+    ).encode()
+
+
+def generate_events(count: int, seed: int = 0, batch_size: int = 10_000):
+    """Yield batches of synthetic event dicts for EventManager.add_events"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    span = timedelta(days=365).total_seconds()
+    batch = []
+    for i in range(count):
+        event_type = rng.choice(EVENT_TYPES)
+        sub_type = rng.choice(TASK_IDS) if event_type == "task" else f"{event_type}_check"
+        event = {
+            "type": event_type,
+            "sub_type": sub_type,
+            "status": rng.choice(STATUSES),
+            "description": f"{sub_type} run {i}",
+            "details": json.dumps({"run": i, "files": rng.randint(0, 10_000), "host": f"host{rng.randint(1, 5)}"}),
+            "timestamp": start + timedelta(seconds=span * i / count),
+        }
+        if rng.random() < ATTACHMENT_RATE:
+            event["attachment_data"] = _log_text(rng, 200)
+            event["attachment_mime_type"] = "text/plain"
+        batch.append(event)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def dataset_path(size_label: str) -> Path:
+    """Path of the cached dataset for a size, generating it on first use"""
+    from app.api.managers.event_manager import EventManager
+
+    path = DATA_DIR / f"events-{size_label}.db"
+    if path.exists():
+        return path
+
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.unlink(missing_ok=True)
+    count = SIZES[size_label]
+    print(f"Generating {count} events in {path}...", file=sys.stderr)
+    engine, SessionLocal, _ = setup_database(str(tmp_path))
+    MainBase.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        manager = EventManager(db)
+        manager.ensure_event_stats()
+        for batch in generate_events(count):
+            manager.add_events(batch, commit=False)
+        db.commit()
+    finally:
+        db.close()
+        engine.dispose()
+    tmp_path.rename(path)
+    return path
+
+
+def copy_dataset(size_label: str, name: str) -> Path:
+    """A scratch copy of a dataset, for benchmarks that write"""
+    source = dataset_path(size_label)
+    target = DATA_DIR / f"scratch-{name}-{size_label}.db"
+    shutil.copyfile(source, target)
+    return target
+
+
+def use_database(db_path: Path):
+    """Point the app's main session factory at a database file, set up as on startup"""
+    from app.api.managers.event_manager import EventManager
+
+    engine, _, _ = setup_database(str(db_path))
+    MainBase.metadata.create_all(bind=engine)
+    MainSessionLocal.configure(bind=engine)
+    with MainSessionLocal() as db:
+        EventManager(db).ensure_event_stats()
+    return engine
+
+
+def make_client(db_path: str) -> TestClient:
+    """In-process client for the events API against a database file"""
+    use_database(Path(db_path))
+
+    def override_get_db():
+        db = MainSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(main_routes_router)
+    app.include_router(event_router, prefix="/api/events")
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+# Results
+
+def git_revision() -> Dict:
+    def git(*args) -> str:
+        try:
+            return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def write_results(results: Dict[str, Dict], output: Optional[Path] = None) -> Path:
+    revision = git_revision()
+    if output is None:
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        output = RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{revision['commit'][:8] or 'nogit'}.json"
+    document = {
+        **revision,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+    output.write_text(json.dumps(document, indent=2, sort_keys=True))
+    return output
+
+
+def compare_results(baseline_path: Path, current_path: Path, threshold: float = 0.1) -> int:
+    """Print median changes between two result files; returns the number of regressions"""
+    baseline = json.loads(baseline_path.read_text())["results"]
+    current = json.loads(current_path.read_text())["results"]
+    regressions = 0
+    print(f"{'benchmark':<60} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(set(baseline) | set(current)):
+        if name not in baseline or name not in current:
+            state = "new" if name in current else "removed"
+            print(f"{name:<60} {state:>34}")
+            continue
+        before, after = baseline[name]["median"], current[name]["median"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -threshold:
+            flag = "  faster"
+        print(f"{name:<60} {format_seconds(before):>12} {format_seconds(after):>12} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
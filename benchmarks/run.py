@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Run the benchmark suite and save the results as JSON.
+
+Datasets of synthetic events are generated on first use and cached in
+benchmarks/.data; the 1M-event dataset takes a few minutes to build, so it is
+only used when asked for:
+
+    python benchmarks/run.py                        # 10k and 100k events
+    python benchmarks/run.py --sizes 10k,100k,1m --only events
+    python benchmarks/run.py --compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.common import BENCHMARKS, SIZES, compare_results, dataset_path, format_seconds, write_results
+import benchmarks.suite_events  # noqa: F401  (register benchmarks)
+import benchmarks.suite_logs  # noqa: F401
+import benchmarks.suite_media  # noqa: F401
+import benchmarks.suite_startup  # noqa: F401
+import benchmarks.suite_tasks  # noqa: F401
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10k,100k", help=f"Comma-separated dataset sizes ({', '.join(SIZES)})")
+    parser.add_argument("--only", help="Comma-separated benchmark names or groups to run")
+    parser.add_argument("--output", type=Path, help="Results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BASELINE", "CURRENT"), help="Compare two results files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Median slowdown reported as a regression by --compare")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare_results(*args.compare, threshold=args.threshold)
+        return 1 if regressions else 0
+
+    sizes = [size.strip().lower() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"Unknown sizes: {', '.join(unknown)}")
+    selected = set(args.only.split(",")) if args.only else None
+    benchmarks = [b for b in BENCHMARKS if selected is None or b.name in selected or b.group in selected]
+
+    results = {}
+
+    def record(prefix, timings):
+        for name, timing in timings.items():
+            key = f"{prefix}.{name}"
+            results[key] = timing.to_dict()
+            print(f"{key:<60} {format_seconds(results[key]['median']):>10}/op")
+
+    for bench in benchmarks:
+        if not bench.per_size:
+            record(f"{bench.group}.{bench.name}", bench.func())
+            continue
+        for size in sizes:
+            record(f"{bench.group}.{bench.name}[{size}]", bench.func(size, dataset_path(size)))
+
+    output = write_results(results, args.output)
+    print(f"\nResults written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
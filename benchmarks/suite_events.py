@@ -0,0 +1,120 @@
+"""Event benchmarks: ingest, list_events filters, /api/events/ paging and attachments"""
+
+import json
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app.api.managers.event_manager import EventManager
+from app.core.database import MainSessionLocal
+from app.models.event import Event
+from app.schemas.event import EventFilter
+from app.utils.attachment_utils import iter_attachment, tail_attachment
+from app.utils.file_utils import AttachDataMimeType
+
+from benchmarks.common import benchmark, copy_dataset, generate_events, make_client, measure, use_database
+
+LIST_FILTERS = {
+    "none": EventFilter(),
+    "type": EventFilter(type="task"),
+    "sub_type": EventFilter(sub_type="task_07"),
+    "status": EventFilter(status="error"),
+    "description": EventFilter(description="run 12345"),
+    "date_range": EventFilter(start_date=datetime(2024, 6, 1), end_date=datetime(2024, 6, 8)),
+    "has_attachment": EventFilter(has_attachment=True),
+    "parent_id": EventFilter(parent_id=1),
+}
+
+
+@benchmark("ingest", group="events")
+def bench_ingest(size_label, db_path):
+    """Inserts into a scratch copy, so the dataset's indexes are already populated"""
+    scratch = copy_dataset(size_label, "ingest")
+    use_database(scratch)
+    batch = next(generate_events(1000, seed=1))
+    db = MainSessionLocal()
+    try:
+        manager = EventManager(db)
+
+        def add_event():
+            for i in range(100):
+                manager.add_event_with_output(
+                    type="benchmark",
+                    sub_type="ingest",
+                    status="success",
+                    description=f"Benchmark event {i}",
+                    details=json.dumps({"index": i})
+                )
+
+        def add_event_with_attachment():
+            for i in range(20):
+                manager.add_event_with_output(
+                    type="benchmark",
+                    sub_type="ingest",
+                    status="success",
+                    description=f"Benchmark event {i}",
+                    details=json.dumps({"index": i}),
+                    attachment_data=b"line of task output\n" * 2000,
+                    attachment_mime_type=AttachDataMimeType.TEXT
+                )
+
+        return {
+            "add_event": measure(add_event, operations=100),
+            "add_event_with_attachment": measure(add_event_with_attachment, operations=20),
+            "add_events_batch_1000": measure(lambda: manager.add_events(batch), operations=len(batch)),
+        }
+    finally:
+        db.close()
+        scratch.unlink(missing_ok=True)
+
+
+@benchmark("list_events", group="events")
+def bench_list_events(size_label, db_path):
+    use_database(db_path)
+    db = MainSessionLocal()
+    try:
+        manager = EventManager(db)
+        return {
+            f"filter_{name}": measure(lambda event_filter=event_filter: manager.list_events(event_filter, 0, 100))
+            for name, event_filter in LIST_FILTERS.items()
+        }
+    finally:
+        db.close()
+
+
+@benchmark("api_events_paging", group="events")
+def bench_api_paging(size_label, db_path):
+    """GET /api/events/ at the first, middle and last page, as the infinite scroll does"""
+    client = make_client(str(db_path))
+    with MainSessionLocal() as db:
+        last_page = max(1, db.scalar(select(func.count(Event.id))) // 100)
+
+    def get_page(page, **params):
+        response = client.get("/api/events/", params={"page": page, **params})
+        response.raise_for_status()
+
+    return {
+        "page_first": measure(lambda: get_page(1)),
+        "page_middle": measure(lambda: get_page(last_page // 2)),
+        "page_last": measure(lambda: get_page(last_page)),
+        "page_middle_type_filter": measure(lambda: get_page(last_page // 8, type="task")),
+    }
+
+
+@benchmark("attachments", group="events")
+def bench_attachments(size_label, db_path):
+    client = make_client(str(db_path))
+    with MainSessionLocal() as db:
+        event_id = db.scalar(select(Event.id).where(Event.has_attachment.is_(True)).order_by(Event.id.desc()).limit(1))
+
+    def fetch(**kwargs):
+        response = client.get(f"/api/events/{event_id}/attachment", **kwargs)
+        response.raise_for_status()
+
+    return {
+        "api_full": measure(lambda: fetch(), repeat=10),
+        "api_tail_50": measure(lambda: fetch(params={"tail": 50}), repeat=10),
+        "api_range_4k": measure(lambda: fetch(headers={"Range": "bytes=0-4095"}), repeat=10),
+        "iter_attachment": measure(lambda: b"".join(iter_attachment(event_id)), repeat=10),
+        "tail_attachment_50": measure(lambda: tail_attachment(event_id, None, 50), repeat=10),
+    }
@@ -0,0 +1,66 @@
+"""Log viewing benchmarks: read_logs (the data path of /logs) over ~60MB of rotated logs"""
+
+import random
+import shutil
+from datetime import datetime, timedelta
+
+from app.utils.log_reader import _index_cache, _index_dir, read_logs
+
+from benchmarks.common import DATA_DIR, benchmark, measure
+
+LOG_DIR = DATA_DIR / "logs"
+LOG_FILE = LOG_DIR / "medialab-manager.log"
+FILE_SIZE = 10 * 1024 * 1024
+BACKUP_COUNT = 5  # Active file plus five backups, as with the default LOGGING settings
+
+LOGGERS = ["app.scheduler", "app.api.routers.event", "app.tasks.restic_backup", "app.core.database", "uvicorn.access"]
+LEVELS = ["INFO"] * 90 + ["DEBUG"] * 6 + ["WARNING"] * 3 + ["ERROR"]
+
+
+def _generate_logs() -> datetime:
+    """Write the active log and its backups, oldest first; returns the newest entry's time"""
+    rng = random.Random(0)
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    moment = datetime(2024, 1, 1)
+    for index in range(BACKUP_COUNT, -1, -1):
+        path = LOG_FILE if index == 0 else LOG_FILE.with_name(f"{LOG_FILE.name}.{index}")
+        written = 0
+        with open(path, "w", encoding="utf-8") as f:
+            while written < FILE_SIZE:
+                moment += timedelta(milliseconds=rng.randint(1, 2000))
+                level = rng.choice(LEVELS)
+                line = f"{moment:%Y-%m-%d %H:%M:%S},{moment.microsecond // 1000:03d} - {rng.choice(LOGGERS)} - {level} - request {rng.randint(0, 10**9)} handled in {rng.random():.3f}s\n"
+                if level == "ERROR":
+                    line += "Traceback (most recent call last):\n  File \"app/scheduler.py\", line 200, in run_wrapped\nValueError: benchmark\n"
+                f.write(line)
+                written += len(line)
+    return moment
+
+
+@benchmark("read_logs", group="logs", per_size=False)
+def bench_read_logs():
+    if LOG_DIR.exists():
+        shutil.rmtree(LOG_DIR)
+    newest = _generate_logs()
+    day = newest - timedelta(days=5)
+
+    def cold_index():
+        _index_cache.clear()
+        shutil.rmtree(_index_dir(LOG_FILE), ignore_errors=True)
+
+    def deep_paging():
+        cursor = None
+        for _ in range(10):
+            page = read_logs(LOG_FILE, limit=1000, before=cursor)
+            cursor = page.next_cursor
+
+    # Builds the backups' indexes, so the filtered runs below measure warm reads
+    results = {"level_error_cold_index": measure(lambda: read_logs(LOG_FILE, level="ERROR"), repeat=3, warmup=0, setup=cold_index)}
+    results.update({
+        "first_page": measure(lambda: read_logs(LOG_FILE)),
+        "deep_paging_10_pages": measure(deep_paging, repeat=3, operations=10),
+        "level_error": measure(lambda: read_logs(LOG_FILE, level="ERROR")),
+        "time_range_1h": measure(lambda: read_logs(LOG_FILE, since=day, until=day + timedelta(hours=1))),
+        "search": measure(lambda: read_logs(LOG_FILE, search="handled in 0.999"), repeat=3),
+    })
+    return results
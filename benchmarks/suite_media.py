@@ -0,0 +1,217 @@
+"""Media scanner, library query and bulk load benchmarks over a synthetic 100k-file library"""
+
+import json
+from collections import Counter
+
+from sqlalchemy import delete
+
+from app.api.managers.media_scan_manager import MediaScanManager
+from app.api.managers.media_summary_manager import MediaSummaryManager
+from app.core.database import MediaBase, MediaDBManager, setup_database
+from app.utils.media_utils import get_libraries
+from app.models.media import (
+    CacheStatus, MediaFileType, MediaSourceFile, MediaSourceItem, MediaTitle, MediaType, PendingStatus, QualityLevel
+)
+
+from benchmarks.common import DATA_DIR, benchmark, measure
+
+MEDIA_ROOT = DATA_DIR / "media"
+MEDIA_DATA = {
+    "storage": {"media": {"path": str(MEDIA_ROOT), "type": "source"}},
+    "libraries": {
+        "tv": {"storage": "media", "id": "tv-hd", "quality": "hd", "type": "tv"},
+        "movies": {"storage": "media", "id": "movies", "quality": "fhd", "type": "movie"},
+    }
+}
+SHOWS, SEASONS, EPISODES = 400, 5, 10
+MOVIES = 5000
+
+
+def _touch(path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+
+
+def media_tree():
+    """100k files: 400 shows x 5 seasons x 10 episodes and 5000 movies, four files each"""
+    marker = MEDIA_ROOT / ".complete"
+    if marker.exists():
+        return MEDIA_ROOT
+    for show in range(SHOWS):
+        show_dir = MEDIA_ROOT / "tv-hd" / f"Show {show:03d} (20{show % 25:02d})"
+        for season in range(1, SEASONS + 1):
+            season_dir = show_dir / f"Season {season:02d}"
+            for episode in range(1, EPISODES + 1):
+                stem = f"Show.{show:03d}.S{season:02d}E{episode:02d}.{'1080p' if show % 3 else '720p'}.WEB-DL"
+                for suffix in (".mkv", ".en.srt", ".nfo", "-thumb.jpg"):
+                    _touch(season_dir / f"{stem}{suffix}")
+    for movie in range(MOVIES):
+        movie_dir = MEDIA_ROOT / "movies" / f"Movie {movie:04d} ({1950 + movie % 70})"
+        stem = f"Movie {movie:04d} ({1950 + movie % 70}) {'2160p' if movie % 4 == 0 else '1080p'}"
+        for name in (f"{stem}.mkv", f"{stem}.en.srt", "movie.nfo", "poster.jpg"):
+            _touch(movie_dir / name)
+    marker.touch()
+    return MEDIA_ROOT
+
+
+@benchmark("media_scan", group="media", per_size=False)
+def bench_media_scan():
+    media_tree()
+    db_path = DATA_DIR / "scratch-media.db"
+    state = {}
+
+    def fresh_database():
+        if "engine" in state:
+            state["engine"].dispose()
+        db_path.unlink(missing_ok=True)
+        engine, SessionLocal, _ = setup_database(str(db_path))
+        MediaBase.metadata.create_all(bind=engine)
+        state.update(engine=engine, db=SessionLocal())
+
+    def scan(full=False):
+        return MediaScanManager(state["db"]).scan(MEDIA_DATA, full=full)
+
+    def walk(workers_per_disk):
+        libraries = get_libraries(MEDIA_DATA)
+        group_ids = {str(library.storage_path): 0 for library in libraries}
+        return MediaScanManager(None)._walk(libraries, group_ids, {}, workers_per_disk)
+
+    try:
+        results = {
+            "walk_1_worker": measure(lambda: walk(1), repeat=3),
+            "walk_4_workers": measure(lambda: walk(4), repeat=3),
+            "full_scan_empty_db": measure(scan, repeat=3, setup=fresh_database),
+        }
+        fresh_database()
+        scan()
+        results["rescan_unchanged"] = measure(scan, repeat=5)
+        results["full_rescan_unchanged"] = measure(lambda: scan(full=True), repeat=3)
+        return results
+    finally:
+        state["db"].close()
+        state["engine"].dispose()
+        db_path.unlink(missing_ok=True)
+
+
+def _titles_orm(db):
+    """The listing built by walking title -> items -> files relationships, one lazy load per title and item"""
+    titles = []
+    for title in db.query(MediaTitle).order_by(MediaTitle.title).all():
+        items = title.media_source_items
+        files = [file for item in items for file in item.source_files]
+        cached = sum(1 for item in items if item.cache_status != CacheStatus.NONE)
+        titles.append({
+            "id": title.id,
+            "title": title.title,
+            "items": len(items),
+            "seasons": len({item.season for item in items if item.season is not None}),
+            "files": len(files),
+            "size_bytes": sum(json.loads(file.file_attributes)["size"] for file in files),
+            "qualities": dict(Counter(item.quality.name for item in items)),
+            "cached_items": cached
+        })
+    return titles
+
+
+@benchmark("media_titles", group="media", per_size=False)
+def bench_media_titles():
+    """Listing all 5400 titles with per-quality counts and cache state, from the summary table and by the ORM"""
+    media_tree()
+    db_path = DATA_DIR / "scratch-media-titles.db"
+    db_path.unlink(missing_ok=True)
+    engine, SessionLocal, _ = setup_database(str(db_path))
+    MediaBase.metadata.create_all(bind=engine)
+    db = SessionLocal()
+
+    def orm_walk():
+        db.expire_all()  # Every run loads the relationships again, as a fresh request would
+        return _titles_orm(db)
+
+    try:
+        MediaScanManager(db).scan(MEDIA_DATA)
+        manager = MediaSummaryManager(db)
+        return {
+            "orm_relationship_walk": measure(orm_walk, repeat=3),
+            "summary_all_titles": measure(lambda: manager.titles(limit=10000), repeat=10),
+            "summary_page_of_100": measure(lambda: manager.titles(offset=2000, limit=100), repeat=20),
+            "summary_filtered": measure(lambda: manager.titles(quality=QualityLevel.UHD, search="Movie 1"), repeat=20),
+            "summary_refresh_all": measure(lambda: (manager.refresh(), db.rollback()), repeat=3),
+        }
+    finally:
+        db.close()
+        engine.dispose()
+        db_path.unlink(missing_ok=True)
+
+
+BULK_TITLES, BULK_EPISODES = 5000, 5
+BULK_SUFFIXES = (".mkv", ".en.srt", ".nfo", "-thumb.jpg")
+
+
+def _bulk_files():
+    """100k source file rows, each naming its item by (title, episode) for bulk_insert to resolve"""
+    for title in range(BULK_TITLES):
+        for episode in range(1, BULK_EPISODES + 1):
+            for suffix in BULK_SUFFIXES:
+                yield {
+                    "item_key": (f"Show {title:04d}", episode),
+                    "relative_title_path": f"tv-hd/Show {title:04d}/Season 01/Show.{title:04d}.S01E{episode:02d}{suffix}",
+                    "file_type": MediaFileType.VIDEO if suffix == ".mkv" else MediaFileType.OTHER,
+                    "file_attributes": '{"size":1048576,"mtime":1700000000}',
+                    "cache_status": CacheStatus.NONE
+                }
+
+
+@benchmark("media_bulk_insert", group="media", per_size=False)
+def bench_media_bulk_insert():
+    """Loading 100k source files, per row: MediaDBManager.create against bulk_insert, appending and reloading"""
+    db_path = DATA_DIR / "scratch-media-bulk.db"
+    db_path.unlink(missing_ok=True)
+    engine, SessionLocal, _ = setup_database(str(db_path))
+    MediaBase.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    files = MediaDBManager(MediaSourceFile, db)
+    rows = BULK_TITLES * BULK_EPISODES * len(BULK_SUFFIXES)
+
+    def create_rows(count):
+        for row in _bulk_files():
+            if count == 0:
+                return
+            row["media_source_item_id"] = item_ids[row.pop("item_key")]
+            files.create(**row)
+            count -= 1
+
+    def empty_files():
+        db.execute(delete(MediaSourceFile))
+        db.commit()
+
+    try:
+        titles = MediaDBManager(MediaTitle, db)
+        titles.bulk_insert({"title": f"Show {title:04d}", "media_type": MediaType.TV_SHOW} for title in range(BULK_TITLES))
+        title_ids = titles.key_map("title")
+        MediaDBManager(MediaSourceItem, db).bulk_insert(
+            (
+                {
+                    "title": f"Show {title:04d}", "quality": QualityLevel.FHD, "season": 1, "episode": episode,
+                    "cache_status": CacheStatus.NONE, "pending": PendingStatus.NONE
+                }
+                for title in range(BULK_TITLES) for episode in range(1, BULK_EPISODES + 1)
+            ),
+            resolve={"media_title_id": ("title", title_ids)}
+        )
+        names = {title_id: title for title, title_id in title_ids.items()}
+        item_ids = {
+            (names[title_id], episode): item_id
+            for (title_id, episode), item_id in MediaDBManager(MediaSourceItem, db).key_map("media_title_id", "episode").items()
+        }
+        resolve = {"media_source_item_id": ("item_key", item_ids)}
+        return {
+            "create_per_row": measure(lambda: create_rows(1000), repeat=3, operations=1000, setup=empty_files),
+            "bulk_insert": measure(
+                lambda: files.bulk_insert(_bulk_files(), resolve=resolve), repeat=3, operations=rows, setup=empty_files
+            ),
+            "bulk_reload": measure(lambda: files.bulk_insert(_bulk_files(), resolve=resolve, replace=True), repeat=3, operations=rows),
+        }
+    finally:
+        db.close()
+        engine.dispose()
+        db_path.unlink(missing_ok=True)
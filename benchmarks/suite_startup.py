@@ -0,0 +1,46 @@
+"""Startup benchmarks: `import app.main` and time to the first request, each in a fresh interpreter"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.common import ROOT, Timing, benchmark
+
+# Runs in the child process; prints the timings as JSON on the last line
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    client.get("/api/events/").raise_for_status()
+    first_request = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_request": first_request - start}))
+"""
+
+
+@benchmark("startup", group="startup", per_size=False)
+def bench_startup(repeat: int = 5):
+    """Each run gets its own working directory and HOME, so it starts against new databases
+
+    The app resolves app/static and config.json relative to the working
+    directory, so it links to the checkout's app package and copies config.json.
+    """
+    timings = {"import_app_main": Timing(), "time_to_first_request": Timing()}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            shutil.copy(ROOT / "config.json", Path(tmp) / "config.json")
+            os.symlink(ROOT / "app", Path(tmp) / "app")
+            env = {**os.environ, "HOME": tmp}
+            result = subprocess.run(
+                [sys.executable, "-c", CHILD], cwd=tmp, env=env, capture_output=True, text=True, check=True
+            )
+            child = json.loads(result.stdout.strip().splitlines()[-1])
+            timings["import_app_main"].samples.append(child["import"])
+            timings["time_to_first_request"].samples.append(child["first_request"])
+    return timings
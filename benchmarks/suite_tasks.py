@@ -0,0 +1,45 @@
+"""Task dispatch benchmarks: the overhead task_wrapper adds around a task function"""
+
+from app.core.database import MainSessionLocal
+from app.models.task import Task
+from app.scheduler import task_wrapper
+
+from benchmarks.common import benchmark, copy_dataset, measure, use_database
+
+TASK_ID = "benchmark_noop"
+
+
+def _noop():
+    return None
+
+
+@benchmark("task_wrapper", group="tasks")
+def bench_task_wrapper(size_label, db_path):
+    """A no-op task run through task_wrapper: enabled check, start/end events and task status updates.
+
+    Runs against a scratch copy of the dataset since each run inserts two events.
+    """
+    scratch = copy_dataset(size_label, "tasks")
+    use_database(scratch)
+    with MainSessionLocal() as db:
+        db.add(Task(task_id=TASK_ID, name=TASK_ID, enabled=True, task_type="manual", function_name="noop"))
+        db.add(Task(task_id=f"{TASK_ID}_disabled", name=TASK_ID, enabled=False, task_type="manual", function_name="noop"))
+        db.commit()
+
+    enabled = task_wrapper(TASK_ID, _noop)
+    disabled = task_wrapper(f"{TASK_ID}_disabled", _noop)
+
+    def run(wrapped, task_id, count):
+        def runs():
+            for _ in range(count):
+                wrapped(task_id)
+        return runs
+
+    try:
+        return {
+            "noop_direct": measure(run(lambda task_id: _noop(), TASK_ID, 1000), operations=1000),
+            "wrapped_enabled": measure(run(enabled, TASK_ID, 50), operations=50),
+            "wrapped_disabled": measure(run(disabled, f"{TASK_ID}_disabled", 200), operations=200),
+        }
+    finally:
+        scratch.unlink(missing_ok=True)